@@ -8,9 +8,10 @@ Converted to Python by Zydrunas Gimbutas (2026),
 with assistance from Claude Code / Claude Opus 4.6 (Anthropic).
 """
 
+import functools
+import sys
 from enum import IntEnum
-from dataclasses import dataclass, field
-from typing import Optional
+from typing import NamedTuple, Optional
 
 
 # ---------------------------------------------------------------------------
@@ -38,6 +39,7 @@ class VT(IntEnum):
     r_cscalar = 17
     r_zscalar = 18
     const     = 19
+    sparse    = 20
 
 
 # ---------------------------------------------------------------------------
@@ -67,45 +69,71 @@ def nullable_return(f):
 
 
 # ---------------------------------------------------------------------------
-# AST node dataclasses
+# AST nodes
 # ---------------------------------------------------------------------------
+# Large interfaces hold tens of thousands of these, so they use __slots__
+# rather than per-instance dicts.  Qualifiers never change after parsing
+# and are tuples; the typechecker annotates Expr, Var and Func in place.
 
-@dataclass
-class Expr:
-    value: str
-    input_label: int = -1
+class _Node:
+    __slots__ = ()
 
+    def __repr__(self):
+        fields = ", ".join(f"{k}={getattr(self, k)!r}" for k in self.__slots__)
+        return f"{type(self).__name__}({fields})"
 
-@dataclass
-class TypeQual:
+
+class Expr(_Node):
+    __slots__ = ("value", "input_label")
+
+    def __init__(self, value: str, input_label: int = -1):
+        self.value = value
+        self.input_label = input_label
+
+
+class TypeQual(NamedTuple):
     qual: str          # '*', '&', 'a' (array), 'r' (array ref)
-    args: list = field(default_factory=list)  # list[Expr]
-
-
-@dataclass
-class Var:
-    devicespec: str    # 'c' (cpu) or 'g' (gpu)
-    iospec: str        # 'i','o','b'
-    basetype: str
-    qual: Optional[TypeQual]
-    name: str
-    tinfo: int = VT.unk
-    input_label: int = -1
-    output_label: int = -1
-
-
-@dataclass
-class Func:
-    thisv: Optional[str]
-    classv: Optional[str]
-    funcv: str
-    fname: str
-    line: int
-    fort: bool = False
-    id: int = -1
-    args: list = field(default_factory=list)  # list[Var]
-    ret: list = field(default_factory=list)   # list[Var] (0 or 1 elements)
-    same: list = field(default_factory=list)  # list[Func] — duplicate signatures
+    args: tuple = ()   # sequence of Expr
+
+
+class Var(_Node):
+    __slots__ = ("devicespec", "iospec", "basetype", "qual", "name",
+                 "tinfo", "input_label", "output_label")
+
+    def __init__(self, devicespec: str, iospec: str, basetype: str,
+                 qual: Optional[TypeQual], name: str, tinfo: int = VT.unk,
+                 input_label: int = -1, output_label: int = -1):
+        self.devicespec = devicespec    # 'c' (cpu) or 'g' (gpu)
+        self.iospec = iospec            # 'i','o','b'
+        self.basetype = basetype
+        self.qual = qual
+        self.name = name
+        self.tinfo = tinfo
+        self.input_label = input_label
+        self.output_label = output_label
+
+
+class Func(_Node):
+    __slots__ = ("thisv", "classv", "funcv", "fname", "line", "fort",
+                 "vectorize", "hot", "id", "args", "ret", "same", "sig")
+
+    def __init__(self, thisv: Optional[str], classv: Optional[str],
+                 funcv: str, fname: str, line: int, fort: bool = False,
+                 vectorize: bool = False, id: int = -1, args=None, ret=None,
+                 same=None, hot: bool = False):
+        self.thisv = thisv
+        self.classv = classv
+        self.funcv = funcv
+        self.fname = fname
+        self.line = line
+        self.fort = fort
+        self.vectorize = vectorize
+        self.hot = hot                              # keep arena blocks (-arena)
+        self.id = id
+        self.args = [] if args is None else args    # list[Var]
+        self.ret = [] if ret is None else ret       # list[Var] (0 or 1)
+        self.same = [] if same is None else same    # list[Func], duplicates
+        self.sig = None                             # id_string, once known
 
 
 # ---------------------------------------------------------------------------
@@ -120,6 +148,17 @@ class MwrapContext:
         self.mw_use_c99_complex = False
         self.mw_use_cpp_complex = False
         self.mw_promote_int = 0
+        self.mw_hash_dispatch = False
+        self.mw_zero_copy = False
+        self.mw_in_place = False
+        self.mw_timing = False
+        self.mw_split = 0
+        self.mw_bin_handles = False
+        self.mw_registry = False
+        self.mw_int_dims = False
+        self.mw_nd_arrays = False
+        self.mw_arena = False
+        self.mw_threads = False
 
         # Type registries
         self.scalar_decls = set()
@@ -164,46 +203,61 @@ class MwrapContext:
 # Functions that need context
 # ---------------------------------------------------------------------------
 
+# Integer types renamed at each -i level, and the mw_use_* flags that a
+# declaration of each type sets (they select the converters in the C file)
+_PROMOTED_INTS = {
+    1: {"int": "long", "uint": "ulong"},
+    2: {"int": "long", "long": "long", "uint": "ulong", "ulong": "ulong"},
+    3: {"int": "int32_t", "long": "int32_t",
+        "uint": "uint64_t", "ulong": "uint64_t"},
+    4: {"int": "int64_t", "long": "int64_t",
+        "uint": "uint64_t", "ulong": "uint64_t"},
+}
+_INT_USES = {
+    "int32_t": "mw_use_int32_t", "int64_t": "mw_use_int64_t",
+    "uint32_t": "mw_use_uint32_t", "uint64_t": "mw_use_uint64_t",
+    "ulong": "mw_use_ulong", "uint": "mw_use_uint",
+    "ushort": "mw_use_ushort", "uchar": "mw_use_uchar",
+}
+_PROMOTED_INT_USES = {
+    1: {"uint": "mw_use_ulong"},
+    2: {"uint": "mw_use_ulong", "ulong": "mw_use_ulong"},
+    3: {"int": "mw_use_int32_t", "long": "mw_use_int64_t",
+        "uint": "mw_use_uint32_t", "ulong": "mw_use_uint64_t"},
+    4: {"int": "mw_use_int64_t", "long": "mw_use_int64_t",
+        "uint": "mw_use_uint64_t", "ulong": "mw_use_uint64_t"},
+}
+
+
+@functools.lru_cache(maxsize=None)
+def promoted_int(level: int, name: str) -> str:
+    """The type *name* is declared as at promotion level *level*."""
+    return _PROMOTED_INTS.get(level, {}).get(name, name)
+
+
+@functools.lru_cache(maxsize=None)
+def int_uses(level: int, name: str) -> tuple:
+    """The mw_use_* flags that a declaration of *name* sets at *level*."""
+    uses = (_INT_USES.get(name), _PROMOTED_INT_USES.get(level, {}).get(name))
+    return tuple(u for u in uses if u)
+
+
+def note_int_use(ctx, name: str):
+    for flag in int_uses(ctx.mw_promote_int, name):
+        setattr(ctx, flag, 1)
+
+
 def promote_int(ctx, name: str) -> str:
-    if name == "int32_t":  ctx.mw_use_int32_t = 1
-    if name == "int64_t":  ctx.mw_use_int64_t = 1
-    if name == "uint32_t": ctx.mw_use_uint32_t = 1
-    if name == "uint64_t": ctx.mw_use_uint64_t = 1
-    if name == "ulong":    ctx.mw_use_ulong = 1
-    if name == "uint":     ctx.mw_use_uint = 1
-    if name == "ushort":   ctx.mw_use_ushort = 1
-    if name == "uchar":    ctx.mw_use_uchar = 1
-
-    if ctx.mw_promote_int == 1:
-        if name == "uint":  ctx.mw_use_ulong = 1
-        if name == "int":   return "long"
-        if name == "uint":  return "ulong"
-    elif ctx.mw_promote_int == 2:
-        if name == "uint":  ctx.mw_use_ulong = 1
-        if name == "ulong": ctx.mw_use_ulong = 1
-        if name == "int":   return "long"
-        if name == "long":  return "long"
-        if name == "uint":  return "ulong"
-        if name == "ulong": return "ulong"
-    elif ctx.mw_promote_int == 3:
-        if name == "int":   ctx.mw_use_int32_t = 1
-        if name == "long":  ctx.mw_use_int64_t = 1
-        if name == "uint":  ctx.mw_use_uint32_t = 1
-        if name == "ulong": ctx.mw_use_uint64_t = 1
-        if name == "int":   return "int32_t"
-        if name == "long":  return "int32_t"
-        if name == "uint":  return "uint64_t"
-        if name == "ulong": return "uint64_t"
-    elif ctx.mw_promote_int == 4:
-        if name == "int":   ctx.mw_use_int64_t = 1
-        if name == "long":  ctx.mw_use_int64_t = 1
-        if name == "uint":  ctx.mw_use_uint64_t = 1
-        if name == "ulong": ctx.mw_use_uint64_t = 1
-        if name == "int":   return "int64_t"
-        if name == "long":  return "int64_t"
-        if name == "uint":  return "uint64_t"
-        if name == "ulong": return "uint64_t"
-    return name
+    """Promote *name* per ctx.mw_promote_int and record its use."""
+    note_int_use(ctx, name)
+    return promoted_int(ctx.mw_promote_int, name)
+
+
+def note_int_uses(ctx, f):
+    """Record the integer types that the signature of *f* names."""
+    level = ctx.mw_promote_int
+    for v in f.ret + f.args:
+        note_int_use(ctx, promoted_int(level, v.basetype))
 
 
 def add_inherits(ctx, childname: str, parents: list):
@@ -230,7 +284,7 @@ def _id_qual(q: Optional[TypeQual]) -> str:
     return q.qual
 
 
-def _id_var_single(ctx, v: Var) -> str:
+def _id_var_single(level, v: Var) -> str:
     name = ""
     if v.devicespec == 'c':
         name += "c "
@@ -242,27 +296,32 @@ def _id_var_single(ctx, v: Var) -> str:
     elif io == 'o': name += "o "
     else:           name += "io "
 
-    name += promote_int(ctx, v.basetype)
+    name += promoted_int(level, v.basetype)
     name += _id_qual(v.qual)
     if v.tinfo == VT.const:
         name += " " + v.name
     return name
 
 
-def _id_var(ctx, vars: list) -> str:
-    return ", ".join(_id_var_single(ctx, v) for v in vars)
+def _id_var(level, vars: list) -> str:
+    return ", ".join(_id_var_single(level, v) for v in vars)
 
 
 def id_string(ctx, f) -> str:
+    """Canonical signature of a typechecked *f*.  It is computed once,
+    interned and kept in f.sig; typecheck() clears it."""
     if not f:
         return ""
-    name = ""
-    if f.ret:
-        name += _id_var(ctx, f.ret) + " = "
-    if f.thisv:
-        name += f.thisv + "->" + f.classv + "."
-    name += f.funcv + "(" + _id_var(ctx, f.args) + ")"
-    return name
+    if f.sig is None:
+        level = ctx.mw_promote_int
+        name = ""
+        if f.ret:
+            name += _id_var(level, f.ret) + " = "
+        if f.thisv:
+            name += f.thisv + "->" + f.classv + "."
+        name += f.funcv + "(" + _id_var(level, f.args) + ")"
+        f.sig = sys.intern(name)
+    return f.sig
 
 
 # ---------------------------------------------------------------------------
@@ -307,7 +366,9 @@ def print_func(f):
     """Human-readable translation of Func AST (for C comments)."""
     if not f:
         return ""
-    s = ""
+    s = "hot " if f.hot else ""
+    if f.vectorize:
+        s += "vectorize "
     if f.ret:
         s += _print_var(f.ret[0]) + " = "
     if f.thisv:
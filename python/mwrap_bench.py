@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+mwrap_bench.py — Benchmark the generator on synthetic .mw interfaces.
+
+Copyright (c) 2007-2008  David Bindel
+See the file COPYING for copying permissions
+
+Writes a synthetic interface (functions, classes with long inheritance
+lists, typedefs, nested @include files and $[ ... $] blocks) to a
+temporary directory, then times the lexer, the parser, the typechecker
+and the C generator separately.  Peak memory per stage is measured in a
+separate traced run so that tracing does not inflate the timings.  With
+-rss the mwrap command itself is also run once on the interface, in a
+child process, and its peak resident set size is reported.
+
+Usage:
+    python3 mwrap_bench.py [-funcs N] [-classes N] [-parents N]
+                           [-typedefs N] [-includes N] [-block N]
+                           [-repeat N] [-rss] [-o out.json]
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+_script_dir = os.path.dirname(os.path.abspath(__file__))
+if _script_dir not in sys.path:
+    sys.path.insert(0, _script_dir)
+
+import mwrap_parser
+from mwrap_ast import MwrapContext
+from mwrap_lexer import Lexer
+from mwrap_parser import Parser
+from mwrap_cgen import print_mex_init, print_mex_file
+
+try:
+    import resource
+except ImportError:      # Windows
+    resource = None
+
+
+STAGES = ("lex", "parse", "typecheck", "cgen")
+
+
+# ---------------------------------------------------------------------------
+# Synthetic input
+# ---------------------------------------------------------------------------
+
+def _func_lines(i, nclasses, ntypedefs):
+    """Declarations for function i, cycling through the common shapes."""
+    cls = f"Class{i % nclasses}"
+    td = f"Real{i % ntypedefs}" if ntypedefs else "double"
+    kind = i % 7
+    if kind == 0:
+        return [f"# double y = scalar{i}(double x, int n);"]
+    if kind == 1:
+        return [f"# array{i}(double[m,n] a, int m, int n, output double[n] y);"]
+    if kind == 2:
+        return [f"# {cls}* obj = new {cls}(int k);"]
+    if kind == 3:
+        return [f"# double v = obj->{cls}.method{i}(double x, inout double[3] z);"]
+    if kind == 4:
+        return [f"# strings{i}(cstring s, output cstring[128] t);"]
+    if kind == 5:
+        return [f"# {td} z = typed{i}({td} a, mxArray m, dcomplex[2] c);"]
+    # Same signature every time: exercises duplicate-stub merging
+    return [f"# delete({cls}* obj);"]
+
+
+def write_interface(dirname, nfuncs=2000, nclasses=50, nparents=20,
+                    ntypedefs=100, nincludes=8, block_lines=200):
+    """Write a synthetic interface under *dirname*; return the top file."""
+    nfiles = nincludes + 1
+    names = [os.path.join(dirname, f"bench{k}.mw") for k in range(nfiles)]
+    for k, name in enumerate(names):
+        lines = [f"% Synthetic interface part {k}", ""]
+        if k == 0:
+            lines += [f"# typedef numeric Real{t};" for t in range(ntypedefs)]
+            for c in range(nclasses):
+                # Inherit from up to nparents earlier classes
+                parents = [f"Class{p}" for p in range(max(0, c - nparents), c)]
+                if parents:
+                    lines.append(f"# class Class{c} : {', '.join(parents)};")
+        lines.append("$[")
+        lines += [f"static int bench_{k}_{j}(int x) {{ return x + {j}; }}"
+                  for j in range(block_lines)]
+        lines.append("$]")
+        lo = k * nfuncs // nfiles
+        hi = (k + 1) * nfuncs // nfiles
+        for i in range(lo, hi):
+            lines.append(f"@function y = f{i}(varargin)")
+            lines += _func_lines(i, nclasses, ntypedefs)
+        if k + 1 < nfiles:
+            lines.append(f"@include {names[k + 1]}")
+        with open(name, "w") as f:
+            f.write("\n".join(lines) + "\n")
+    return names[0]
+
+
+# ---------------------------------------------------------------------------
+# One timed run
+# ---------------------------------------------------------------------------
+
+def _new_context():
+    ctx = MwrapContext()
+    ctx.init_scalar_types()
+    ctx.mw_use_cpp_complex = True
+    ctx.add_zscalar_type("dcomplex")
+    ctx.add_cscalar_type("fcomplex")
+    return ctx
+
+
+def run_once(infile, support_text, measure):
+    """Run all stages on *infile*.  *measure(stage, thunk)* runs a stage
+    and records its cost; typecheck is measured inside the parse stage
+    and subtracted from it."""
+    ctx = _new_context()
+    outfp = io.StringIO()
+    outcfp = io.StringIO()
+    lexer = Lexer(outfp=outfp, outcfp=outcfp)
+    parser = Parser(lexer, ctx, mexfunc="benchmex")
+
+    def lex():
+        print_mex_init(outcfp, ctx, support_text)
+        lexer.current_ifname = infile
+        return list(lexer.lex_file(infile))
+
+    tokens = measure("lex", lex)
+
+    tc_time = [0.0]
+    typecheck = mwrap_parser.typecheck
+
+    def timed_typecheck(*args):
+        t0 = time.perf_counter()
+        try:
+            return typecheck(*args)
+        finally:
+            tc_time[0] += time.perf_counter() - t0
+
+    def parse():
+        for tok in tokens:
+            parser.feed(tok)
+        parser.finish_file()
+
+    mwrap_parser.typecheck = timed_typecheck
+    try:
+        measure("parse", parse)
+    finally:
+        mwrap_parser.typecheck = typecheck
+
+    measure("cgen", lambda: print_mex_file(outcfp, ctx, parser.funcs))
+
+    errors = parser.err_flag + parser.type_errs
+    return {"tokens": len(tokens), "funcs": len(parser.funcs),
+            "errors": errors, "c_bytes": len(outcfp.getvalue()),
+            "m_bytes": len(outfp.getvalue())}, tc_time[0]
+
+
+def bench(infile, repeat=5):
+    """Time *repeat* runs, then measure peak traced memory per stage."""
+    with open(os.path.join(_script_dir, "mwrap_support.c")) as f:
+        support_text = f.read()
+
+    times = {s: [] for s in STAGES}
+
+    def timed(stage, thunk):
+        t0 = time.perf_counter()
+        result = thunk()
+        times[stage].append(time.perf_counter() - t0)
+        return result
+
+    for _ in range(repeat):
+        info, tc = run_once(infile, support_text, timed)
+        times["parse"][-1] -= tc
+        times["typecheck"].append(tc)
+
+    peaks = {}
+
+    def traced(stage, thunk):
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        result = thunk()
+        peaks[stage] = tracemalloc.get_traced_memory()[1] - start
+        return result
+
+    tracemalloc.start()
+    try:
+        run_once(infile, support_text, traced)
+    finally:
+        tracemalloc.stop()
+
+    stages = {}
+    for s in STAGES:
+        t = times[s]
+        stages[s] = {"min_s": min(t), "mean_s": sum(t) / len(t), "runs_s": t}
+    for s, peak in peaks.items():
+        stages[s]["peak_bytes"] = peak
+
+    result = dict(info)
+    result["stages"] = stages
+    result["total_min_s"] = sum(stages[s]["min_s"] for s in STAGES)
+    if resource:
+        # ru_maxrss is in KiB on Linux and in bytes on macOS
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result["max_rss_bytes"] = rss if sys.platform == "darwin" else rss * 1024
+    return result
+
+
+def cli_rss(infile):
+    """Peak RSS in bytes of one `mwrap` run on *infile*, or None."""
+    if not resource:
+        return None
+    outdir = os.path.dirname(infile)
+    cmd = [sys.executable, os.path.join(_script_dir, "mwrap"), "-cppcomplex",
+           "-mex", "benchmex", "-c", os.path.join(outdir, "benchmex.cc"),
+           "-m", os.path.join(outdir, "bench.m"), infile]
+    subprocess.run(cmd, cwd=outdir, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+# ---------------------------------------------------------------------------
+# Command line
+# ---------------------------------------------------------------------------
+
+def main(argv=None):
+    p = argparse.ArgumentParser(
+        description="Benchmark mwrap on a synthetic interface.")
+    p.add_argument('-funcs', type=int, default=2000)
+    p.add_argument('-classes', type=int, default=50)
+    p.add_argument('-parents', type=int, default=20,
+                   help="maximum parents per class declaration")
+    p.add_argument('-typedefs', type=int, default=100)
+    p.add_argument('-includes', type=int, default=8,
+                   help="depth of the @include chain (at most 9)")
+    p.add_argument('-block', type=int, default=200,
+                   help="lines per $[ ... $] block")
+    p.add_argument('-repeat', type=int, default=5)
+    p.add_argument('-rss', action='store_true',
+                   help="also report the peak RSS of one mwrap run")
+    p.add_argument('-o', dest='output', help="write JSON here, not stdout")
+    args = p.parse_args(argv)
+
+    if not 0 <= args.includes <= 9:
+        p.error("-includes must be between 0 and 9")
+    if args.funcs < 1 or args.classes < 1 or args.repeat < 1:
+        p.error("-funcs, -classes and -repeat must be positive")
+
+    config = {k: v for k, v in vars(args).items() if k != 'output'}
+    tmpdir = tempfile.mkdtemp(prefix="mwrap_bench_")
+    try:
+        infile = write_interface(tmpdir, args.funcs, args.classes,
+                                 args.parents, args.typedefs,
+                                 args.includes, args.block)
+        # Before the timed runs: the child's peak includes our own RSS
+        # at fork time
+        rss = cli_rss(infile) if args.rss else None
+        result = bench(infile, args.repeat)
+        if args.rss:
+            result["cli_max_rss_bytes"] = rss
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    report = {"config": config,
+              "python": platform.python_version(),
+              "platform": platform.platform(),
+              "result": result}
+    text = json.dumps(report, indent=2) + "\n"
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+    return 1 if result["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
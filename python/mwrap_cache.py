@@ -0,0 +1,171 @@
+"""
+mwrap_cache.py — On-disk cache of generated outputs (-cache DIR).
+
+Copyright (c) 2007-2008  David Bindel
+See the file COPYING for copying permissions
+
+A run is keyed by the mwrap sources, the command-line options and the
+names and contents of the input files.  Each entry also records the hash
+of every file read through @include, so editing an included file
+invalidates the entry even though the key does not change.  On a hit the
+recorded outputs are replayed without lexing, parsing or generating.
+
+All outputs are buffered and written only when their bytes differ from
+what is already on disk, so an unchanged MEX gateway keeps its mtime and
+is not recompiled by make or cmake.
+"""
+
+import glob
+import hashlib
+import io
+import json
+import os
+import sys
+
+
+def _sha256_file(name):
+    h = hashlib.sha256()
+    with open(name, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def write_if_changed(name, text):
+    """Write *text* to *name* unless the file already holds exactly that."""
+    if os.linesep != "\n":
+        expected = text.replace("\n", os.linesep)
+    else:
+        expected = text
+    try:
+        with open(name, "r", newline="") as f:
+            if f.read() == expected:
+                return False
+    except (OSError, UnicodeDecodeError):
+        pass
+    with open(name, "w") as f:
+        f.write(text)
+    return True
+
+
+class BufferedOutput(io.StringIO):
+    """Text output file that reaches the disk only on close, and only if
+    its contents changed."""
+
+    def __init__(self, name, on_close=None):
+        super().__init__()
+        # Fail at open time, as open(name, "w") would, without truncating
+        open(name, "a").close()
+        self.name = name
+        self._on_close = on_close
+
+    def close(self):
+        if not self.closed:
+            text = self.getvalue()
+            write_if_changed(self.name, text)
+            if self._on_close:
+                self._on_close(self.name, text)
+        super().close()
+
+
+class _Tee:
+    """Stream wrapper that keeps a copy of everything written."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.text = io.StringIO()
+
+    def write(self, s):
+        self.text.write(s)
+        return self.stream.write(s)
+
+    def flush(self):
+        self.stream.flush()
+
+
+class Cache:
+    """Cache of mwrap runs in directory *cache_dir*.
+
+    Usage:
+        cache = Cache(cache_dir, options, input_files)
+        if cache.replay():
+            return 0
+        cache.begin()
+        ...   # open outputs with cache.open_output, run as usual
+        cache.end(lexer.sources, ok)
+    """
+
+    def __init__(self, cache_dir, options, input_files):
+        self.cache_dir = cache_dir
+        self.input_files = list(input_files)
+        self.outputs = {}
+        self._tees = None
+        self.key = self._make_key(options)
+
+    def _make_key(self, options):
+        h = hashlib.sha256()
+        tool_dir = os.path.dirname(os.path.abspath(__file__))
+        for name in sorted(glob.glob(os.path.join(tool_dir, "mwrap*"))):
+            if os.path.isfile(name):
+                h.update(_sha256_file(name).encode())
+        h.update(json.dumps(options, sort_keys=True).encode())
+        for name in self.input_files:
+            h.update(name.encode() + b"\0")
+            try:
+                h.update(_sha256_file(name).encode())
+            except OSError:
+                h.update(b"unreadable")
+        return h.hexdigest()
+
+    def _entry_path(self):
+        return os.path.join(self.cache_dir, self.key + ".json")
+
+    def replay(self):
+        """Reproduce a cached run; return False on a miss."""
+        try:
+            with open(self._entry_path(), "r") as f:
+                entry = json.load(f)
+            for name, digest in entry["sources"].items():
+                if _sha256_file(name) != digest:
+                    return False
+        except (OSError, ValueError, KeyError):
+            return False
+
+        for name, text in entry["outputs"]:
+            write_if_changed(name, text)
+        sys.stdout.write(entry["stdout"])
+        sys.stderr.write(entry["stderr"])
+        return True
+
+    def open_output(self, name):
+        return BufferedOutput(name, self._record)
+
+    def _record(self, name, text):
+        self.outputs.pop(name, None)
+        self.outputs[name] = text
+
+    def begin(self):
+        """Start capturing stdout and stderr for the cache entry."""
+        self._tees = (_Tee(sys.stdout), _Tee(sys.stderr))
+        sys.stdout, sys.stderr = self._tees
+
+    def end(self, sources, ok):
+        """Stop capturing, and store the entry if the run succeeded."""
+        out, err = self._tees
+        sys.stdout, sys.stderr = out.stream, err.stream
+        if not ok:
+            return
+        try:
+            entry = {
+                "sources": {name: _sha256_file(name) for name in sources},
+                "outputs": list(self.outputs.items()),
+                "stdout": out.text.getvalue(),
+                "stderr": err.text.getvalue(),
+            }
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = f"{self._entry_path()}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(entry, f)
+            os.replace(tmp, self._entry_path())
+        except OSError as e:
+            sys.stderr.write(f"Warning: could not update cache: {e}\n")
@@ -8,6 +8,8 @@ Converted to Python by Zydrunas Gimbutas (2026),
 with assistance from Claude Code / Claude Opus 4.6 (Anthropic).
 """
 
+import io
+import os
 import sys
 from dataclasses import dataclass
 from mwrap_ast import (
@@ -29,18 +31,19 @@ class TypeProps:
     scalar_getter: str       # "mxWrapGetScalar" / "_single" / "_char"
     scalar_class: str        # mxClass for scalar validation
     direct_input: bool = False  # True → use direct accessor for input-only arrays
+    native_input: bool = False  # True → may alias matching input arrays (-zerocopy)
 
 _DEFAULT_PROPS = TypeProps("mxVOID_CLASS", None, False, "mxWrapGetScalar", "mxDOUBLE_CLASS")
 
 TYPE_PROPS = {
     "double":   TypeProps("mxDOUBLE_CLASS", "mxGetDoubles",        False, "mxWrapGetScalar",        "mxDOUBLE_CLASS", True),
     "float":    TypeProps("mxSINGLE_CLASS", "mxGetSingles",        True,  "mxWrapGetScalar_single", "mxSINGLE_CLASS", True),
-    "int32_t":  TypeProps("mxINT32_CLASS",  "mxGetInt32s",         False, "mxWrapGetScalar",        "mxDOUBLE_CLASS"),
-    "int64_t":  TypeProps("mxINT64_CLASS",  "mxGetInt64s",         False, "mxWrapGetScalar",        "mxDOUBLE_CLASS"),
-    "uint32_t": TypeProps("mxUINT32_CLASS", "mxGetUint32s",        False, "mxWrapGetScalar",        "mxDOUBLE_CLASS"),
-    "uint64_t": TypeProps("mxUINT64_CLASS", "mxGetUint64s",        False, "mxWrapGetScalar",        "mxDOUBLE_CLASS"),
-    "dcomplex": TypeProps("mxDOUBLE_CLASS", "mxGetComplexDoubles", False, "mxWrapGetScalar",        "mxDOUBLE_CLASS"),
-    "fcomplex": TypeProps("mxSINGLE_CLASS", "mxGetComplexSingles", True,  "mxWrapGetScalar_single", "mxSINGLE_CLASS"),
+    "int32_t":  TypeProps("mxINT32_CLASS",  "mxGetInt32s",         False, "mxWrapGetScalar",        "mxDOUBLE_CLASS", False, True),
+    "int64_t":  TypeProps("mxINT64_CLASS",  "mxGetInt64s",         False, "mxWrapGetScalar",        "mxDOUBLE_CLASS", False, True),
+    "uint32_t": TypeProps("mxUINT32_CLASS", "mxGetUint32s",        False, "mxWrapGetScalar",        "mxDOUBLE_CLASS", False, True),
+    "uint64_t": TypeProps("mxUINT64_CLASS", "mxGetUint64s",        False, "mxWrapGetScalar",        "mxDOUBLE_CLASS", False, True),
+    "dcomplex": TypeProps("mxDOUBLE_CLASS", "mxGetComplexDoubles", False, "mxWrapGetScalar",        "mxDOUBLE_CLASS", False, True),
+    "fcomplex": TypeProps("mxSINGLE_CLASS", "mxGetComplexSingles", True,  "mxWrapGetScalar_single", "mxSINGLE_CLASS", False, True),
     "char":     TypeProps("mxCHAR_CLASS",   None,                  False, "mxWrapGetScalar_char",   "mxCHAR_CLASS"),
 }
 
@@ -78,6 +81,21 @@ def has_fortran(funcs):
     return any(f.fort for f in funcs)
 
 
+def has_dims(funcs):
+    return any(v.qual and v.qual.args
+               for f in funcs for v in f.ret + f.args)
+
+
+def _checked_nd(v):
+    """True for an N-d (3+ dimensional) input array whose shape is checked."""
+    return (v.iospec != 'o' and is_array(v.tinfo) and v.devicespec != 'g' and
+            v.qual and len(v.qual.args) > 2)
+
+
+def has_nd_inputs(funcs):
+    return any(_checked_nd(v) for f in funcs for v in f.args)
+
+
 def max_routine_id(funcs):
     maxid = 0
     for f in funcs:
@@ -134,17 +152,23 @@ def mex_gpucpp_complex(fp):
 # Copier instantiation
 # ===================================================================
 
+def _copier_type_used(ctx, name):
+    """Skip types not actually used."""
+    if name == "int32_t"  and not ctx.mw_use_int32_t:  return False
+    if name == "int64_t"  and not ctx.mw_use_int64_t:  return False
+    if name == "uint32_t" and not ctx.mw_use_uint32_t: return False
+    if name == "uint64_t" and not ctx.mw_use_uint64_t: return False
+    if name == "ulong"    and not ctx.mw_use_ulong:    return False
+    if name == "uint"     and not ctx.mw_use_uint:     return False
+    if name == "ushort"   and not ctx.mw_use_ushort:   return False
+    if name == "uchar"    and not ctx.mw_use_uchar:    return False
+    return True
+
+
 def _mex_define_copiers_type(fp, ctx, name):
     """Emit copier macro calls for one scalar type."""
-    # Skip types not actually used
-    if name == "int32_t"  and not ctx.mw_use_int32_t:  return
-    if name == "int64_t"  and not ctx.mw_use_int64_t:  return
-    if name == "uint32_t" and not ctx.mw_use_uint32_t: return
-    if name == "uint64_t" and not ctx.mw_use_uint64_t: return
-    if name == "ulong"    and not ctx.mw_use_ulong:    return
-    if name == "uint"     and not ctx.mw_use_uint:     return
-    if name == "ushort"   and not ctx.mw_use_ushort:   return
-    if name == "uchar"    and not ctx.mw_use_uchar:    return
+    if not _copier_type_used(ctx, name):
+        return
 
     fp.write(f"mxWrapGetArrayDef(mxWrapGetArray_{name}, {name})\n")
     fp.write(f"mxWrapCopyDef    (mxWrapCopy_{name},     {name})\n")
@@ -272,9 +296,12 @@ def _mex_casting_getter(fp, cname, inherits):
            "        return NULL;\n"
            "    if (!mxIsChar(a)) {\n"
            "#ifdef R2008OO\n"
-           f"        mxArray* ap = mxGetProperty(a, 0, \"mwptr\");\n"
-           f"        if (ap)\n"
-           f"            return mxWrapGetP_{cname}(ap, e);\n"
+           f"        mxArray* ap = mxWrapGetPtrProp(a);\n"
+           f"        if (ap) {{\n"
+           f"            {cname}* p = mxWrapGetP_{cname}(ap, e);\n"
+           f"            mxWrapFreePtrProp(ap);\n"
+           f"            return p;\n"
+           f"        }}\n"
            "#endif\n"
            "        *e = \"Invalid pointer\";\n"
            "        return NULL;\n"
@@ -288,9 +315,342 @@ def _mex_casting_getter(fp, cname, inherits):
            f"}}\n\n")
 
 
+def _mex_casting_getter_bin(fp, cname, inherits):
+    fp.write(f"\n{cname}* mxWrapGetP_{cname}(const mxArray* a, const char** e)\n"
+           f"{{\n"
+           f"    uint64_t tag = 0;\n"
+           f"    void* p = mxWrapGetH(a, &tag, e);\n"
+           f"    if (!p)\n"
+           f"        return NULL;\n"
+           f"    switch (tag) {{\n")
+    for name in dict.fromkeys([cname] + list(inherits)):
+        fp.write(f"    case {handle_tag(name)}:  /* {name} */\n"
+               f"        return ({name}*) p;\n")
+    fp.write(f"    }}\n"
+           f"    *e = \"Invalid pointer to {cname}\";\n"
+           f"    return NULL;\n"
+           f"}}\n\n")
+
+
 def mex_casting_getters(fp, ctx):
     for parent in sorted(ctx.class_decls.keys()):
-        _mex_casting_getter(fp, parent, ctx.class_decls[parent])
+        if ctx.mw_bin_handles:
+            _mex_casting_getter_bin(fp, parent, ctx.class_decls[parent])
+        else:
+            _mex_casting_getter(fp, parent, ctx.class_decls[parent])
+
+
+# ===================================================================
+# Binary object handles (-binhandles) and handle registry (-registry)
+# ===================================================================
+
+def handle_tag(name):
+    """64-bit FNV-1a hash of a class name, as a C literal."""
+    h = 14695981039346656037
+    for c in name.encode():
+        h = ((h ^ c) * 1099511628211) & 0xffffffffffffffff
+    return f"0x{h:016x}ull"
+
+
+MEX_HANDLE_DECLS = (
+    "mxArray* mxWrapCreateH(void* p, uint64_t tag);\n"
+    "void*    mxWrapGetH(const mxArray* a, uint64_t* tag, const char** e);\n"
+    "void*    mxWrapGetHP(const mxArray* a, uint64_t tag, const char** e);\n"
+    "void     mxWrapRetireH(const mxArray* a);\n\n"
+)
+
+MEX_HANDLE_DATA = (
+    "/*\n"
+    " * Binary object handles: a 1-by-2 uint64 array holding the pointer (or\n"
+    " * registry ID) and a hash of its class name.  NULL is the double 0.\n"
+    " * Copy the pair into h and return 1, or return 0 for NULL or an error.\n"
+    " */\n"
+    "static int mwHandleData_(const mxArray* a, uint64_t h[2], const char** e)\n"
+    "{\n"
+    "#ifdef R2008OO\n"
+    "    mxArray* ap;\n"
+    "    int found;\n"
+    "#endif\n"
+    "    if (mxGetClassID(a) == mxUINT64_CLASS && !mxIsComplex(a) &&\n"
+    "        mxGetNumberOfElements(a) == 2) {\n"
+    "        const uint64_t* d = (const uint64_t*) mxGetData(a);\n"
+    "        h[0] = d[0];\n"
+    "        h[1] = d[1];\n"
+    "        return 1;\n"
+    "    }\n"
+    "    if (mxGetClassID(a) == mxDOUBLE_CLASS &&\n"
+    "        mxGetNumberOfElements(a) == 1 && mxGetScalar(a) == 0)\n"
+    "        return 0;\n"
+    "#ifdef R2008OO\n"
+    "    if (!mxIsChar(a) && (ap = mxWrapGetPtrProp(a)) != NULL) {\n"
+    "        found = mwHandleData_(ap, h, e);\n"
+    "        mxWrapFreePtrProp(ap);\n"
+    "        return found;\n"
+    "    }\n"
+    "#endif\n"
+    "    *e = \"Invalid pointer\";\n"
+    "    return 0;\n"
+    "}\n\n"
+)
+
+MEX_HANDLE_PLAIN = (
+    "mxArray* mxWrapCreateH(void* p, uint64_t tag)\n"
+    "{\n"
+    "    mxArray* a;\n"
+    "    uint64_t* h;\n"
+    "    if (p == 0)\n"
+    "        return mxCreateDoubleMatrix(1,1, mxREAL);\n"
+    "    a = mxCreateNumericMatrix(1,2, mxUINT64_CLASS, mxREAL);\n"
+    "    h = (uint64_t*) mxGetData(a);\n"
+    "    h[0] = (uint64_t) (uintptr_t) p;\n"
+    "    h[1] = tag;\n"
+    "    return a;\n"
+    "}\n\n"
+    "void* mxWrapGetH(const mxArray* a, uint64_t* tag, const char** e)\n"
+    "{\n"
+    "    uint64_t h[2];\n"
+    "    if (!mwHandleData_(a, h, e))\n"
+    "        return NULL;\n"
+    "    *tag = h[1];\n"
+    "    return (void*) (uintptr_t) h[0];\n"
+    "}\n\n"
+    "void mxWrapRetireH(const mxArray* a)\n"
+    "{\n"
+    "}\n\n"
+)
+
+MEX_HANDLE_REGISTRY = (
+    "/*\n"
+    " * Handle registry: h[0] is (generation << 32 | slot) in a slot map, so\n"
+    " * lookups are O(1) and handles to deleted objects are caught.  The\n"
+    " * open-addressed index maps (pointer, tag) to its slot, so returning the\n"
+    " * same object twice gives the same handle.\n"
+    " */\n"
+    "typedef struct mwHandleSlot_t {\n"
+    "    void*    ptr;       /* NULL when the slot is free */\n"
+    "    uint64_t tag;\n"
+    "    uint32_t gen;\n"
+    "    uint32_t next;      /* next free slot */\n"
+    "} mwHandleSlot_t;\n\n"
+    "#define MW_HANDLE_GONE 0xffffffffu\n\n"
+    "static mwHandleSlot_t* mwHandleSlots_ = NULL;\n"
+    "static uint32_t  mwHandleNslots_   = 1;     /* slot 0 is never used */\n"
+    "static uint32_t  mwHandleCap_      = 0;\n"
+    "static uint32_t  mwHandleFree_     = 0;\n"
+    "static uint32_t  mwHandleLive_     = 0;\n"
+    "static uint32_t* mwHandleIndex_    = NULL;  /* 0 empty, or GONE */\n"
+    "static uint32_t  mwHandleIndexCap_ = 0;\n"
+    "static uint32_t  mwHandleIndexUsed_ = 0;    /* live + GONE entries */\n\n"
+    "static uint32_t mwHandleHash_(void* p, uint64_t tag)\n"
+    "{\n"
+    "    return (uint32_t) ((((uint64_t) (uintptr_t) p ^ tag) *\n"
+    "                        0x9e3779b97f4a7c15ull) >> 32);\n"
+    "}\n\n"
+    "static void mwHandleRehash_(void)\n"
+    "{\n"
+    "    uint32_t i, j, cap = 64;\n"
+    "    while (cap < 4*(mwHandleLive_+1))\n"
+    "        cap *= 2;\n"
+    "    free(mwHandleIndex_);\n"
+    "    mwHandleIndex_ = (uint32_t*) calloc(cap, sizeof(uint32_t));\n"
+    "    mwHandleIndexCap_ = cap;\n"
+    "    mwHandleIndexUsed_ = mwHandleLive_;\n"
+    "    for (i = 1; i < mwHandleNslots_; ++i) {\n"
+    "        if (!mwHandleSlots_[i].ptr)\n"
+    "            continue;\n"
+    "        j = mwHandleHash_(mwHandleSlots_[i].ptr, mwHandleSlots_[i].tag);\n"
+    "        for (j &= cap-1; mwHandleIndex_[j]; j = (j+1) & (cap-1))\n"
+    "            ;\n"
+    "        mwHandleIndex_[j] = i;\n"
+    "    }\n"
+    "}\n\n"
+    "static uint64_t mwHandleRegister_(void* p, uint64_t tag)\n"
+    "{\n"
+    "    uint32_t j, slot;\n"
+    "    uint32_t* hole = NULL;\n"
+    "    if (2*(mwHandleIndexUsed_+1) > mwHandleIndexCap_)\n"
+    "        mwHandleRehash_();\n"
+    "    j = mwHandleHash_(p, tag) & (mwHandleIndexCap_-1);\n"
+    "    for (; mwHandleIndex_[j]; j = (j+1) & (mwHandleIndexCap_-1)) {\n"
+    "        slot = mwHandleIndex_[j];\n"
+    "        if (slot == MW_HANDLE_GONE) {\n"
+    "            if (!hole)\n"
+    "                hole = mwHandleIndex_ + j;\n"
+    "        } else if (mwHandleSlots_[slot].ptr == p && mwHandleSlots_[slot].tag == tag) {\n"
+    "            return ((uint64_t) mwHandleSlots_[slot].gen << 32) | slot;\n"
+    "        }\n"
+    "    }\n"
+    "    if (!hole) {\n"
+    "        hole = mwHandleIndex_ + j;\n"
+    "        ++mwHandleIndexUsed_;\n"
+    "    }\n"
+    "    if (mwHandleFree_) {\n"
+    "        slot = mwHandleFree_;\n"
+    "        mwHandleFree_ = mwHandleSlots_[slot].next;\n"
+    "    } else {\n"
+    "        if (mwHandleNslots_ == mwHandleCap_ || !mwHandleSlots_) {\n"
+    "            mwHandleCap_ = mwHandleCap_ ? 2*mwHandleCap_ : 64;\n"
+    "            mwHandleSlots_ = (mwHandleSlot_t*)\n"
+    "                realloc(mwHandleSlots_, mwHandleCap_ * sizeof(mwHandleSlot_t));\n"
+    "        }\n"
+    "        slot = mwHandleNslots_++;\n"
+    "        mwHandleSlots_[slot].gen = 0;\n"
+    "    }\n"
+    "    mwHandleSlots_[slot].ptr  = p;\n"
+    "    mwHandleSlots_[slot].tag  = tag;\n"
+    "    mwHandleSlots_[slot].next = 0;\n"
+    "    mwHandleSlots_[slot].gen++;\n"
+    "    *hole = slot;\n"
+    "    ++mwHandleLive_;\n"
+    "    return ((uint64_t) mwHandleSlots_[slot].gen << 32) | slot;\n"
+    "}\n\n"
+    "static mwHandleSlot_t* mwHandleFind_(const uint64_t* h)\n"
+    "{\n"
+    "    uint32_t slot = (uint32_t) h[0];\n"
+    "    if (slot == 0 || slot >= mwHandleNslots_ ||\n"
+    "        mwHandleSlots_[slot].gen != (uint32_t) (h[0] >> 32) ||\n"
+    "        !mwHandleSlots_[slot].ptr || mwHandleSlots_[slot].tag != h[1])\n"
+    "        return NULL;\n"
+    "    return mwHandleSlots_ + slot;\n"
+    "}\n\n"
+    "mxArray* mxWrapCreateH(void* p, uint64_t tag)\n"
+    "{\n"
+    "    mxArray* a;\n"
+    "    uint64_t* h;\n"
+    "    if (p == 0)\n"
+    "        return mxCreateDoubleMatrix(1,1, mxREAL);\n"
+    "    a = mxCreateNumericMatrix(1,2, mxUINT64_CLASS, mxREAL);\n"
+    "    h = (uint64_t*) mxGetData(a);\n"
+    "    h[0] = mwHandleRegister_(p, tag);\n"
+    "    h[1] = tag;\n"
+    "    return a;\n"
+    "}\n\n"
+    "void* mxWrapGetH(const mxArray* a, uint64_t* tag, const char** e)\n"
+    "{\n"
+    "    uint64_t h[2];\n"
+    "    mwHandleSlot_t* s;\n"
+    "    if (!mwHandleData_(a, h, e))\n"
+    "        return NULL;\n"
+    "    s = mwHandleFind_(h);\n"
+    "    if (!s) {\n"
+    "        *e = \"Invalid or deleted object handle\";\n"
+    "        return NULL;\n"
+    "    }\n"
+    "    *tag = s->tag;\n"
+    "    return s->ptr;\n"
+    "}\n\n"
+    "void mxWrapRetireH(const mxArray* a)\n"
+    "{\n"
+    "    const char* e = NULL;\n"
+    "    uint64_t h[2];\n"
+    "    mwHandleSlot_t* s = mwHandleData_(a, h, &e) ? mwHandleFind_(h) : NULL;\n"
+    "    uint32_t j, slot;\n"
+    "    if (!s)\n"
+    "        return;\n"
+    "    slot = (uint32_t) (s - mwHandleSlots_);\n"
+    "    j = mwHandleHash_(s->ptr, s->tag) & (mwHandleIndexCap_-1);\n"
+    "    for (; mwHandleIndex_[j] != slot; j = (j+1) & (mwHandleIndexCap_-1))\n"
+    "        ;\n"
+    "    mwHandleIndex_[j] = MW_HANDLE_GONE;\n"
+    "    s->ptr  = NULL;\n"
+    "    s->next = mwHandleFree_;\n"
+    "    mwHandleFree_ = slot;\n"
+    "    --mwHandleLive_;\n"
+    "}\n\n"
+    "typedef struct mwHandleClass_t {\n"
+    "    uint64_t    tag;\n"
+    "    const char* name;\n"
+    "} mwHandleClass_t;\n\n"
+)
+
+MEX_HANDLE_REPORT = (
+    "static void mwHandleReport_(int nlhs, mxArray* plhs[])\n"
+    "{\n"
+    "    const char* fields[] = {\"class\", \"count\"};\n"
+    "    double* counts;\n"
+    "    uint32_t i;\n"
+    "    int k, n;\n"
+    "    for (n = 0; mwHandleClasses_[n].name; ++n)\n"
+    "        ;\n"
+    "    counts = (double*) calloc(n+1, sizeof(double));\n"
+    "    for (i = 1; i < mwHandleNslots_; ++i) {\n"
+    "        if (!mwHandleSlots_[i].ptr)\n"
+    "            continue;\n"
+    "        for (k = 0; k < n && mwHandleClasses_[k].tag != mwHandleSlots_[i].tag; ++k)\n"
+    "            ;\n"
+    "        counts[k]++;\n"
+    "    }\n"
+    "    if (nlhs > 0) {\n"
+    "        plhs[0] = mxCreateStructMatrix(n, 1, 2, fields);\n"
+    "        for (k = 0; k < n; ++k) {\n"
+    "            mxSetField(plhs[0], k, \"class\", mxCreateString(mwHandleClasses_[k].name));\n"
+    "            mxSetField(plhs[0], k, \"count\", mxCreateDoubleScalar(counts[k]));\n"
+    "        }\n"
+    "    } else {\n"
+    "        for (k = 0; k < n; ++k)\n"
+    "            if (counts[k])\n"
+    "                mexPrintf(\"%.0f live handles to %s\\n\", counts[k], mwHandleClasses_[k].name);\n"
+    "        mexPrintf(\"%u live handles in total\\n\", (unsigned) mwHandleLive_);\n"
+    "    }\n"
+    "    free(counts);\n"
+    "}\n\n"
+)
+
+MEX_HANDLE_GETHP = (
+    "void* mxWrapGetHP(const mxArray* a, uint64_t tag, const char** e)\n"
+    "{\n"
+    "    uint64_t t = 0;\n"
+    "    void* p = mxWrapGetH(a, &t, e);\n"
+    "    if (p && t != tag) {\n"
+    "        *e = \"Invalid pointer\";\n"
+    "        return NULL;\n"
+    "    }\n"
+    "    return p;\n"
+    "}\n\n"
+)
+
+
+def _handle_classes(ctx, funcs):
+    """Names of every class that may be passed as a handle."""
+    names = set(ctx.class_decls)
+    for inherits in ctx.class_decls.values():
+        names.update(inherits)
+    for f in funcs:
+        for v in f.ret + f.args:
+            if is_obj(v.tinfo) and not ctx.is_mxarray_type(v.basetype):
+                names.add(v.basetype)
+    return sorted(names)
+
+
+def mex_handle_support(fp, ctx, funcs):
+    fp.write(MEX_HANDLE_DATA)
+    if ctx.mw_registry:
+        fp.write(MEX_HANDLE_REGISTRY)
+        fp.write("static const mwHandleClass_t mwHandleClasses_[] = {\n")
+        for name in _handle_classes(ctx, funcs):
+            fp.write(f"    {{{handle_tag(name)}, \"{name}\"}},\n")
+        fp.write("    {0, NULL}\n"
+               "};\n\n")
+        fp.write(MEX_HANDLE_REPORT)
+    else:
+        fp.write(MEX_HANDLE_PLAIN)
+    fp.write(MEX_HANDLE_GETHP)
+
+
+def _retire_handles(fp, ctx, f):
+    """After delete(...), drop the deleted objects from the registry."""
+    if f.funcv != "delete" or f.thisv or f.fort:
+        return
+    for v in f.args:
+        if (is_obj(v.tinfo) and v.iospec == 'i' and
+                not ctx.is_mxarray_type(v.basetype)):
+            fp.write(f"    mxWrapRetireH(prhs[{v.input_label}]);\n")
+
+
+def _needs_stdint(ctx):
+    return (ctx.mw_use_int32_t or ctx.mw_use_int64_t or ctx.mw_use_uint32_t or
+            ctx.mw_use_uint64_t or ctx.mw_timing or ctx.mw_bin_handles or
+            ctx.mw_int_dims)
 
 
 # ===================================================================
@@ -317,12 +677,14 @@ def _declare_type(v):
         if v.iospec == 'i':
             return "const mxArray*"
         return "mxArray*"
+    if v.tinfo == VT.sparse:
+        return "mxWrapSparse_t"
     assert False, f"Unknown tinfo {v.tinfo} for {v.name}"
 
 
 # --- Step 1: Declare locals ---
 
-def _declare_in_args(fp, args):
+def _declare_in_args(fp, ctx, args):
     for v in args:
         if v.iospec != 'o' and v.tinfo != VT.const:
             tb = _declare_type(v)
@@ -330,6 +692,8 @@ def _declare_in_args(fp, args):
                 fp.write(f"    {tb:10s}  in{v.input_label}_ =0; /* {v.name:10s} */\n")
                 if v.devicespec == 'g':
                     fp.write(f"    {'mxGPUArray const':10s} *mxGPUArray_in{v.input_label}_ =0; /* {v.name:10s} */\n")
+                if _in_place_inout(ctx, v):
+                    fp.write(f"    {'mxArray':10s} *mxArray_in{v.input_label}_ =0; /* {v.name:10s} */\n")
             else:
                 fp.write(f"    {tb:10s}  in{v.input_label}_;    /* {v.name:10s} */\n")
 
@@ -358,11 +722,11 @@ def _declare_dim_args_var(fp, vars):
             _declare_dim_args_expr(fp, v.qual.args)
 
 
-def _declare_args(fp, f):
+def _declare_args(fp, ctx, f):
     if f.thisv:
         tb = f"{f.classv}*"
         fp.write(f"    {tb:10s}  in0_ =0; /* {f.thisv:10s} */\n")
-    _declare_in_args(fp, f.args)
+    _declare_in_args(fp, ctx, f.args)
     if not nullable_return(f):
         _declare_out_args(fp, f.ret)
     _declare_out_args(fp, f.args)
@@ -374,36 +738,116 @@ def _declare_args(fp, f):
 
 # --- Step 2: Unpack dims ---
 
-def _unpack_dims_expr(fp, args):
+MEX_GET_DIM = (
+    "/*\n"
+    " * Array dimensions (-intdims): a real double, single or integer scalar\n"
+    " * whose value is a nonnegative integer that fits in mwSize.\n"
+    " */\n"
+    "#define mxWrapDimMax_ ((mwSize) -1 > 0 ? (uint64_t) (mwSize) -1 : \\\n"
+    "    ((uint64_t) 1 << (8 * sizeof(mwSize) - 1)) - 1)\n"
+    "\n"
+    "static mwSize mxWrapGetDim_(const mxArray* a, const char** e)\n"
+    "{\n"
+    "    const void* p;\n"
+    "    double d;\n"
+    "    int64_t i;\n"
+    "    uint64_t u;\n"
+    "    if (!a || mxGetNumberOfElements(a) != 1 || mxIsComplex(a) || mxIsSparse(a))\n"
+    "        goto bad;\n"
+    "    p = mxGetData(a);\n"
+    "    switch (mxGetClassID(a)) {\n"
+    "    case mxDOUBLE_CLASS: d = *(const double*) p;   goto from_double;\n"
+    "    case mxSINGLE_CLASS: d = *(const float*) p;    goto from_double;\n"
+    "    case mxINT8_CLASS:   i = *(const int8_t*) p;   goto from_int;\n"
+    "    case mxINT16_CLASS:  i = *(const int16_t*) p;  goto from_int;\n"
+    "    case mxINT32_CLASS:  i = *(const int32_t*) p;  goto from_int;\n"
+    "    case mxINT64_CLASS:  i = *(const int64_t*) p;  goto from_int;\n"
+    "    case mxUINT8_CLASS:  u = *(const uint8_t*) p;  goto from_uint;\n"
+    "    case mxUINT16_CLASS: u = *(const uint16_t*) p; goto from_uint;\n"
+    "    case mxUINT32_CLASS: u = *(const uint32_t*) p; goto from_uint;\n"
+    "    case mxUINT64_CLASS: u = *(const uint64_t*) p; goto from_uint;\n"
+    "    default:             goto bad;\n"
+    "    }\n"
+    "from_double:\n"
+    "    /* (double) mxWrapDimMax_ may round up, hence < rather than <= */\n"
+    "    if (!(d >= 0 && d < (double) mxWrapDimMax_ + 1.0) ||\n"
+    "        (double) (mwSize) d != d)\n"
+    "        goto bad;\n"
+    "    return (mwSize) d;\n"
+    "from_int:\n"
+    "    if (i < 0)\n"
+    "        goto bad;\n"
+    "    u = (uint64_t) i;\n"
+    "from_uint:\n"
+    "    if (u > mxWrapDimMax_)\n"
+    "        goto bad;\n"
+    "    return (mwSize) u;\n"
+    "bad:\n"
+    "    *e = \"Invalid dimension argument, nonnegative integer expected\";\n"
+    "    return 0;\n"
+    "}\n\n"
+)
+
+
+def _unpack_dims_expr(fp, ctx, args):
     count = 0
     for e in args:
-        fp.write(f"    dim{e.input_label}_ = (mwSize) mxWrapGetScalar(prhs[{e.input_label}], &mw_err_txt_);\n")
+        if ctx.mw_int_dims:
+            fp.write(f"    dim{e.input_label}_ = mxWrapGetDim_(prhs[{e.input_label}], &mw_err_txt_);\n")
+        else:
+            fp.write(f"    dim{e.input_label}_ = (mwSize) mxWrapGetScalar(prhs[{e.input_label}], &mw_err_txt_);\n")
         count += 1
     return count
 
 
-def _unpack_dims_var(fp, vars):
+def _unpack_dims_var(fp, ctx, vars):
     count = 0
     for v in vars:
         if v.qual:
-            count += _unpack_dims_expr(fp, v.qual.args)
+            count += _unpack_dims_expr(fp, ctx, v.qual.args)
     return count
 
 
-def _unpack_dims(fp, f):
-    c = _unpack_dims_var(fp, f.ret) + _unpack_dims_var(fp, f.args)
-    if c:
+def _unpack_dims(fp, ctx, f):
+    c = _unpack_dims_var(fp, ctx, f.ret) + _unpack_dims_var(fp, ctx, f.args)
+    if c and ctx.mw_int_dims:
+        # Report a bad dimension before the size checks that use it
+        fp.write("    if (mw_err_txt_)\n"
+                 "        goto mw_err_label;\n\n")
+    elif c:
         fp.write("\n")
 
 
 # --- Step 3: Check dim consistency ---
 
+MEX_ND_DIM = (
+    "/*\n"
+    " * N-d arrays (-nd): dimension k of a, counting the trailing singleton\n"
+    " * dimensions that MATLAB drops.\n"
+    " */\n"
+    "static mwSize mxWrapDimN_(const mxArray* a, mwSize k)\n"
+    "{\n"
+    "    return k < mxGetNumberOfDimensions(a) ? mxGetDimensions(a)[k] : 1;\n"
+    "}\n\n"
+)
+
+
 def _check_dims(fp, args):
     for v in args:
         if (v.iospec != 'o' and is_array(v.tinfo) and
                 v.qual and v.qual.args and v.devicespec != 'g'):
             a = v.qual.args
-            if len(a) > 1:
+            if len(a) > 2:
+                il = v.input_label
+                fp.write(f"    if (mxGetNumberOfDimensions(prhs[{il}]) > {len(a)}")
+                for k, e in enumerate(a):
+                    fp.write(f" ||\n"
+                             f"        mxWrapDimN_(prhs[{il}], {k}) != dim{e.input_label}_")
+                fp.write(f") {{\n"
+                       f"        mw_err_txt_ = \"Bad argument size: {v.name}\";\n"
+                       f"        goto mw_err_label;\n"
+                       f"    }}\n\n")
+            elif len(a) > 1:
                 fp.write(f"    if (mxGetM(prhs[{v.input_label}]) != dim{a[0].input_label}_ ||\n"
                        f"        mxGetN(prhs[{v.input_label}]) != dim{a[1].input_label}_) {{\n"
                        f"        mw_err_txt_ = \"Bad argument size: {v.name}\";\n"
@@ -422,6 +866,8 @@ def _cast_get_p(fp, ctx, basetype, input_label):
     fp.write(f"    in{input_label}_ = ")
     if ctx.is_mxarray_type(basetype):
         fp.write(f"mxWrapGet_{basetype}(prhs[{input_label}], &mw_err_txt_);\n")
+    elif basetype not in ctx.class_decls and ctx.mw_bin_handles:
+        fp.write(f"({basetype}*) mxWrapGetHP(prhs[{input_label}], {handle_tag(basetype)}, &mw_err_txt_);\n")
     elif basetype not in ctx.class_decls:
         fp.write(f"({basetype}*) mxWrapGetP(prhs[{input_label}], \"{basetype}:%p\", &mw_err_txt_);\n")
     else:
@@ -430,7 +876,78 @@ def _cast_get_p(fp, ctx, basetype, input_label):
            "        goto mw_err_label;\n\n")
 
 
-def _unpack_input_array(fp, v):
+def _zero_copy_input(ctx, v):
+    """True if an input array may alias a prhs[] of matching class."""
+    return (ctx.mw_zero_copy and v.iospec == 'i' and v.devicespec != 'g' and
+            _type_props(v.basetype).native_input)
+
+
+def _unpack_native_array(fp, v):
+    """Alias prhs[] when its class matches, else fall back to the copier."""
+    il = v.input_label
+    bt = v.basetype
+    tp = _type_props(bt)
+    cs = _copier_suffix(bt)
+    if complex_tinfo(v):
+        fp.write(f"#if MX_HAS_INTERLEAVED_COMPLEX\n"
+               f"        if (mxGetClassID(prhs[{il}]) == {tp.mxclass} && mxIsComplex(prhs[{il}]))\n"
+               f"            in{il}_ = ({bt}*) {tp.accessor}(prhs[{il}]);\n"
+               f"        else\n"
+               f"#endif\n"
+               f"        {{\n"
+               f"            if( mxGetClassID(prhs[{il}]) != {tp.mxclass} )\n"
+               f"                mw_err_txt_ = \"Invalid array argument, {tp.mxclass} expected\";\n"
+               f"            if (mw_err_txt_) goto mw_err_label;\n")
+    else:
+        fp.write(f"        if (mxGetClassID(prhs[{il}]) == {tp.mxclass} && !mxIsComplex(prhs[{il}]))\n"
+               f"            in{il}_ = ({bt}*) mxGetData(prhs[{il}]);\n"
+               f"        else {{\n")
+    fp.write(f"            in{il}_ = mxWrapGetArray_{cs}{bt}(prhs[{il}], &mw_err_txt_);\n"
+           f"            if (mw_err_txt_)\n"
+           f"                goto mw_err_label;\n"
+           f"        }}\n")
+
+
+def _in_place_inout(ctx, v):
+    """True if an inout array is updated in a duplicate of its prhs[] (-inplace).
+
+    Only float, double and complex arrays qualify: those are copied out in
+    their input class, while integer arrays come back as double."""
+    tp = _type_props(v.basetype)
+    return (ctx.mw_in_place and v.iospec == 'b' and is_array(v.tinfo) and
+            v.devicespec != 'g' and
+            (tp.direct_input or (tp.native_input and complex_tinfo(v))))
+
+
+def _unpack_in_place_array(fp, v):
+    """Duplicate prhs[] once and let the call mutate the copy's data."""
+    il = v.input_label
+    bt = v.basetype
+    tp = _type_props(bt)
+    cs = _copier_suffix(bt)
+    if complex_tinfo(v):
+        fp.write(f"#if MX_HAS_INTERLEAVED_COMPLEX\n"
+               f"        if (mxGetClassID(prhs[{il}]) == {tp.mxclass} && mxIsComplex(prhs[{il}])) {{\n"
+               f"            mxArray_in{il}_ = mxDuplicateArray(prhs[{il}]);\n"
+               f"            in{il}_ = ({bt}*) {tp.accessor}(mxArray_in{il}_);\n"
+               f"        }} else\n"
+               f"#endif\n"
+               f"        {{\n"
+               f"            if( mxGetClassID(prhs[{il}]) != {tp.mxclass} )\n"
+               f"                mw_err_txt_ = \"Invalid array argument, {tp.mxclass} expected\";\n"
+               f"            if (mw_err_txt_) goto mw_err_label;\n")
+    else:
+        fp.write(f"        if (mxGetClassID(prhs[{il}]) == {tp.mxclass} && !mxIsComplex(prhs[{il}])) {{\n"
+               f"            mxArray_in{il}_ = mxDuplicateArray(prhs[{il}]);\n"
+               f"            in{il}_ = ({bt}*) mxGetData(mxArray_in{il}_);\n"
+               f"        }} else {{\n")
+    fp.write(f"            in{il}_ = mxWrapGetArray_{cs}{bt}(prhs[{il}], &mw_err_txt_);\n"
+           f"            if (mw_err_txt_)\n"
+           f"                goto mw_err_label;\n"
+           f"        }}\n")
+
+
+def _unpack_input_array(fp, ctx, v):
     il = v.input_label
     bt = v.basetype
 
@@ -439,7 +956,11 @@ def _unpack_input_array(fp, v):
         tp = _type_props(bt)
         cs = _copier_suffix(bt)
         fp.write(f"    if (mxGetM(prhs[{il}])*mxGetN(prhs[{il}]) != 0) {{\n")
-        if complex_tinfo(v) and bt in TYPE_PROPS:
+        if _zero_copy_input(ctx, v):
+            _unpack_native_array(fp, v)
+        elif _in_place_inout(ctx, v):
+            _unpack_in_place_array(fp, v)
+        elif complex_tinfo(v) and bt in TYPE_PROPS:
             # Known complex types: class check + copier
             fp.write(f"        if( mxGetClassID(prhs[{il}]) != {tp.mxclass} )\n"
                    f"            mw_err_txt_ = \"Invalid array argument, {tp.mxclass} expected\";\n"
@@ -481,7 +1002,7 @@ def _unpack_input_array(fp, v):
                    f"    in{il}_ = ({cutype} *)mxGPUGetDataReadOnly(mxGPUArray_in{il}_);\n\n")
 
 
-def _unpack_input_string(fp, v):
+def _unpack_input_string(fp, ctx, v):
     il = v.input_label
     if not (v.qual and v.qual.args):
         fp.write(f"    in{il}_ = mxWrapGetString(prhs[{il}], &mw_err_txt_);\n"
@@ -489,7 +1010,7 @@ def _unpack_input_string(fp, v):
                f"        goto mw_err_label;\n")
     else:
         sz = _alloc_size_expr(v.qual.args)
-        fp.write(f"    in{il}_ = (char*) mxMalloc({sz}*sizeof(char));\n")
+        fp.write(f"    in{il}_ = (char*) {_temp_alloc(ctx)}({sz}*sizeof(char));\n")
         fp.write(f"    if (mxGetString(prhs[{il}], in{il}_, {sz}) != 0) {{\n"
                f"        mw_err_txt_ = \"Invalid string argument\";\n"
                f"        goto mw_err_label;\n"
@@ -504,7 +1025,7 @@ def _unpack_inputs_var(fp, ctx, args):
         if is_obj(v.tinfo):
             _cast_get_p(fp, ctx, v.basetype, v.input_label)
         elif is_array(v.tinfo):
-            _unpack_input_array(fp, v)
+            _unpack_input_array(fp, ctx, v)
         elif v.tinfo in (VT.scalar, VT.r_scalar, VT.p_scalar):
             il = v.input_label
             bt = v.basetype
@@ -529,9 +1050,14 @@ def _unpack_inputs_var(fp, ctx, args):
             cs = _copier_suffix(bt)
             fp.write(f"    mxWrapGetScalar_{cs}{bt}(&in{il}_, prhs[{il}]);\n\n")
         elif v.tinfo == VT.string:
-            _unpack_input_string(fp, v)
+            _unpack_input_string(fp, ctx, v)
         elif v.tinfo == VT.mx:
             fp.write(f"    in{v.input_label}_ = prhs[{v.input_label}];\n\n")
+        elif v.tinfo == VT.sparse:
+            il = v.input_label
+            fp.write(f"    mxWrapGetSparse(&in{il}_, prhs[{il}], &mw_err_txt_);\n"
+                   f"    if (mw_err_txt_)\n"
+                   f"        goto mw_err_label;\n\n")
 
 
 def _unpack_inputs(fp, ctx, f):
@@ -560,11 +1086,16 @@ def _alloc_output(fp, ctx, args, return_flag):
                 if not return_flag and is_obj(v.tinfo) and ctx.is_mxarray_type(v.basetype):
                     fp.write(f"    out{v.output_label}_ = mxWrapAlloc_{v.basetype}();\n")
                 elif is_array(v.tinfo):
-                    fp.write(f"    out{v.output_label}_ = ({v.basetype}*) mxMalloc({_alloc_size_expr(v.qual.args)}*sizeof({v.basetype}));\n")
+                    fp.write(f"    out{v.output_label}_ = ({v.basetype}*) {_temp_alloc(ctx)}({_alloc_size_expr(v.qual.args)}*sizeof({v.basetype}));\n")
                 elif v.tinfo == VT.rarray:
                     fp.write(f"    out{v.output_label}_ = ({v.basetype}*) NULL;\n")
                 elif v.tinfo == VT.string:
-                    fp.write(f"    out{v.output_label}_ = (char*) mxMalloc({_alloc_size_expr(v.qual.args)}*sizeof(char));\n")
+                    fp.write(f"    out{v.output_label}_ = (char*) {_temp_alloc(ctx)}({_alloc_size_expr(v.qual.args)}*sizeof(char));\n")
+                elif v.tinfo == VT.sparse:
+                    # C fills the CSC arrays of the result in place
+                    ol = v.output_label
+                    m, n, nz = (e.input_label for e in v.qual.args)
+                    fp.write(f"    plhs[{ol}] = mxWrapCreateSparse(&out{ol}_, dim{m}_, dim{n}_, dim{nz}_);\n")
             if v.devicespec == 'g':
                 da = v.qual.args
                 ndims = 2 if len(da) == 2 else 1
@@ -585,31 +1116,482 @@ def _alloc_outputs(fp, ctx, f):
     _alloc_output(fp, ctx, f.args, False)
 
 
+def _temp_alloc(ctx):
+    """Allocator for stub temporaries: the per-call arena with -arena."""
+    return "mxWrapTempAlloc" if ctx.mw_arena else "mxMalloc"
+
+
+def _hot(f):
+    """True if some call with this signature was declared 'hot'."""
+    return f.hot or any(fs.hot for fs in f.same)
+
+
+MEX_ARENA_DECLS = (
+    "/*\n"
+    " * Per-call scratch arena (-arena).  Temporaries of a stub are carved\n"
+    " * from a buffer in its stack frame, then from heap blocks, and are all\n"
+    " * released at mw_err_label.  Blocks of 'hot' stubs go back to a pool of\n"
+    " * power-of-two size classes that is kept across calls.\n"
+    " */\n"
+    "#include <stddef.h>\n\n"
+    "#ifndef MWRAP_ARENA_STACK\n"
+    "#define MWRAP_ARENA_STACK 1024\n"
+    "#endif\n\n"
+    "typedef struct mwArenaBlock_t {\n"
+    "    struct mwArenaBlock_t* next;\n"
+    "    int cls;                    /* pool size class, or -1 */\n"
+    "    double data[1];\n"
+    "} mwArenaBlock_t;\n\n"
+    "typedef struct mwArena_t {\n"
+    "    size_t used;                /* doubles taken from stack */\n"
+    "    int hot;\n"
+    "    mwArenaBlock_t* blocks;\n"
+    "    double stack[MWRAP_ARENA_STACK / sizeof(double)];\n"
+    "} mwArena_t;\n\n"
+    "void  mwArenaEnter_(mwArena_t* a, int hot);\n"
+    "void* mwArenaAlloc_(size_t n);\n"
+    "void  mwArenaRelease_(mwArena_t* a);\n"
+    "#define mxWrapTempAlloc(n) mwArenaAlloc_(n)\n\n"
+)
+
+MEX_ARENA = (
+    "#include <stdlib.h>\n\n"
+    "#ifndef MWRAP_POOL_CLASSES\n"
+    "#define MWRAP_POOL_CLASSES 16     /* 64 bytes to 2 MB */\n"
+    "#endif\n"
+    "#ifndef MWRAP_POOL_DEPTH\n"
+    "#define MWRAP_POOL_DEPTH 4        /* blocks kept per class */\n"
+    "#endif\n\n"
+    "static mwArena_t* mwArena_ = NULL;\n"
+    "static mwArenaBlock_t* mwArenaPool_[MWRAP_POOL_CLASSES];\n"
+    "static int mwArenaPooled_[MWRAP_POOL_CLASSES];\n\n"
+    "void mwArenaEnter_(mwArena_t* a, int hot)\n"
+    "{\n"
+    "    a->used = 0;\n"
+    "    a->hot = hot;\n"
+    "    a->blocks = NULL;\n"
+    "    mwArena_ = a;\n"
+    "}\n\n"
+    "static int mwArenaClass_(size_t n)\n"
+    "{\n"
+    "    int c = 0;\n"
+    "    while (((size_t) 64 << c) < n)\n"
+    "        if (++c == MWRAP_POOL_CLASSES)\n"
+    "            return -1;\n"
+    "    return c;\n"
+    "}\n\n"
+    "void* mwArenaAlloc_(size_t n)\n"
+    "{\n"
+    "    mwArena_t* a = mwArena_;\n"
+    "    mwArenaBlock_t* b = NULL;\n"
+    "    size_t nd = (n + sizeof(double)-1) / sizeof(double);\n"
+    "    int c = -1;\n"
+    "    if (!a)\n"
+    "        return mxMalloc(n);\n"
+    "    if (nd <= MWRAP_ARENA_STACK / sizeof(double) - a->used) {\n"
+    "        void* p = a->stack + a->used;\n"
+    "        a->used += nd;\n"
+    "        return p;\n"
+    "    }\n"
+    "    if (a->hot && (c = mwArenaClass_(n)) >= 0) {\n"
+    "        if ((b = mwArenaPool_[c]) != NULL) {\n"
+    "            mwArenaPool_[c] = b->next;\n"
+    "            --mwArenaPooled_[c];\n"
+    "        } else {\n"
+    "            b = (mwArenaBlock_t*) malloc(offsetof(mwArenaBlock_t, data) +\n"
+    "                                         ((size_t) 64 << c));\n"
+    "        }\n"
+    "    }\n"
+    "    if (!b) {\n"
+    "        c = -1;\n"
+    "        b = (mwArenaBlock_t*) mxMalloc(offsetof(mwArenaBlock_t, data) + n);\n"
+    "    }\n"
+    "    b->cls = c;\n"
+    "    b->next = a->blocks;\n"
+    "    a->blocks = b;\n"
+    "    return b->data;\n"
+    "}\n\n"
+    "void mwArenaRelease_(mwArena_t* a)\n"
+    "{\n"
+    "    mwArenaBlock_t* b;\n"
+    "    while ((b = a->blocks) != NULL) {\n"
+    "        a->blocks = b->next;\n"
+    "        if (b->cls < 0) {\n"
+    "            mxFree(b);\n"
+    "        } else if (mwArenaPooled_[b->cls] < MWRAP_POOL_DEPTH) {\n"
+    "            mwAtExitRegister_();\n"
+    "            b->next = mwArenaPool_[b->cls];\n"
+    "            mwArenaPool_[b->cls] = b;\n"
+    "            ++mwArenaPooled_[b->cls];\n"
+    "        } else {\n"
+    "            free(b);\n"
+    "        }\n"
+    "    }\n"
+    "    mwArena_ = NULL;\n"
+    "}\n\n"
+    "/* Free the pooled blocks of 'hot' stubs */\n"
+    "static void mwArenaDrain_(void)\n"
+    "{\n"
+    "    mwArenaBlock_t* b;\n"
+    "    int c;\n"
+    "    for (c = 0; c < MWRAP_POOL_CLASSES; ++c) {\n"
+    "        while ((b = mwArenaPool_[c]) != NULL) {\n"
+    "            mwArenaPool_[c] = b->next;\n"
+    "            free(b);\n"
+    "        }\n"
+    "        mwArenaPooled_[c] = 0;\n"
+    "    }\n"
+    "}\n\n"
+)
+
+
+# --- The mexAtExit handler (-threads, -arena) ---
+
+MEX_AT_EXIT_DECL = (
+    "/* Registers mwAtExit_, which stops the thread pool and frees the\n"
+    " * arena pool; MATLAB keeps only one mexAtExit handler */\n"
+    "static void mwAtExitRegister_(void);\n\n"
+)
+
+
+def mex_at_exit(fp, ctx):
+    """Write the one mexAtExit handler, for the pools that are enabled."""
+    fp.write("static int mwAtExitSet_ = 0;\n\n"
+             "static void mwAtExit_(void)\n"
+             "{\n")
+    if ctx.mw_threads:
+        fp.write("    mwPoolStop_();\n")
+    if ctx.mw_arena:
+        fp.write("    mwArenaDrain_();\n")
+    fp.write("}\n\n"
+             "static void mwAtExitRegister_(void)\n"
+             "{\n"
+             "    if (!mwAtExitSet_) {\n"
+             "        mexAtExit(mwAtExit_);\n"
+             "        mwAtExitSet_ = 1;\n"
+             "    }\n"
+             "}\n\n")
+
+
+# --- Thread pool for large copies (-threads) ---
+
+MEX_THREADS_DECLS = (
+    "/* Run the array copy kernels through the thread pool (-threads) */\n"
+    "#define mxWrapParallel(k, c, n) mwParallel_(k, c, n)\n\n"
+)
+
+MEX_THREADS = (
+    "/*\n"
+    " * Thread pool for large copies (-threads).  Copies of MWRAP_PAR_MIN or\n"
+    " * more elements are split into one range per thread; the calling thread\n"
+    " * takes the first range and pool workers the others.  The thread count\n"
+    " * comes from MWRAP_THREADS in the environment, else the number of online\n"
+    " * processors, up to MWRAP_MAX_THREADS; mex('*threads*', n, min) sets\n"
+    " * both.  Without POSIX threads, copies run serially.\n"
+    " */\n"
+    "#include <stdlib.h>\n\n"
+    "#ifndef MWRAP_PAR_MIN\n"
+    "#define MWRAP_PAR_MIN 1048576    /* elements */\n"
+    "#endif\n"
+    "#ifndef MWRAP_MAX_THREADS\n"
+    "#define MWRAP_MAX_THREADS 16\n"
+    "#endif\n\n"
+    "void mwParallel_(mxWrapKernel_t k, const mxWrapCopyJob_t* c, mwSize n);\n\n"
+    "static int mwThreads_ = 0;        /* 0 until first use */\n"
+    "static mwSize mwParMin_ = MWRAP_PAR_MIN;\n\n"
+    "static void mwThreadsSet_(long n)\n"
+    "{\n"
+    "    mwThreads_ = n < 1 ? 1 : n > MWRAP_MAX_THREADS ? MWRAP_MAX_THREADS : (int) n;\n"
+    "}\n\n"
+    "#ifdef _WIN32\n\n"
+    "static void mwThreadsInit_(void)\n"
+    "{\n"
+    "    mwThreadsSet_(1);\n"
+    "}\n\n"
+    "static void mwPoolStop_(void)\n"
+    "{\n"
+    "}\n\n"
+    "void mwParallel_(mxWrapKernel_t k, const mxWrapCopyJob_t* c, mwSize n)\n"
+    "{\n"
+    "    k(c, 0, n);\n"
+    "}\n\n"
+    "#else\n\n"
+    "#include <pthread.h>\n"
+    "#include <unistd.h>\n\n"
+    "static pthread_t mwPool_[MWRAP_MAX_THREADS];\n"
+    "static unsigned long mwPoolSeen_[MWRAP_MAX_THREADS];  /* last job per worker */\n"
+    "static int mwPoolSize_ = 0;       /* workers 1..mwPoolSize_ running */\n"
+    "static pthread_mutex_t mwPoolBusy_ = PTHREAD_MUTEX_INITIALIZER;\n"
+    "static pthread_mutex_t mwPoolLock_ = PTHREAD_MUTEX_INITIALIZER;\n"
+    "static pthread_cond_t mwPoolWork_ = PTHREAD_COND_INITIALIZER;\n"
+    "static pthread_cond_t mwPoolDone_ = PTHREAD_COND_INITIALIZER;\n\n"
+    "/* Current job, guarded by mwPoolLock_ */\n"
+    "static unsigned long mwPoolJob_ = 0;\n"
+    "static int mwPoolQuit_ = 0;\n"
+    "static int mwPoolParts_ = 0;\n"
+    "static int mwPoolLeft_ = 0;       /* worker ranges not yet done */\n"
+    "static mxWrapKernel_t mwPoolKernel_;\n"
+    "static const mxWrapCopyJob_t* mwPoolCopy_;\n"
+    "static mwSize mwPoolN_, mwPoolChunk_;\n\n"
+    "static void mwThreadsInit_(void)\n"
+    "{\n"
+    "    const char* s = getenv(\"MWRAP_THREADS\");\n"
+    "    mwThreadsSet_(s ? atol(s) : sysconf(_SC_NPROCESSORS_ONLN));\n"
+    "}\n\n"
+    "static void mwPoolRange_(int r)\n"
+    "{\n"
+    "    mwSize lo = mwPoolChunk_ * r;\n"
+    "    mwSize hi = lo + mwPoolChunk_;\n"
+    "    if (lo >= mwPoolN_)\n"
+    "        return;\n"
+    "    mwPoolKernel_(mwPoolCopy_, lo, hi < mwPoolN_ ? hi : mwPoolN_);\n"
+    "}\n\n"
+    "static void* mwPoolWorker_(void* arg)\n"
+    "{\n"
+    "    int r = (int) (size_t) arg;\n"
+    "    pthread_mutex_lock(&mwPoolLock_);\n"
+    "    for (;;) {\n"
+    "        while (!mwPoolQuit_ && mwPoolJob_ == mwPoolSeen_[r])\n"
+    "            pthread_cond_wait(&mwPoolWork_, &mwPoolLock_);\n"
+    "        if (mwPoolQuit_)\n"
+    "            break;\n"
+    "        mwPoolSeen_[r] = mwPoolJob_;\n"
+    "        if (r < mwPoolParts_) {\n"
+    "            pthread_mutex_unlock(&mwPoolLock_);\n"
+    "            mwPoolRange_(r);\n"
+    "            pthread_mutex_lock(&mwPoolLock_);\n"
+    "            if (--mwPoolLeft_ == 0)\n"
+    "                pthread_cond_signal(&mwPoolDone_);\n"
+    "        }\n"
+    "    }\n"
+    "    pthread_mutex_unlock(&mwPoolLock_);\n"
+    "    return NULL;\n"
+    "}\n\n"
+    "/* Join the workers; the pool restarts on the next large copy */\n"
+    "static void mwPoolStop_(void)\n"
+    "{\n"
+    "    int r;\n"
+    "    pthread_mutex_lock(&mwPoolLock_);\n"
+    "    mwPoolQuit_ = 1;\n"
+    "    pthread_cond_broadcast(&mwPoolWork_);\n"
+    "    pthread_mutex_unlock(&mwPoolLock_);\n"
+    "    for (r = 1; r <= mwPoolSize_; ++r)\n"
+    "        pthread_join(mwPool_[r], NULL);\n"
+    "    mwPoolSize_ = 0;\n"
+    "    mwPoolQuit_ = 0;\n"
+    "}\n\n"
+    "/* Start workers up to number n; return how many are running */\n"
+    "static int mwPoolGrow_(int n)\n"
+    "{\n"
+    "    mwAtExitRegister_();\n"
+    "    while (mwPoolSize_ < n) {\n"
+    "        int r = mwPoolSize_ + 1;\n"
+    "        mwPoolSeen_[r] = mwPoolJob_;\n"
+    "        if (pthread_create(&mwPool_[r], NULL, mwPoolWorker_, (void*) (size_t) r) != 0)\n"
+    "            break;\n"
+    "        mwPoolSize_ = r;\n"
+    "    }\n"
+    "    return mwPoolSize_;\n"
+    "}\n\n"
+    "void mwParallel_(mxWrapKernel_t k, const mxWrapCopyJob_t* c, mwSize n)\n"
+    "{\n"
+    "    int parts;\n"
+    "    if (!mwThreads_)\n"
+    "        mwThreadsInit_();\n"
+    "    if (n < mwParMin_ || mwThreads_ < 2 ||\n"
+    "            pthread_mutex_trylock(&mwPoolBusy_) != 0) {\n"
+    "        k(c, 0, n);\n"
+    "        return;\n"
+    "    }\n"
+    "    parts = mwPoolGrow_(mwThreads_ - 1) + 1;\n"
+    "    pthread_mutex_lock(&mwPoolLock_);\n"
+    "    mwPoolKernel_ = k;\n"
+    "    mwPoolCopy_ = c;\n"
+    "    mwPoolN_ = n;\n"
+    "    mwPoolChunk_ = ((n + parts-1) / parts + 63) / 64 * 64;\n"
+    "    mwPoolParts_ = parts;\n"
+    "    mwPoolLeft_ = parts - 1;\n"
+    "    ++mwPoolJob_;\n"
+    "    pthread_cond_broadcast(&mwPoolWork_);\n"
+    "    pthread_mutex_unlock(&mwPoolLock_);\n"
+    "    mwPoolRange_(0);\n"
+    "    pthread_mutex_lock(&mwPoolLock_);\n"
+    "    while (mwPoolLeft_ > 0)\n"
+    "        pthread_cond_wait(&mwPoolDone_, &mwPoolLock_);\n"
+    "    pthread_mutex_unlock(&mwPoolLock_);\n"
+    "    pthread_mutex_unlock(&mwPoolBusy_);\n"
+    "}\n\n"
+    "#endif\n\n"
+    "/* mex('*threads*' [, n [, min]]): set or report the pool settings */\n"
+    "static void mwThreadsCommand_(int nlhs, mxArray* plhs[],\n"
+    "                              int nrhs, const mxArray* prhs[])\n"
+    "{\n"
+    "    if (!mwThreads_)\n"
+    "        mwThreadsInit_();\n"
+    "    if (nrhs > 1) {\n"
+    "        mwPoolStop_();\n"
+    "        mwThreadsSet_((long) mxGetScalar(prhs[1]));\n"
+    "    }\n"
+    "    if (nrhs > 2)\n"
+    "        mwParMin_ = (mwSize) mxGetScalar(prhs[2]);\n"
+    "    if (nlhs > 0) {\n"
+    "        plhs[0] = mxCreateDoubleMatrix(1, 2, mxREAL);\n"
+    "        mxGetPr(plhs[0])[0] = mwThreads_;\n"
+    "        mxGetPr(plhs[0])[1] = (double) mwParMin_;\n"
+    "    } else if (nrhs < 2) {\n"
+    "        mexPrintf(\"%d threads for copies of %.0f or more elements\\n\",\n"
+    "                  mwThreads_, (double) mwParMin_);\n"
+    "    }\n"
+    "}\n\n"
+)
+
+
 # --- Step 7: Profiler ---
 
-def _record_call(fp, f):
+def _record_call(fp, ctx, f):
     fp.write(f"    if (mexprofrecord_)\n"
            f"        mexprofrecord_[{f.id}]++;\n")
+    if ctx.mw_timing:
+        _stamp_time(fp, 1)
+
+
+def _stamp_time(fp, phase):
+    fp.write(f"    if (mwProfStats_)\n"
+           f"        mw_prof_t_[{phase}] = mwProfNow_();\n")
+
+
+def _record_time(fp, f):
+    fp.write(f"    if (mwProfStats_) {{\n"
+           f"        mw_prof_t_[3] = mwProfNow_();\n"
+           f"        mwProfRecord_(mwProfStats_ + {f.id}, mw_prof_t_);\n"
+           f"    }}\n")
+
+
+MEX_PROF_CLOCK = (
+    "/*\n"
+    " * Per-stub timing records (-timing).  Times are in nanoseconds from a\n"
+    " * monotonic clock where there is one; MWRAP_PROF_CLOCK names the clock\n"
+    " * in the profile report.  hist[k] counts calls taking [2^k, 2^(k+1)) ns.\n"
+    " */\n"
+    "#if defined(_WIN32)\n"
+    "#include <windows.h>\n"
+    "#define MWRAP_PROF_CLOCK \"QueryPerformanceCounter\"\n"
+    "static uint64_t mwProfNow_(void)\n"
+    "{\n"
+    "    LARGE_INTEGER c, f;\n"
+    "    QueryPerformanceCounter(&c);\n"
+    "    QueryPerformanceFrequency(&f);\n"
+    "    return (uint64_t) (c.QuadPart / f.QuadPart) * 1000000000u +\n"
+    "        (uint64_t) (c.QuadPart % f.QuadPart) * 1000000000u / f.QuadPart;\n"
+    "}\n"
+    "#else\n"
+    "#include <time.h>\n"
+    "#ifdef CLOCK_MONOTONIC\n"
+    "#define MWRAP_PROF_CLOCK \"CLOCK_MONOTONIC\"\n"
+    "static uint64_t mwProfNow_(void)\n"
+    "{\n"
+    "    struct timespec ts;\n"
+    "    clock_gettime(CLOCK_MONOTONIC, &ts);\n"
+    "    return (uint64_t) ts.tv_sec * 1000000000u + (uint64_t) ts.tv_nsec;\n"
+    "}\n"
+    "#else\n"
+    "/* Strict ISO C mode hides clock_gettime; fall back to processor time */\n"
+    "#define MWRAP_PROF_CLOCK \"clock() (processor time, not wall time)\"\n"
+    "static uint64_t mwProfNow_(void)\n"
+    "{\n"
+    "    return (uint64_t) ((double) clock() * (1e9 / CLOCKS_PER_SEC));\n"
+    "}\n"
+    "#endif\n"
+    "#endif\n\n"
+)
+
+MEX_PROF_TYPES = (
+    "typedef struct mwProfStat_t {\n"
+    "    uint64_t calls;\n"
+    "    uint64_t unpack_ns;\n"
+    "    uint64_t call_ns;\n"
+    "    uint64_t marshal_ns;\n"
+    "    uint64_t max_ns;\n"
+    "    uint64_t hist[32];\n"
+    "} mwProfStat_t;\n\n"
+)
+
+MEX_PROF_STATS = "mwProfStat_t* mwProfStats_ = NULL;\n\n"
+
+MEX_PROF_RECORD = (
+    "static void mwProfRecord_(mwProfStat_t* s, const uint64_t* t)\n"
+    "{\n"
+    "    uint64_t total = t[3]-t[0];\n"
+    "    int k = 0;\n"
+    "    while (k < 31 && (total >> (k+1)))\n"
+    "        ++k;\n"
+    "    s->calls++;\n"
+    "    s->unpack_ns  += t[1]-t[0];\n"
+    "    s->call_ns    += t[2]-t[1];\n"
+    "    s->marshal_ns += t[3]-t[2];\n"
+    "    if (total > s->max_ns)\n"
+    "        s->max_ns = total;\n"
+    "    s->hist[k]++;\n"
+    "}\n\n"
+)
+
+MEX_PROF_REPORT = (
+    "static const char* mwProfFormat_(char* buf, size_t n, const mwProfStat_t* s)\n"
+    "{\n"
+    "    size_t len;\n"
+    "    int k;\n"
+    "    snprintf(buf, n, \"    %.0f timed; ms unpack %.3f, call %.3f, \"\n"
+    "             \"marshal %.3f, max %.3f\\n    log2(ns) histogram:\",\n"
+    "             (double) s->calls, s->unpack_ns*1e-6, s->call_ns*1e-6,\n"
+    "             s->marshal_ns*1e-6, s->max_ns*1e-6);\n"
+    "    for (k = 0; k < 32; ++k) {\n"
+    "        len = strlen(buf);\n"
+    "        if (s->hist[k] && len < n)\n"
+    "            snprintf(buf+len, n-len, \" %d:%.0f\", k, (double) s->hist[k]);\n"
+    "    }\n"
+    "    len = strlen(buf);\n"
+    "    if (len < n)\n"
+    "        snprintf(buf+len, n-len, \"\\n\");\n"
+    "    return buf;\n"
+    "}\n\n"
+    "static mxArray* mwProfCounts_(const uint64_t* v, int n)\n"
+    "{\n"
+    "    mxArray* a = mxCreateNumericMatrix(1, n, mxUINT64_CLASS, mxREAL);\n"
+    "    memcpy(mxGetData(a), v, n*sizeof(uint64_t));\n"
+    "    return a;\n"
+    "}\n\n"
+    "static void mwProfSetStats_(mxArray* a, int i, const char* id,\n"
+    "                            const char* where, const mwProfStat_t* s)\n"
+    "{\n"
+    "    mxSetField(a, i, \"id\",         mxCreateString(id));\n"
+    "    mxSetField(a, i, \"where\",      mxCreateString(where));\n"
+    "    mxSetField(a, i, \"calls\",      mwProfCounts_(&s->calls, 1));\n"
+    "    mxSetField(a, i, \"unpack_ns\",  mwProfCounts_(&s->unpack_ns, 1));\n"
+    "    mxSetField(a, i, \"call_ns\",    mwProfCounts_(&s->call_ns, 1));\n"
+    "    mxSetField(a, i, \"marshal_ns\", mwProfCounts_(&s->marshal_ns, 1));\n"
+    "    mxSetField(a, i, \"max_ns\",     mwProfCounts_(&s->max_ns, 1));\n"
+    "    mxSetField(a, i, \"hist\",       mwProfCounts_(s->hist, 32));\n"
+    "}\n\n"
+)
 
 
 # --- Step 8: Make the call ---
 
+def _call_arg(v):
+    if v.tinfo in (VT.obj, VT.r_obj):
+        return f"*{vname(v)}"
+    if v.tinfo == VT.mx and v.iospec == 'o':
+        return f"plhs+{v.output_label}"
+    if v.tinfo in (VT.p_scalar, VT.p_cscalar, VT.p_zscalar, VT.sparse):
+        return f"&{vname(v)}"
+    if v.tinfo == VT.const:
+        return v.name
+    return vname(v)
+
+
 def _make_call_args(fp, args, first):
-    for v in args:
-        if not first:
-            fp.write(", ")
-        n = vname(v)
-        if v.tinfo in (VT.obj, VT.r_obj):
-            fp.write(f"*{n}")
-        elif v.tinfo == VT.mx and v.iospec == 'o':
-            fp.write(f"plhs+{v.output_label}")
-        elif v.tinfo in (VT.p_scalar, VT.p_cscalar, VT.p_zscalar):
-            fp.write(f"&{n}")
-        elif v.tinfo == VT.const:
-            fp.write(v.name)
-        else:
-            fp.write(n)
-        first = False
+    if args:
+        fp.write(("" if first else ", ") + ", ".join(map(_call_arg, args)))
 
 
 def _make_call_expr(fp, f):
@@ -656,6 +1638,12 @@ def _make_stmt(fp, ctx, f):
                 fp.write(f" dim{args[0].input_label}_, dim{args[1].input_label}_);\n")
             else:
                 fp.write(f"{_alloc_size_expr(args)}, 1);\n")
+            if len(args) > 2:
+                # A NULL result comes back empty and keeps its shape
+                _write_shape(fp, "    ", args)
+                fp.write(f"        if (mxGetNumberOfElements(plhs[0]) == {_alloc_size_expr(args)})\n"
+                       f"            mxSetDimensions(plhs[0], shape_, {len(args)});\n"
+                       f"    }}\n")
         elif v.tinfo in (VT.scalar, VT.r_scalar, VT.cscalar, VT.r_cscalar, VT.zscalar, VT.r_zscalar):
             fp.write("    out0_ = ")
             _make_call_expr(fp, f)
@@ -705,7 +1693,16 @@ def _make_stmt(fp, ctx, f):
 
 # --- Step 9: Marshal results ---
 
-def _marshal_array(fp, v):
+def _write_shape(fp, ws, da):
+    """Open a block declaring shape_, the dimensions *da* (C89 has no
+    initializers with variables)."""
+    fp.write(f"{ws}{{\n"
+             f"{ws}    mwSize shape_[{len(da)}];\n")
+    for k, e in enumerate(da):
+        fp.write(f"{ws}    shape_[{k}] = dim{e.input_label}_;\n")
+
+
+def _marshal_array(fp, ctx, v):
     il = v.input_label
     ol = v.output_label
     bt = v.basetype
@@ -716,6 +1713,17 @@ def _marshal_array(fp, v):
         mtype = "mxCOMPLEX" if complex_tinfo(v) else "mxREAL"
         ws = "    "
         is_single = _type_props(bt).is_single
+        in_place = _in_place_inout(ctx, v)
+
+        if in_place:
+            ws = "        "
+            fp.write(f"    if (mxArray_in{il}_) {{\n"
+                   f"        plhs[{ol}] = mxArray_in{il}_;\n")
+            # N-d inputs already have the declared shape
+            if len(da) == 1:
+                fp.write(f"        mxSetM(plhs[{ol}], {_alloc_size_expr(da)});\n"
+                       f"        mxSetN(plhs[{ol}], 1);\n")
+            fp.write(f"    }} else {{\n")
 
         if v.tinfo == VT.rarray:
             ws = "        "
@@ -754,18 +1762,19 @@ def _marshal_array(fp, v):
             fp.write(f"dim{da[0].input_label}_*dim{da[1].input_label}_")
             fp.write(");\n")
         else:
-            # 3D+ — flatten to 1D
-            sz = _alloc_size_expr(da)
+            # 3D+ (-nd)
+            mxcid = "mxSINGLE_CLASS" if is_single else "mxDOUBLE_CLASS"
+            _write_shape(fp, ws, da)
+            fp.write(f"{ws}    plhs[{ol}] = mxCreateNumericArray({len(da)}, shape_, {mxcid}, {mtype});\n"
+                   f"{ws}}}\n")
             if is_single:
-                fp.write(f"{ws}plhs[{ol}] = mxCreateNumericMatrix({sz}, 1, mxSINGLE_CLASS, {mtype});\n")
                 fp.write(f"{ws}mxWrapCopy_single_{bt}(plhs[{ol}], {n}, ")
             else:
-                fp.write(f"{ws}plhs[{ol}] = mxCreateDoubleMatrix({sz}, 1, {mtype});\n")
                 fp.write(f"{ws}mxWrapCopy_{bt}(plhs[{ol}], {n}, ")
-            fp.write(sz)
+            fp.write(_alloc_size_expr(da))
             fp.write(");\n")
 
-        if v.tinfo == VT.rarray:
+        if v.tinfo == VT.rarray or in_place:
             fp.write("    }\n")
 
     # GPU marshal
@@ -784,10 +1793,12 @@ def _marshal_result(fp, ctx, v, return_flag):
     if is_obj(v.tinfo) and ctx.is_mxarray_type(bt):
         if not return_flag:
             fp.write(f"    plhs[{ol}] = mxWrapSet_{bt}({n});\n")
+    elif is_obj(v.tinfo) and ctx.mw_bin_handles:
+        fp.write(f"    plhs[{ol}] = mxWrapCreateH(out{ol}_, {handle_tag(bt)});\n")
     elif is_obj(v.tinfo):
         fp.write(f"    plhs[{ol}] = mxWrapCreateP(out{ol}_, \"{bt}:%p\");\n")
     elif is_array(v.tinfo) or v.tinfo == VT.rarray:
-        _marshal_array(fp, v)
+        _marshal_array(fp, ctx, v)
     elif v.tinfo in (VT.scalar, VT.r_scalar, VT.p_scalar):
         _interleaved_branch(fp,
             f"    plhs[{ol}] = mxCreateDoubleMatrix(1, 1, mxREAL);\n"
@@ -826,8 +1837,16 @@ def _dealloc_var(fp, ctx, vars, return_flag):
     for v in vars:
         if v.devicespec != 'g':
             if is_array(v.tinfo) or v.tinfo == VT.string:
-                if v.iospec == 'o':
+                if ctx.mw_arena:
+                    pass    # released with the arena
+                elif v.iospec == 'o':
                     fp.write(f"    if (out{v.output_label}_) mxFree(out{v.output_label}_);\n")
+                elif _zero_copy_input(ctx, v):
+                    il = v.input_label
+                    fp.write(f"    if (in{il}_ && (void*) in{il}_ != mxGetData(prhs[{il}]))  mxFree(in{il}_);\n")
+                elif _in_place_inout(ctx, v):
+                    il = v.input_label
+                    fp.write(f"    if (in{il}_ && !mxArray_in{il}_)  mxFree(in{il}_);\n")
                 elif v.iospec == 'b' or not (v.basetype == "double" or v.basetype == "float"):
                     fp.write(f"    if (in{v.input_label}_)  mxFree(in{v.input_label}_);\n")
             elif is_obj(v.tinfo) and ctx.is_mxarray_type(v.basetype):
@@ -846,6 +1865,8 @@ def _dealloc(fp, ctx, f):
     if not nullable_return(f):
         _dealloc_var(fp, ctx, f.ret, True)
     _dealloc_var(fp, ctx, f.args, False)
+    if ctx.mw_arena:
+        fp.write("    mwArenaRelease_(&mw_arena_);\n")
 
 
 # ===================================================================
@@ -862,23 +1883,42 @@ def _print_c_comment(fp, f):
     fp.write(" */\n")
 
 
-def _print_mex_stub(fp, ctx, f):
-    _print_c_comment(fp, f)
+def _print_stub_id(fp, ctx, f):
     ids = id_string(ctx, f)
     fp.write(f"static const char* stubids{f.id}_ = \"{ids}\";\n\n")
+
+
+def _print_mex_stub(fp, ctx, f):
+    _print_c_comment(fp, f)
+    if not ctx.mw_split:
+        _print_stub_id(fp, ctx, f)
     fp.write(f"void mexStub{f.id}(int nlhs, mxArray* plhs[],\n"
            f"              int nrhs, const mxArray* prhs[])\n"
            f"{{\n"
            f"    const char* mw_err_txt_ = 0;\n")
-    _declare_args(fp, f)
-    _unpack_dims(fp, f)
+    if ctx.mw_timing:
+        fp.write("    uint64_t    mw_prof_t_[4];\n")
+    if ctx.mw_arena:
+        fp.write("    mwArena_t   mw_arena_;\n")
+    _declare_args(fp, ctx, f)
+    if ctx.mw_arena:
+        fp.write(f"    mwArenaEnter_(&mw_arena_, {int(_hot(f))});\n\n")
+    if ctx.mw_timing:
+        _stamp_time(fp, 0)
+    _unpack_dims(fp, ctx, f)
     _check_dims(fp, f.args)
     _unpack_inputs(fp, ctx, f)
     _check_inputs(fp, f.args)
     _alloc_outputs(fp, ctx, f)
-    _record_call(fp, f)
+    _record_call(fp, ctx, f)
     _make_stmt(fp, ctx, f)
+    if ctx.mw_registry:
+        _retire_handles(fp, ctx, f)
+    if ctx.mw_timing:
+        _stamp_time(fp, 2)
     _marshal_results(fp, ctx, f)
+    if ctx.mw_timing:
+        _record_time(fp, f)
     fp.write("\nmw_err_label:\n")
     _dealloc(fp, ctx, f)
     fp.write("    if (mw_err_txt_)\n"
@@ -886,13 +1926,156 @@ def _print_mex_stub(fp, ctx, f):
            "}\n\n")
 
 
+# ===================================================================
+# Batched stubs for vectorized calls
+# ===================================================================
+
+# C type of the data behind each scalar class accepted by the batched stubs
+_BATCH_CTYPES = {
+    "mxDOUBLE_CLASS": "double",
+    "mxSINGLE_CLASS": "float",
+    "mxCHAR_CLASS":   "mxChar",
+}
+
+
+def _batched(f):
+    """True if some call with this signature was declared 'vectorize'."""
+    return f.vectorize or any(fs.vectorize for fs in f.same)
+
+
+def _batch_inputs(f):
+    return [v for v in f.args if v.iospec != 'o' and v.tinfo != VT.const]
+
+
+def _batch_outputs(f):
+    return [v for v in f.ret + f.args if v.iospec != 'i']
+
+
+def _indent(text, ws="    "):
+    return "".join(ws + line if line.strip() else line
+                   for line in text.splitlines(True))
+
+
+def _unpack_batch_input(fp, v):
+    il = v.input_label
+    tp = _type_props(v.basetype)
+    ct = _BATCH_CTYPES[tp.scalar_class]
+    fp.write(f"    if (mxGetClassID(prhs[{il}]) != {tp.scalar_class} || mxIsComplex(prhs[{il}])) {{\n"
+           f"        mw_err_txt_ = \"Invalid scalar argument, {tp.scalar_class} expected\";\n"
+           f"        goto mw_err_label;\n"
+           f"    }}\n"
+           f"    bstep{il}_ = (mxGetNumberOfElements(prhs[{il}]) != 1);\n"
+           f"    if (bstep{il}_) {{\n"
+           f"        if (mw_dims_ != mw_one_ && mxGetNumberOfElements(prhs[{il}]) != mw_n_) {{\n"
+           f"            mw_err_txt_ = \"Bad argument size: {v.name}\";\n"
+           f"            goto mw_err_label;\n"
+           f"        }}\n"
+           f"        mw_n_ = mxGetNumberOfElements(prhs[{il}]);\n"
+           f"        mw_ndims_ = mxGetNumberOfDimensions(prhs[{il}]);\n"
+           f"        mw_dims_ = mxGetDimensions(prhs[{il}]);\n"
+           f"    }}\n"
+           f"    bin{il}_ = (const {ct}*) mxGetData(prhs[{il}]);\n\n")
+
+
+def _print_mex_batch_stub(fp, ctx, f):
+    """Emit mexStubB<id>: the stub for f looped over arrays of scalars.
+
+    Every input may be a scalar or an array; the arrays must agree in size
+    and the outputs take their shape.
+    """
+    ins = _batch_inputs(f)
+    outs = _batch_outputs(f)
+    fp.write(f"/* ---- Batched mexStub{f.id} ----\n"
+             f" * {print_func(f)}"
+             f" */\n"
+             f"void mexStubB{f.id}(int nlhs, mxArray* plhs[],\n"
+             f"               int nrhs, const mxArray* prhs[])\n"
+             f"{{\n"
+             f"    const char* mw_err_txt_ = 0;\n")
+    if ctx.mw_timing:
+        fp.write("    uint64_t    mw_prof_t_[4];\n")
+    _declare_args(fp, ctx, f)
+    for v in ins:
+        ct = _BATCH_CTYPES[_type_props(v.basetype).scalar_class]
+        fp.write(f"    {'const ' + ct + '*':13s} bin{v.input_label}_;   /* {v.name:10s} */\n"
+                 f"    {'mwSize':13s} bstep{v.input_label}_;\n")
+    for v in outs:
+        fp.write(f"    {'double*':13s} bout{v.output_label}_;  /* {v.name:10s} */\n")
+    fp.write("    mwSize        mw_n_ = 1, mw_i_;\n"
+             "    mwSize        mw_ndims_ = 2;\n"
+             "    mwSize        mw_one_[2] = {1, 1};\n"
+             "    const mwSize* mw_dims_ = mw_one_;\n\n")
+    if ctx.mw_timing:
+        _stamp_time(fp, 0)
+    for v in ins:
+        _unpack_batch_input(fp, v)
+    for v in outs:
+        ol = v.output_label
+        fp.write(f"    plhs[{ol}] = mxCreateNumericArray(mw_ndims_, mw_dims_, mxDOUBLE_CLASS, mxREAL);\n"
+                 f"    bout{ol}_ = (double*) mxGetData(plhs[{ol}]);\n")
+    if outs:
+        fp.write("\n")
+    _record_call(fp, ctx, f)
+
+    fp.write("    for (mw_i_ = 0; mw_i_ < mw_n_; ++mw_i_) {\n")
+    for v in ins:
+        il = v.input_label
+        fp.write(f"        in{il}_ = ({v.basetype}) bin{il}_[mw_i_*bstep{il}_];\n")
+    stmt = io.StringIO()
+    _make_stmt(stmt, ctx, f)
+    fp.write(_indent(stmt.getvalue()))
+    for v in outs:
+        fp.write(f"        bout{v.output_label}_[mw_i_] = (double) {vname(v)};\n")
+    fp.write("    }\n")
+    if ctx.mw_timing:
+        _stamp_time(fp, 2)
+        _record_time(fp, f)
+    fp.write("\nmw_err_label:\n"
+             "    if (mw_err_txt_)\n"
+             "        mexErrMsgTxt(mw_err_txt_);\n"
+             "}\n\n")
+
+
+def _print_mex_batch_table(fp, funcs):
+    maxid = 0
+    id_to_stub = {}
+    for fc in funcs:
+        batched = _batched(fc)
+        for fs in [fc] + fc.same:
+            maxid = max(maxid, fs.id)
+            if batched:
+                id_to_stub[fs.id] = fc.id
+    if not id_to_stub:
+        return
+
+    fp.write("static mwStubFunc_t mwStubsB_[] = {\n"
+             "    NULL")
+    fp.write("".join(f",\n    mexStubB{id_to_stub[i]}" if i in id_to_stub else ",\n    NULL"
+                     for i in range(1, maxid + 1)))
+    fp.write("\n};\n\n")
+
+
 # ===================================================================
 # Print all stubs, dispatch table, mexFunction
 # ===================================================================
 
+# Size of the blocks in which rendered stubs are handed to the output
+_FLUSH_SIZE = 1 << 16
+
+
 def _print_mex_stubs(fp, ctx, funcs):
+    # Stubs are many small writes; collect them in memory and pass the
+    # output file large blocks
+    buf = io.StringIO()
     for f in funcs:
-        _print_mex_stub(fp, ctx, f)
+        _print_mex_stub(buf, ctx, f)
+        if _batched(f):
+            _print_mex_batch_stub(buf, ctx, f)
+        if buf.tell() >= _FLUSH_SIZE:
+            fp.write(buf.getvalue())
+            buf.seek(0)
+            buf.truncate()
+    fp.write(buf.getvalue())
 
 
 def _print_mex_stub_table(fp, funcs):
@@ -915,56 +2098,166 @@ def _print_mex_stub_table(fp, funcs):
            "                             int nrhs, const mxArray* prhs[]);\n\n"
            "static mwStubFunc_t mwStubs_[] = {\n"
            "    NULL")
+    fp.write("".join(f",\n    mexStub{id_to_stub[i]}" if i in id_to_stub else ",\n    NULL"
+                     for i in range(1, maxid + 1)))
+    fp.write("\n};\n\n")
+    fp.write(f"static int mwNumStubs_ = {maxid};\n\n")
+
+
+# ===================================================================
+# Hashed string dispatch (-hashdispatch)
+# ===================================================================
+
+def _fnv1a(s):
+    """32-bit FNV-1a hash; must match mwStubLookup_ in the generated code."""
+    h = 2166136261
+    for c in s.encode():
+        h = ((h ^ c) * 16777619) & 0xffffffff
+    return h
+
+
+def _stub_hash_slots(ctx, funcs):
+    """Build the open-addressed (linear probing) table of stub IDs."""
+    size = 8
+    while size < 2 * len(funcs):
+        size *= 2
+    slots = [0] * size
+    for fc in funcs:
+        h = _fnv1a(id_string(ctx, fc)) & (size - 1)
+        while slots[h]:
+            h = (h + 1) & (size - 1)
+        slots[h] = fc.id
+    return slots
+
+
+def _print_mex_stub_hash(fp, ctx, funcs):
+    maxid = max_routine_id(funcs)
+    if maxid <= 0:
+        return
+
+    names = {fc.id: id_string(ctx, fc) for fc in funcs}
+    fp.write("static const char* mwStubNames_[] = {\n"
+           "    NULL")
     for i in range(1, maxid + 1):
         fp.write(",\n")
-        if i in id_to_stub:
-            fp.write(f"    mexStub{id_to_stub[i]}")
+        if i in names:
+            fp.write(f"    \"{names[i]}\"")
         else:
             fp.write("    NULL")
     fp.write("\n};\n\n")
-    fp.write(f"static int mwNumStubs_ = {maxid};\n\n")
+
+    slots = _stub_hash_slots(ctx, funcs)
+    fp.write(f"static const int mwStubHash_[{len(slots)}] = {{\n")
+    for i in range(0, len(slots), 16):
+        row = ", ".join(str(x) for x in slots[i:i+16])
+        sep = "," if i + 16 < len(slots) else ""
+        fp.write(f"    {row}{sep}\n")
+    fp.write("};\n\n")
+
+    fp.write("static int mwStubLookup_(const char* id)\n"
+           "{\n"
+           "    unsigned int h = 2166136261u;\n"
+           "    const char* s;\n"
+           "    for (s = id; *s; ++s)\n"
+           "        h = ((h ^ (unsigned char) *s) * 16777619u) & 0xffffffffu;\n"
+           f"    for (h &= {len(slots)-1}; mwStubHash_[h]; h = (h+1) & {len(slots)-1})\n"
+           "        if (strcmp(id, mwStubNames_[mwStubHash_[h]]) == 0)\n"
+           "            return mwStubHash_[h];\n"
+           "    return 0;\n"
+           "}\n\n"
+           "static int mwStubDispatch_(const char* id, int nlhs, mxArray* plhs[],\n"
+           "                           int nrhs, const mxArray* prhs[])\n"
+           "{\n"
+           "    int stub_id = mwStubLookup_(id);\n"
+           "    if (!stub_id)\n"
+           "        return 0;\n"
+           "    mwStubs_[stub_id](nlhs, plhs, nrhs, prhs);\n"
+           "    return 1;\n"
+           "}\n\n")
 
 
-def _make_profile_output(fp, funcs, printfunc):
+def _make_profile_output(fp, ctx, funcs, printfunc):
     fp.write(f"        if (!mexprofrecord_)\n"
            f"            {printfunc}\"Profiler inactive\\n\");\n")
+    if ctx.mw_timing:
+        fp.write(f"        else\n"
+               f"            {printfunc}\"Stub times from %s\\n\", MWRAP_PROF_CLOCK);\n")
     for fc in funcs:
         fp.write(f"        {printfunc}\"%d calls to {fc.fname}:{fc.line}")
         # Preserve original behavior: only print first duplicate
         if fc.same:
             fp.write(f" ({fc.same[0].fname}:{fc.same[0].line})")
         fp.write(f"\\n\", mexprofrecord_[{fc.id}]);\n")
-
-
-def _print_mex_else_cases(fp, funcs):
-    for fc in funcs:
-        fp.write(f"    else if (strcmp(id, stubids{fc.id}_) == 0)\n"
-               f"        mexStub{fc.id}(nlhs,plhs, nrhs-1,prhs+1);\n")
+        if ctx.mw_timing:
+            fp.write(f"        if (mwProfStats_)\n"
+                   f"            {printfunc}\"%s\", mwProfFormat_(buf, sizeof(buf), mwProfStats_ + {fc.id}));\n")
+
+
+def _make_profile_stats(fp, ctx, funcs):
+    fp.write("        const char* fields[] = {\"id\", \"where\", \"calls\", \"unpack_ns\",\n"
+           "                                \"call_ns\", \"marshal_ns\", \"max_ns\", \"hist\"};\n"
+           "        if (!mwProfStats_)\n"
+           "            mexErrMsgTxt(\"Profiler inactive\");\n"
+           f"        plhs[0] = mxCreateStructMatrix({len(funcs)}, 1, 8, fields);\n")
+    for i, fc in enumerate(funcs):
+        fp.write(f"        mwProfSetStats_(plhs[0], {i}, \"{id_string(ctx, fc)}\", \"{fc.fname}:{fc.line}\",\n"
+               f"                        mwProfStats_ + {fc.id});\n")
+
+
+def _print_mex_else_cases(fp, ctx, funcs):
+    if ctx.mw_hash_dispatch and funcs:
+        fp.write("    else if (mwStubDispatch_(id, nlhs,plhs, nrhs-1,prhs+1))\n"
+               "        return;\n")
+    else:
+        fp.write("".join(f"    else if (strcmp(id, stubids{fc.id}_) == 0)\n"
+                         f"        mexStub{fc.id}(nlhs,plhs, nrhs-1,prhs+1);\n"
+                         for fc in funcs))
 
     maxid = max_routine_id(funcs)
     fp.write(f"    else if (strcmp(id, \"*profile on*\") == 0) {{\n"
            f"        if (!mexprofrecord_) {{\n"
-           f"            mexprofrecord_ = (int*) malloc({maxid+1} * sizeof(int));\n"
-           f"            mexLock();\n"
+           f"            mexprofrecord_ = (int*) malloc({maxid+1} * sizeof(int));\n")
+    if ctx.mw_timing:
+        fp.write(f"            mwProfStats_ = (mwProfStat_t*) malloc({maxid+1} * sizeof(mwProfStat_t));\n")
+    fp.write(f"            mexLock();\n"
            f"        }}\n"
-           f"        memset(mexprofrecord_, 0, {maxid+1} * sizeof(int));\n"
-           f"    }} else if (strcmp(id, \"*profile off*\") == 0) {{\n"
+           f"        memset(mexprofrecord_, 0, {maxid+1} * sizeof(int));\n")
+    if ctx.mw_timing:
+        fp.write(f"        memset(mwProfStats_, 0, {maxid+1} * sizeof(mwProfStat_t));\n")
+    fp.write(f"    }} else if (strcmp(id, \"*profile off*\") == 0) {{\n"
            f"        if (mexprofrecord_) {{\n"
-           f"            free(mexprofrecord_);\n"
-           f"            mexUnlock();\n"
+           f"            free(mexprofrecord_);\n")
+    if ctx.mw_timing:
+        fp.write(f"            free(mwProfStats_);\n")
+    fp.write(f"            mexUnlock();\n"
            f"        }}\n"
-           f"        mexprofrecord_ = NULL;\n"
-           f"    }} else if (strcmp(id, \"*profile report*\") == 0) {{\n")
-    _make_profile_output(fp, funcs, "mexPrintf(")
+           f"        mexprofrecord_ = NULL;\n")
+    if ctx.mw_timing:
+        fp.write(f"        mwProfStats_ = NULL;\n")
+    fp.write(f"    }} else if (strcmp(id, \"*profile report*\") == 0) {{\n")
+    if ctx.mw_timing:
+        fp.write("        char buf[1024];\n")
+    _make_profile_output(fp, ctx, funcs, "mexPrintf(")
     fp.write(f"    }} else if (strcmp(id, \"*profile log*\") == 0) {{\n"
-           f"        FILE* logfp;\n"
-           f"        if (nrhs != 2 || mxGetString(prhs[1], id, sizeof(id)) != 0)\n"
+           f"        FILE* logfp;\n")
+    if ctx.mw_timing:
+        fp.write("        char buf[1024];\n")
+    fp.write(f"        if (nrhs != 2 || mxGetString(prhs[1], id, sizeof(id)) != 0)\n"
            f"            mexErrMsgTxt(\"Must have two string arguments\");\n"
            f"        logfp = fopen(id, \"w+\");\n"
            f"        if (!logfp)\n"
            f"            mexErrMsgTxt(\"Cannot open log for output\");\n")
-    _make_profile_output(fp, funcs, "fprintf(logfp, ")
+    _make_profile_output(fp, ctx, funcs, "fprintf(logfp, ")
     fp.write("        fclose(logfp);\n")
+    if ctx.mw_timing:
+        fp.write("    } else if (strcmp(id, \"*profile stats*\") == 0) {\n")
+        _make_profile_stats(fp, ctx, funcs)
+    if ctx.mw_registry:
+        fp.write("    } else if (strcmp(id, \"*handles*\") == 0) {\n"
+               "        mwHandleReport_(nlhs, plhs);\n")
+    if ctx.mw_threads:
+        fp.write("    } else if (strcmp(id, \"*threads*\") == 0) {\n"
+               "        mwThreadsCommand_(nlhs, plhs, nrhs, prhs);\n")
     fp.write("    } else\n"
            "        mexErrMsgTxt(\"Unknown identifier\");\n")
 
@@ -994,6 +2287,14 @@ MEX_BASE = (
     "        int stub_id = (int) mxGetScalar(prhs[0]);\n"
     "        if (stub_id > 0 && stub_id <= mwNumStubs_ && mwStubs_[stub_id])\n"
     "            mwStubs_[stub_id](nlhs, plhs, nrhs-1, prhs+1);\n"
+)
+
+MEX_BASE_BATCH = (
+    "        else if (stub_id < 0 && -stub_id <= mwNumStubs_ && mwStubsB_[-stub_id])\n"
+    "            mwStubsB_[-stub_id](nlhs, plhs, nrhs-1, prhs+1);\n"
+)
+
+MEX_BASE_END = (
     "        else\n"
     "            mexErrMsgTxt(\"Unknown function ID\");\n"
     "        return;\n"
@@ -1010,6 +2311,10 @@ MEX_BASE_IF = (
 def print_mex_init(fp, ctx, support_text):
     """Write the MEX file header: banner + runtime support + complex/GPU includes."""
     fp.write(MWRAP_BANNER)
+    if ctx.mw_arena:
+        fp.write(MEX_ARENA_DECLS)
+    if ctx.mw_threads:
+        fp.write(MEX_THREADS_DECLS)
     fp.write(support_text)
     fp.write("\n")
     if ctx.mw_use_gpu:
@@ -1024,22 +2329,245 @@ def print_mex_init(fp, ctx, support_text):
 
 def print_mex_file(fp, ctx, funcs):
     """Write the rest of the MEX file: copiers, getters, stubs, dispatch."""
-    if ctx.mw_use_int32_t or ctx.mw_use_int64_t or ctx.mw_use_uint32_t or ctx.mw_use_uint64_t:
+    if _needs_stdint(ctx):
         fp.write("#include <stdint.h>\n\n")
+    if ctx.mw_threads or ctx.mw_arena:
+        fp.write(MEX_AT_EXIT_DECL)
+    if ctx.mw_threads:
+        fp.write(MEX_THREADS)
     mex_define_copiers(fp, ctx)
+    if ctx.mw_bin_handles:
+        mex_handle_support(fp, ctx, funcs)
     mex_casting_getters(fp, ctx)
+    if ctx.mw_timing:
+        fp.write(MEX_PROF_CLOCK + MEX_PROF_TYPES + MEX_PROF_STATS +
+                 MEX_PROF_RECORD + MEX_PROF_REPORT)
+    if ctx.mw_arena:
+        fp.write(MEX_ARENA)
+    if ctx.mw_threads or ctx.mw_arena:
+        mex_at_exit(fp, ctx)
+
+    if ctx.mw_int_dims and has_dims(funcs):
+        fp.write(MEX_GET_DIM)
+    if has_nd_inputs(funcs):
+        fp.write(MEX_ND_DIM)
 
     if has_fortran(funcs):
         mex_define_fnames(fp, funcs)
         mex_fortran_decls(fp, funcs)
 
     _print_mex_stubs(fp, ctx, funcs)
+    _print_mex_dispatch(fp, ctx, funcs)
+
+
+def _print_mex_dispatch(fp, ctx, funcs):
     _print_mex_stub_table(fp, funcs)
+    _print_mex_batch_table(fp, funcs)
+    if ctx.mw_hash_dispatch:
+        _print_mex_stub_hash(fp, ctx, funcs)
     fp.write(MEX_BASE)
+    if any(_batched(f) for f in funcs):
+        fp.write(MEX_BASE_BATCH)
+    fp.write(MEX_BASE_END)
     fp.write("\n")
     if ctx.mw_use_gpu:
         fp.write("    mxInitGPU();\n")
     fp.write("\n")
     fp.write(MEX_BASE_IF)
-    _print_mex_else_cases(fp, funcs)
+    _print_mex_else_cases(fp, ctx, funcs)
     fp.write("}\n\n")
+
+
+# ===================================================================
+# Split output: header, dispatch TU and stub shards (-split N)
+# ===================================================================
+
+# Prototypes for the non-macro routines in mwrap_support.c
+SUPPORT_DECLS = (
+    "#include <stdio.h>\n"
+    "#include <string.h>\n"
+    "#include <stddef.h>\n\n"
+    "#include <mex.h>\n\n"
+    "#if MX_HAS_INTERLEAVED_COMPLEX\n"
+    "#include <matrix.h>\n"
+    "#endif\n\n"
+    "extern int* mexprofrecord_;\n\n"
+    "#ifndef MXWRAP_SPARSE_T\n"
+    "#define MXWRAP_SPARSE_T\n"
+    "typedef struct mxWrapSparse_t {\n"
+    "    mwSize   m, n, nzmax;\n"
+    "    mwIndex* jc;\n"
+    "    mwIndex* ir;\n"
+    "    double*  pr;\n"
+    "} mxWrapSparse_t;\n"
+    "#endif\n\n"
+    "double   mxWrapGetScalar_char(const mxArray* a, const char** e);\n"
+    "void*    mxWrapGetP(const mxArray* a, const char* fmt, const char** e);\n"
+    "mxArray* mxWrapCreateP(void* p, const char* fmt);\n"
+    "mxArray* mxWrapStrncpy(const char* s);\n"
+    "char*    mxWrapGetString(const mxArray* a, const char** e);\n"
+    "double   mxWrapGetScalar(const mxArray* a, const char** e);\n"
+    "void*    mxWrapGetP_single(const mxArray* a, const char* fmt, const char** e);\n"
+    "mxArray* mxWrapCreateP_single(void* p, const char* fmt);\n"
+    "mxArray* mxWrapStrncpy_single(const char* s);\n"
+    "float    mxWrapGetScalar_single(const mxArray* a, const char** e);\n"
+    "char*    mxWrapGetString_single(const mxArray* a, const char** e);\n"
+    "void     mxWrapGetSparse(mxWrapSparse_t* s, const mxArray* a, const char** e);\n"
+    "mxArray* mxWrapCreateSparse(mxWrapSparse_t* s, mwSize m, mwSize n, mwSize nzmax);\n\n"
+)
+
+
+def split_file_names(cfile, nsplit):
+    """Return the header name and the shard names for a split -c file."""
+    stem, ext = os.path.splitext(cfile)
+    return f"{stem}_mwrap.h", [f"{stem}_{i}{ext}" for i in range(1, nsplit + 1)]
+
+
+def _split_guard(hname):
+    base = os.path.basename(hname)
+    return "".join(c if c.isalnum() else "_" for c in base).upper()
+
+
+def _mex_declare_copiers_type(fp, name, ztype=None):
+    decls = [("mxWrapGetArray_{}", "{0}* {1}(const mxArray* a, const char** e);\n"),
+             ("mxWrapCopy_{}",     "void {1}(mxArray* a, const {0}* q, mwSize n);\n"),
+             ("mxWrapReturn_{}",   "mxArray* {1}(const {0}* q, mwSize m, mwSize n);\n")]
+    if ztype:
+        decls.insert(0, ("mxWrapGetScalar_{}", "void {1}({0}* z, const mxArray* a);\n"))
+    for prefix in ("", "single_"):
+        for func, decl in decls:
+            fp.write(decl.format(name, func.format(prefix + name)))
+
+
+def mex_declare_copiers(fp, ctx):
+    fp.write("/* Array copier prototypes */\n")
+    for name in sorted(ctx.scalar_decls):
+        if _copier_type_used(ctx, name):
+            _mex_declare_copiers_type(fp, name)
+    for name in sorted(ctx.cscalar_decls):
+        _mex_declare_copiers_type(fp, name, "float")
+    for name in sorted(ctx.zscalar_decls):
+        _mex_declare_copiers_type(fp, name, "double")
+    fp.write("\n")
+
+
+def print_mex_split_init(fp, ctx, hname):
+    """Write the start of the split header: support prototypes + complex/GPU
+    includes.  print_mex_split adds the $[header code after this, so it must
+    be safe to include from every shard (declarations and inline
+    definitions only)."""
+    guard = _split_guard(hname)
+    fp.write(MWRAP_BANNER)
+    fp.write(f"#ifndef {guard}\n"
+             f"#define {guard}\n\n")
+    fp.write(SUPPORT_DECLS)
+    if ctx.mw_arena:
+        fp.write(MEX_ARENA_DECLS)
+    if ctx.mw_threads:
+        fp.write(MEX_THREADS_DECLS)
+    if ctx.mw_use_gpu:
+        fp.write("#include <gpu/mxGPUArray.h>\n\n")
+    if ctx.mw_use_c99_complex:
+        mex_c99_complex(fp)
+    elif ctx.mw_use_cpp_complex:
+        mex_cpp_complex(fp)
+        if ctx.mw_use_gpu:
+            mex_gpucpp_complex(fp)
+
+
+def _print_split_stubs(fp, ctx, funcs):
+    """Write the stubs *funcs* with the local helpers they use."""
+    if ctx.mw_timing and funcs:
+        fp.write(MEX_PROF_CLOCK + MEX_PROF_RECORD)
+    if ctx.mw_int_dims and has_dims(funcs):
+        fp.write(MEX_GET_DIM)
+    if has_nd_inputs(funcs):
+        fp.write(MEX_ND_DIM)
+    _print_mex_stubs(fp, ctx, funcs)
+
+
+def print_mex_split(hfp, ctx, funcs, cfile, support_text, open_output,
+                    header_code="", code=""):
+    """Finish the split header and write the dispatch TU and the shards.
+
+    *header_code* is the $[header pass-through, which goes in the header
+    and so is seen by every file.  *code* is the other pass-through, which
+    goes in the dispatch TU only.  If there is code but no header code,
+    nothing tells the shards what the stubs call: the code then goes in
+    the header, which only the dispatch TU includes, along with every stub.
+    """
+    hname, shards = split_file_names(cfile, ctx.mw_split)
+    include = f"#include \"{os.path.basename(hname)}\"\n\n"
+    unsplit = bool(code.strip()) and not header_code.strip()
+    if unsplit:
+        sys.stderr.write(f"Warning: no $[header code for the stubs; "
+                         f"writing every stub to {cfile}\n")
+        header_code, code = code, ""
+
+    # Header: everything the stubs refer to
+    hfp.write(header_code)
+    hfp.write("\n")
+    if _needs_stdint(ctx):
+        hfp.write("#include <stdint.h>\n\n")
+    mex_declare_copiers(hfp, ctx)
+    if ctx.mw_bin_handles:
+        hfp.write(MEX_HANDLE_DECLS)
+    for parent in sorted(ctx.class_decls.keys()):
+        hfp.write(f"{parent}* mxWrapGetP_{parent}(const mxArray* a, const char** e);\n")
+    if ctx.class_decls:
+        hfp.write("\n")
+    if ctx.mw_timing:
+        hfp.write(MEX_PROF_TYPES)
+        hfp.write("extern mwProfStat_t* mwProfStats_;\n\n")
+    if has_fortran(funcs):
+        mex_define_fnames(hfp, funcs)
+        mex_fortran_decls(hfp, funcs)
+    for f in funcs:
+        hfp.write(f"void mexStub{f.id}(int nlhs, mxArray* plhs[],\n"
+                  f"              int nrhs, const mxArray* prhs[]);\n")
+        if _batched(f):
+            hfp.write(f"void mexStubB{f.id}(int nlhs, mxArray* plhs[],\n"
+                      f"               int nrhs, const mxArray* prhs[]);\n")
+    hfp.write(f"\n#endif /* {_split_guard(hname)} */\n")
+
+    # Dispatch TU: runtime support, copiers, getters, tables, mexFunction
+    fp = open_output(cfile)
+    fp.write(MWRAP_BANNER)
+    fp.write(include)
+    fp.write(support_text)
+    fp.write("\n")
+    fp.write(code)
+    if ctx.mw_threads or ctx.mw_arena:
+        fp.write(MEX_AT_EXIT_DECL)
+    if ctx.mw_threads:
+        fp.write(MEX_THREADS)
+    mex_define_copiers(fp, ctx)
+    if ctx.mw_bin_handles:
+        mex_handle_support(fp, ctx, funcs)
+    mex_casting_getters(fp, ctx)
+    if ctx.mw_timing:
+        fp.write(MEX_PROF_STATS + MEX_PROF_REPORT)
+    if ctx.mw_arena:
+        fp.write(MEX_ARENA)
+    if ctx.mw_threads or ctx.mw_arena:
+        mex_at_exit(fp, ctx)
+    if not ctx.mw_hash_dispatch:
+        for f in funcs:
+            _print_stub_id(fp, ctx, f)
+    if unsplit:
+        _print_split_stubs(fp, ctx, funcs)
+    _print_mex_dispatch(fp, ctx, funcs)
+    fp.close()
+
+    # Shards: contiguous, evenly sized runs of stubs
+    n = len(shards)
+    for i, name in enumerate(shards):
+        fp = open_output(name)
+        fp.write(MWRAP_BANNER)
+        if unsplit:
+            # Only the dispatch TU may see the code; keep the file non-empty
+            fp.write("#include <mex.h>\n")
+        else:
+            fp.write(include)
+            _print_split_stubs(fp, ctx, funcs[i * len(funcs) // n:(i + 1) * len(funcs) // n])
+        fp.close()
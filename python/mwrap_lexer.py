@@ -8,12 +8,12 @@ Converted to Python by Zydrunas Gimbutas (2026),
 with assistance from Claude Code / Claude Opus 4.6 (Anthropic).
 """
 
+import io
 import re
 import sys
 import os
 from enum import Enum, auto
-from dataclasses import dataclass
-from typing import Optional, TextIO, List
+from typing import NamedTuple, Optional, TextIO, List
 
 
 class TokenType(Enum):
@@ -31,6 +31,8 @@ class TokenType(Enum):
     GPU       = auto()
     PUNCT     = auto()      # single characters: ( ) , ; * & [ ] . - > = :
     NON_C_LINE = auto()
+    C_TEXT    = auto()      # pass-through C from '$' lines and $[ ... $]
+    C_HEADER  = auto()      # pass-through C from $[header ... $]
     EOF       = auto()
 
 
@@ -53,17 +55,57 @@ _TOKEN_RE = re.compile(
     r"|((?:::)?[_a-zA-Z][_a-zA-Z0-9]*(?:::(?:[_a-zA-Z][_a-zA-Z0-9]*))*)"  # ID (may have ::)
     r"|([0-9]+)"                # number
     r"|([->()\[\],;*&=:.])"     # punctuation
-    r"|[ \t\r]+"                # whitespace — skip
-)
+)                               # anything else (blanks) is skipped
 
+# First characters of the lines that are not plain text
+_DIRECTIVE_CHARS = frozenset("#$@/")
 
-@dataclass
-class Token:
+_ID, _NUMBER, _STRING, _PUNCT = (TokenType.ID, TokenType.NUMBER,
+                                 TokenType.STRING, TokenType.PUNCT)
+
+# Block text is read, and passed on, in pieces of about this size
+_BLOCK_CHUNK = 1 << 16
+
+
+class Token(NamedTuple):
     type: TokenType
     value: str
     line: int
 
 
+def _block_start(stripped):
+    """The token type for the text of the $[ ... $] block that *stripped*
+    opens: C_TEXT for '$[' and blanks, C_HEADER for '$[header' and
+    blanks, or None if the line opens no block."""
+    rest = stripped[2:].rstrip(" \t\r\n")
+    if not rest.lstrip(" \t"):
+        return TokenType.C_TEXT
+    if rest == "header":
+        return TokenType.C_HEADER
+    return None
+
+
+def _is_block_end(line):
+    """True for a line, without its newline, that closes a block."""
+    return line.startswith("$]") and not line[2:].strip(" \t\r")
+
+
+def _find_block_end(text, pos):
+    """(start, end) of the first complete $] line in *text* that starts
+    at or after *pos*, itself the start of a line; None if there is none."""
+    while True:
+        i = text.find("$]", pos)
+        if i < 0:
+            return None
+        if i == pos or text[i - 1] == "\n":
+            nl = text.find("\n", i)
+            if nl < 0:
+                return None     # the rest of the text is this one line
+            if _is_block_end(text[i:nl]):
+                return i, nl + 1
+        pos = i + 1
+
+
 def _is_name_char(c):
     return c.isalnum() or c == '_'
 
@@ -84,6 +126,28 @@ def _fname_scan_line(text):
     return name + ".m"
 
 
+class _MemoryReader(io.RawIOBase):
+    """Raw stream over a bytes-like object, read without copying it."""
+
+    def __init__(self, data):
+        self._view = memoryview(data).cast("B")
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), len(self._view) - self._pos)
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def close(self):
+        # Release the buffer so that an mmap can be closed
+        self._view.release()
+        super().close()
+
+
 class Lexer:
     """Line-oriented lexer for .mw files.
 
@@ -94,44 +158,115 @@ class Lexer:
     """
 
     def __init__(self, outfp=None, outcfp=None,
-                 mbatching_flag=False, listing_flag=False):
+                 mbatching_flag=False, listing_flag=False,
+                 open_output=None, outhfp=None):
         self.outfp: Optional[TextIO] = outfp
         self.outcfp: Optional[TextIO] = outcfp
+        # $[header text, if it does not go to outcfp (-split)
+        self.outhfp: Optional[TextIO] = outhfp
         self.mbatching_flag: bool = mbatching_flag
         self.listing_flag: bool = listing_flag
         self.linenum: int = 0
         self.current_ifname: str = ""
 
+        # Opener for @function / @ redirect outputs, and every file read
+        self.open_output = open_output or (lambda name: open(name, "w"))
+        self.sources: List[str] = []
+
         # File include stack
-        self._file_stack: List = []          # [(fp, linenum, ifname), ...]
+        self._file_stack: List = []  # [(fp, pending, linenum, ifname), ...]
         self._current_fp: Optional[TextIO] = None
 
+        # Text read from _current_fp past the end of a $[ ... $] block
+        self._pending: str = ""
+        # Token type for the text of the open block
+        self._block_type = TokenType.C_TEXT
+
     # ------------------------------------------------------------------
     # public interface
     # ------------------------------------------------------------------
 
     def lex_file(self, filename):
-        """Yield Token objects from *filename*."""
+        """Yield Token objects from *filename*.
+
+        Pass-through C code arrives as C_TEXT tokens, which the consumer
+        writes out; they are only produced if there is a C output."""
         fp = open(filename, "r")
-        self._current_fp = fp
-        self.current_ifname = filename
-        self.linenum = 1
-        yield from self._lex_stream()
+        self.sources.append(filename)
+        yield from self._lex_stream(fp, filename)
+
+    def lex_bytes(self, data, filename="<bytes>"):
+        """Yield Token objects from the contents of a .mw file in *data*.
+
+        *data* is any bytes-like object, such as an mmap.mmap of the
+        file; it is decoded as open() would decode the file, without
+        copying it first.  *filename* is used in messages; @include
+        still reads from disk.  For example:
+
+            with open(name, "rb") as f, \\
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                for tok in lexer.lex_bytes(m, name):
+                    ...
+        """
+        fp = io.TextIOWrapper(io.BufferedReader(_MemoryReader(data)))
+        yield from self._lex_stream(fp, filename)
 
     # ------------------------------------------------------------------
     # directive handlers
     # ------------------------------------------------------------------
 
-    def _handle_block_c(self, line):
-        """Process a line in block C mode. Returns False when block ends."""
-        stripped = line.rstrip('\r\n')
-        if re.match(r'^\$\][ \t\r]*$', stripped):
+    def _lex_block_c(self):
+        """Yield the body of a $[ ... $] block as C_TEXT tokens, or
+        C_HEADER tokens for a $[header block.
+
+        The block is read in chunks and searched for the closing $] line
+        as a whole, not line by line.  Returns True once the $] line is
+        consumed, or False if the file ends first."""
+        emit = self.outcfp is not None
+        text, self._pending = self._pending, ""
+        at_line_start = True
+        while True:
+            if at_line_start:
+                start = 0
+            else:
+                start = text.find("\n") + 1
+            end = _find_block_end(text, start) if start or at_line_start else None
+            if end:
+                body = text[:end[0]]
+                self._pending = text[end[1]:]
+                if body and emit:
+                    yield Token(self._block_type, body, self.linenum)
+                self.linenum += body.count("\n") + 1
+                return True
+
+            data = self._current_fp.read(_BLOCK_CHUNK)
+            if not data:
+                break
+
+            # Pass on all but a last line that could still be the $] line
+            keep = text.rfind("\n") + 1
+            last = text[keep:]
+            if not (keep or at_line_start) or \
+                    not (last == "$" or _is_block_end(last)):
+                keep = len(text)
+            body = text[:keep]
+            if body:
+                if emit:
+                    yield Token(self._block_type, body, self.linenum)
+                self.linenum += body.count("\n")
+                at_line_start = body.endswith("\n")
+            text = text[keep:] + data
+
+        # End of file: a last line without a newline may still close it
+        keep = text.rfind("\n") + 1
+        closed = bool(keep or at_line_start) and _is_block_end(text[keep:])
+        body = text[:keep] if closed else text
+        if body and emit:
+            yield Token(self._block_type, body, self.linenum)
+        self.linenum += body.count("\n")
+        if closed or not (body.endswith("\n") or (not body and at_line_start)):
             self.linenum += 1
-            return False
-        if self.outcfp:
-            self.outcfp.write(line)
-        self.linenum += 1
-        return True
+        return closed
 
     def _handle_comment(self):
         """Handle // comment line."""
@@ -147,7 +282,7 @@ class Lexer:
             if self.outfp:
                 self.outfp.close()
             try:
-                self.outfp = open(fname, "w")
+                self.outfp = self.open_output(fname)
             except OSError:
                 print(f"Error: Could not write {fname}",
                       file=sys.stderr)
@@ -166,17 +301,19 @@ class Lexer:
             print("Error: Includes nested too deeply",
                   file=sys.stderr)
             sys.exit(1)
-        self._file_stack.append(
-            (self._current_fp, self.linenum, self.current_ifname))
+        self._file_stack.append((self._current_fp, self._pending,
+                                 self.linenum, self.current_ifname))
         try:
             new_fp = open(rest, "r")
         except OSError:
             print(f"Error: Could not read '{rest}'",
                   file=sys.stderr)
             sys.exit(1)
+        self.sources.append(rest)
         self.current_ifname = rest
         self.linenum = 1
         self._current_fp = new_fp
+        self._pending = ""
 
     def _handle_redirect(self, stripped):
         """Handle @ redirect directive."""
@@ -187,7 +324,7 @@ class Lexer:
                 self.outfp = None
             if rest:
                 try:
-                    self.outfp = open(rest, "w")
+                    self.outfp = self.open_output(rest)
                 except OSError:
                     print(f"Error: Could not write {rest}",
                           file=sys.stderr)
@@ -201,110 +338,129 @@ class Lexer:
         """Handle $ single-line C pass-through."""
         rest = stripped[1:]
         if self.outcfp:
-            self.outcfp.write(rest)
+            yield Token(TokenType.C_TEXT, rest, self.linenum)
         self.linenum += 1
         yield Token(TokenType.NON_C_LINE, "", self.linenum - 1)
 
     def _handle_hash_line(self, stripped):
         """Handle # C declaration line — tokenise."""
         body = stripped[1:].rstrip('\r\n')
-        yield from self._tokenize_c_line(body, self.linenum)
+        tokens = self._tokenize_c_line(body, self.linenum)
         self.linenum += 1
+        return tokens
 
     # ------------------------------------------------------------------
     # internal line-by-line driver
     # ------------------------------------------------------------------
 
-    def _lex_stream(self):
-        """Process all lines from self._current_fp, yielding tokens."""
-        in_block_c = False
-
-        while True:
-            raw_line = self._current_fp.readline()
-            if raw_line == "":
-                # End of current file
-                if self._file_stack:
-                    self._current_fp.close()
-                    self._current_fp, self.linenum, self.current_ifname = self._file_stack.pop()
+    def _readline(self):
+        """Next line of the current file, after any pending block tail."""
+        if not self._pending:
+            return self._current_fp.readline()
+        end = self._pending.find("\n") + 1
+        if end:
+            line, self._pending = self._pending[:end], self._pending[end:]
+            return line
+        line, self._pending = self._pending, ""
+        return line + self._current_fp.readline()
+
+    def _lex_stream(self, fp, filename):
+        """Process all lines of *fp*, yielding tokens, and close it."""
+        self._current_fp = fp
+        self._pending = ""
+        self.current_ifname = filename
+        self.linenum = 1
+        try:
+            in_block_c = False
+
+            while True:
+                # --- block C mode ($[ ... $]) ---
+                if in_block_c:
+                    if (yield from self._lex_block_c()):
+                        in_block_c = False
+                        continue
+                    # The file ended inside the block
+
+                raw_line = self._readline()
+                if raw_line == "":
+                    # End of current file
+                    if self._file_stack:
+                        self._current_fp.close()
+                        (self._current_fp, self._pending,
+                         self.linenum, self.current_ifname) = self._file_stack.pop()
+                        continue
+                    else:
+                        return       # real EOF
+
+                # Strip the trailing newline for processing but track it
+                line = raw_line
+
+                # Dispatch on the first non-blank character
+                stripped = line.lstrip(' \t') if line[0] in ' \t' else line
+                c = stripped[:1]
+                if c not in _DIRECTIVE_CHARS or (c == "/" and stripped[1:2] != "/"):
+                    # Text line — copy to MATLAB output
+                    if self.outfp:
+                        self.outfp.write(line)
+                    self.linenum += 1
+                    yield Token(TokenType.NON_C_LINE, "", self.linenum - 1)
                     continue
+
+                # In the original Flex lexer, leading [ \t] in INITIAL state is
+                # always written to outfp regardless of what prefix follows.
+                # We replicate this for all prefix types except pure text lines
+                # (which include their own leading whitespace in the full line).
+                if self.outfp and stripped is not line:
+                    self.outfp.write(line[:len(line) - len(stripped)])
+
+                if c == "#":
+                    yield from self._handle_hash_line(stripped)
+                elif c == "$":
+                    if stripped[1:2] != "[":
+                        yield from self._handle_dollar_line(stripped)
+                    elif _block_start(stripped):
+                        self._block_type = _block_start(stripped)
+                        in_block_c = True
+                        self.linenum += 1
+                    else:
+                        # '$[' followed by text is an ordinary text line
+                        if self.outfp:
+                            self.outfp.write(line)
+                        self.linenum += 1
+                        yield Token(TokenType.NON_C_LINE, "", self.linenum - 1)
+                elif c == "@":
+                    if stripped.startswith("@function"):
+                        yield from self._handle_function(stripped)
+                    elif stripped.startswith("@include"):
+                        self._handle_include(stripped)
+                    else:
+                        yield from self._handle_redirect(stripped)
                 else:
-                    return       # real EOF
-
-            # Strip the trailing newline for processing but track it
-            line = raw_line
-
-            # --- block C mode ($[ ... $]) ---
-            if in_block_c:
-                in_block_c = self._handle_block_c(line)
-                continue
-
-            # Determine line prefix — compute leading whitespace
-            stripped = line.lstrip(' \t')
-            leading_ws = line[:len(line) - len(stripped)]
-
-            # In the original Flex lexer, leading [ \t] in INITIAL state is
-            # always written to outfp regardless of what prefix follows.
-            # We replicate this for all prefix types except pure text lines
-            # (which include their own leading whitespace in the full line).
-            if leading_ws and self.outfp and (
-                    stripped.startswith("$") or
-                    stripped.startswith("#") or
-                    stripped.startswith("@") or
-                    stripped.startswith("//")):
-                self.outfp.write(leading_ws)
-
-            # $[ block start
-            if re.match(r'^\$\[[ \t\r]*\n?$', stripped):
-                in_block_c = True
-                self.linenum += 1
-                continue
-
-            if stripped.startswith("//"):
-                yield from self._handle_comment()
-                continue
-
-            if stripped.startswith("@function"):
-                yield from self._handle_function(stripped)
-                continue
-
-            if stripped.startswith("@include"):
-                self._handle_include(stripped)
-                continue
-
-            if stripped.startswith("@"):
-                yield from self._handle_redirect(stripped)
-                continue
-
-            if stripped.startswith("$") and not stripped.startswith("$["):
-                yield from self._handle_dollar_line(stripped)
-                continue
-
-            if stripped.startswith("#"):
-                yield from self._handle_hash_line(stripped)
-                continue
-
-            # Text line — copy to MATLAB output
-            if self.outfp:
-                self.outfp.write(line)
-            self.linenum += 1
-            yield Token(TokenType.NON_C_LINE, "", self.linenum - 1)
+                    yield from self._handle_comment()
+        finally:
+            fp.close()
 
     # ------------------------------------------------------------------
     # tokenise a single '#' line body
     # ------------------------------------------------------------------
 
     def _tokenize_c_line(self, body, line):
-        """Yield tokens for the body of a '#' line."""
-        for m in _TOKEN_RE.finditer(body):
-            comment, string, ident, number, punct = m.groups()
-            if comment:
-                break        # rest of line is a comment
-            if string:
-                yield Token(TokenType.STRING, string, line)
+        """Return the list of tokens for the body of a '#' line."""
+        tokens = []
+        append = tokens.append
+        # Bypass Token.__new__; this loop makes most of the tokens
+        new = tuple.__new__
+        for comment, string, ident, number, punct in _TOKEN_RE.findall(body):
+            if punct:
+                append(new(Token, (_PUNCT, punct, line)))
             elif ident:
-                tt = KEYWORDS.get(ident, TokenType.ID)
-                yield Token(tt, ident, line)
+                # Type and class names recur on every line; share them
+                ident = sys.intern(ident)
+                append(new(Token, (KEYWORDS.get(ident, _ID), ident, line)))
             elif number:
-                yield Token(TokenType.NUMBER, number, line)
-            elif punct:
-                yield Token(TokenType.PUNCT, punct, line)
+                append(new(Token, (_NUMBER, number, line)))
+            elif string:
+                append(new(Token, (_STRING, string, line)))
+            else:
+                break        # rest of line is a comment
+        return tokens
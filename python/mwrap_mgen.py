@@ -39,7 +39,8 @@ def _dim_arg_strs(vars):
 
 def print_matlab_call(fp, f, mexfunc):
     """Emit MATLAB stub for function call f."""
-    fp.write(f"mex_id_ = {f.id};\n")
+    # Negative IDs select the batched stub of a vectorized call
+    fp.write(f"mex_id_ = {-f.id if f.vectorize else f.id};\n")
 
     out_names = _output_arg_names(f.ret) + _output_arg_names(f.args)
     if out_names:
@@ -0,0 +1,226 @@
+"""
+mwrap_parallel.py — Lex and parse input files in a process pool (-j N).
+
+Copyright (c) 2007-2008  David Bindel
+See the file COPYING for copying permissions
+
+A worker cannot finish a file on its own: typedefs in earlier files
+change how later declarations typecheck, and with -mb the .m file that
+is open at the start of a file depends on the files before it.  So each
+worker lexes and parses one file and records what a serial run would
+have done as a list of events: text written to the .m, C, stdout and
+stderr streams, .m files opened and closed, typedefs, classes and parsed
+functions.  The driver replays the events file by file in input order,
+applying typedefs and numbering, emitting and deduplicating functions
+exactly as a serial run would, so the outputs are identical.
+
+Workers also typecheck speculatively, with the typedefs they have seen.
+A function's typecheck depends on the typedef registries only through
+the classification of its base types, so the driver keeps the worker's
+result when that classification agrees with its own registries and
+typechecks the function again otherwise.
+"""
+
+import io
+import sys
+from dataclasses import dataclass, field
+
+from mwrap_ast import VT, id_string
+from mwrap_lexer import Lexer
+from mwrap_parser import Parser
+from mwrap_typecheck import typecheck
+
+
+def _type_signature(ctx, func):
+    """The typedef-dependent inputs of typecheck(ctx, func)."""
+    return tuple((ctx.is_scalar_type(v.basetype),
+                  ctx.is_cscalar_type(v.basetype),
+                  ctx.is_zscalar_type(v.basetype),
+                  ctx.is_mxarray_type(v.basetype))
+                 for v in func.ret + func.args)
+
+
+class _EventLog:
+    """Ordered events; consecutive writes to one stream are merged."""
+
+    def __init__(self):
+        self.events = []
+        self._kind = None
+        self._parts = []
+
+    def write(self, kind, text):
+        if kind != self._kind:
+            self._flush()
+            self._kind = kind
+        self._parts.append(text)
+
+    def add(self, *event):
+        self._flush()
+        self.events.append(event)
+
+    def _flush(self):
+        if self._parts:
+            self.events.append((self._kind, "".join(self._parts)))
+            self._parts = []
+        self._kind = None
+
+    def finish(self):
+        self._flush()
+        return self.events
+
+
+class _Recorder:
+    """File-like object that logs writes to stream *kind*."""
+
+    def __init__(self, log, kind):
+        self.log = log
+        self.kind = kind
+
+    def write(self, s):
+        self.log.write(self.kind, s)
+        return len(s)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.log.add("close")
+
+
+class _RecordingParser(Parser):
+    """Parser that records declarations instead of applying them."""
+
+    def __init__(self, lexer, ctx, log):
+        super().__init__(lexer, ctx)
+        self.log = log
+
+    def _add_typedef(self, space, name):
+        self.log.add("typedef", space, name)
+        # Applied locally for the speculative typecheck; the driver
+        # reports unknown typespaces when it replays the event
+        if space in self.TYPESPACES:
+            super()._add_typedef(space, name)
+
+    def _add_class(self, child, parents):
+        self.log.add("class", child, parents)
+
+    def _finish_func(self, func, line=None):
+        if line is None:
+            line = self._line()
+        sig = _type_signature(self.ctx, func)
+        stderr, sys.stderr = sys.stderr, io.StringIO()
+        try:
+            errs = typecheck(self.ctx, func, line)
+            messages = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.log.add("func", func, line, sig, errs, messages,
+                     id_string(self.ctx, func))
+
+
+def _replay_func(parser, func, line, sig, errs, messages, ids):
+    if sig != _type_signature(parser.ctx, func):
+        # An earlier file changed the typedefs this function depends on
+        for v in func.ret + func.args:
+            v.tinfo = VT.unk
+        parser._finish_func(func, line)
+        return
+    sys.stderr.write(messages)
+    parser.type_errs += errs
+    parser._emit_func(func, ids)
+
+
+@dataclass
+class FileResult:
+    events: list = field(default_factory=list)
+    err_flag: int = 0
+    sources: list = field(default_factory=list)
+    use_flags: dict = field(default_factory=dict)
+
+
+def parse_file(infile, ctx, mbatching, listing, has_m, has_c):
+    """Worker: lex and parse *infile*, returning its recorded events."""
+    log = _EventLog()
+
+    def open_output(name):
+        log.add("open", name)
+        return _Recorder(log, "m")
+
+    # The driver drops .m text if no .m file is open when it replays
+    lexer = Lexer(outfp=_Recorder(log, "m") if has_m or mbatching else None,
+                  outcfp=_Recorder(log, "c") if has_c else None,
+                  mbatching_flag=mbatching, listing_flag=listing,
+                  open_output=open_output,
+                  outhfp=_Recorder(log, "h") if has_c else None)
+    parser = _RecordingParser(lexer, ctx, log)
+
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = _Recorder(log, "out"), _Recorder(log, "err")
+    try:
+        lexer.linenum = 1
+        lexer.current_ifname = infile
+        for tok in lexer.lex_file(infile):
+            parser.feed(tok)
+        parser.finish_file()
+    except OSError:
+        pass    # the driver reports unreadable files itself
+    except SystemExit as e:
+        log.add("exit", e.code)
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+
+    use_flags = {k: v for k, v in vars(ctx).items() if k.startswith("mw_use_")}
+    return FileResult(log.finish(), parser.err_flag, lexer.sources, use_flags)
+
+
+def replay(result, lexer, parser):
+    """Apply one worker result to the driver's lexer, parser and context."""
+    for event in result.events:
+        kind = event[0]
+        if kind == "m":
+            if lexer.outfp:
+                lexer.outfp.write(event[1])
+        elif kind == "c":
+            if lexer.outcfp:
+                lexer.outcfp.write(event[1])
+        elif kind == "h":
+            fp = lexer.outhfp or lexer.outcfp
+            if fp:
+                fp.write(event[1])
+        elif kind == "out":
+            sys.stdout.write(event[1])
+        elif kind == "err":
+            sys.stderr.write(event[1])
+        elif kind == "close":
+            if lexer.outfp:
+                lexer.outfp.close()
+            lexer.outfp = None
+        elif kind == "open":
+            try:
+                lexer.outfp = lexer.open_output(event[1])
+            except OSError:
+                print(f"Error: Could not write {event[1]}", file=sys.stderr)
+                sys.exit(1)
+        elif kind == "typedef":
+            parser._add_typedef(*event[1:])
+        elif kind == "class":
+            parser._add_class(*event[1:])
+        elif kind == "func":
+            _replay_func(parser, *event[1:])
+        elif kind == "exit":
+            sys.exit(event[1])
+
+    lexer.sources.extend(result.sources)
+    parser.err_flag += result.err_flag
+    for k, v in result.use_flags.items():
+        if v:
+            setattr(parser.ctx, k, v)
+
+
+def parse_files(pool, input_files, ctx, mbatching, listing, has_m, has_c):
+    """Start parsing *input_files* on the process pool *pool*; return one
+    future per file, in input order.  The caller owns the pool and must
+    collect or cancel every future before shutting it down."""
+    return [pool.submit(parse_file, name, ctx, mbatching, listing,
+                        has_m, has_c)
+            for name in input_files]
@@ -11,7 +11,7 @@ with assistance from Claude Code / Claude Opus 4.6 (Anthropic).
 import sys
 from mwrap_ast import (
     Expr, TypeQual, Var, Func, VT,
-    promote_int, id_string, add_inherits,
+    promote_int, note_int_uses, id_string, add_inherits,
 )
 from mwrap_lexer import Lexer, Token, TokenType
 from mwrap_typecheck import typecheck
@@ -22,6 +22,13 @@ class ParseError(Exception):
     pass
 
 
+# Qualifiers without dimensions are immutable and shared by every Var
+_POINTER = TypeQual('*')
+_REFERENCE = TypeQual('&')
+
+_EOF = Token(TokenType.EOF, "", 0)
+
+
 class Parser:
     """Recursive descent parser for mwrap '#' lines.
 
@@ -59,6 +66,12 @@ class Parser:
 
     def feed(self, tok):
         """Feed one token from the lexer."""
+        if tok.type == TokenType.C_TEXT:
+            self.pass_through(tok.value)
+            return
+        if tok.type == TokenType.C_HEADER:
+            self.pass_through(tok.value, header=True)
+            return
         if tok.type == TokenType.EOF:
             self._flush_pending(tok)
             return
@@ -74,6 +87,14 @@ class Parser:
             self._parse_line()
             self._tokens.clear()
 
+    def pass_through(self, text, header=False):
+        """Write C code from '$' lines and $[ ... $] blocks, in input order.
+        The C output is the lexer's outcfp unless a caller overrides this;
+        $[header blocks go to its outhfp if there is one (-split)."""
+        fp = self.lexer.outhfp if header and self.lexer.outhfp else self.lexer.outcfp
+        if fp:
+            fp.write(text)
+
     def _flush_pending(self, tok):
         """Report error if there are tokens pending without a ';'."""
         if self._tokens:
@@ -108,7 +129,7 @@ class Parser:
     def _peek(self):
         if self._pos < len(self._tokens):
             return self._tokens[self._pos]
-        return Token(TokenType.EOF, "", 0)
+        return _EOF
 
     def _advance(self):
         tok = self._peek()
@@ -163,7 +184,9 @@ class Parser:
             self.err_flag += 1
 
     def _statement(self):
-        """statement ::= tdef | classdef | basevar '=' funcall | funcall"""
+        """statement ::= tdef | classdef | annotation* call
+        annotation ::= 'vectorize' | 'hot'
+        call ::= basevar '=' funcall | funcall"""
         tok = self._peek()
 
         if tok.type == TokenType.TYPEDEF:
@@ -178,15 +201,32 @@ class Parser:
         # A funcall starts with: ID -> ... | ID ( | FORTRAN ID | NEW ID
         # A basevar starts with: ID ID  or  ID qual ID
         # The disambiguator: look for '=' before '(' or ';'
+        notes = set()
+        while self._has_annotation():
+            notes.add(self._advance().value)
         if self._has_assignment():
             bv = self._basevar()
             self._expect_punct('=')
             fc = self._funcall()
             fc.ret = [bv]
-            self._finish_func(fc)
         else:
             fc = self._funcall()
-            self._finish_func(fc)
+        fc.vectorize = "vectorize" in notes
+        fc.hot = "hot" in notes
+        self._finish_func(fc)
+
+    def _has_annotation(self):
+        """Lookahead: is the next token a 'vectorize' or 'hot' annotation?
+
+        These are only keywords in front of a call, so they remain usable
+        as function or type names ('vectorize(...)', 'hot x = ...').
+        """
+        t = self._tokens
+        i = self._pos
+        return (len(t) > i + 2 and
+                t[i].type == TokenType.ID and t[i].value in ("vectorize", "hot") and
+                t[i+1].type in (TokenType.ID, TokenType.FORTRAN, TokenType.NEW) and
+                not (t[i+2].type == TokenType.PUNCT and t[i+2].value in ('=', '[')))
 
     def _has_assignment(self):
         """Lookahead: is there a '=' before '(' or ';'?"""
@@ -216,15 +256,19 @@ class Parser:
         space = self._expect(TokenType.ID).value
         name = self._expect(TokenType.ID).value
         self._expect_punct(';')
-
-        if space == "numeric":
-            self.ctx.add_scalar_type(name)
-        elif space == "dcomplex":
-            self.ctx.add_zscalar_type(name)
-        elif space == "fcomplex":
-            self.ctx.add_cscalar_type(name)
-        elif space == "mxArray":
-            self.ctx.add_mxarray_type(name)
+        self._add_typedef(space, name)
+
+    # typedef space -> MwrapContext registration method
+    TYPESPACES = {
+        "numeric":  "add_scalar_type",
+        "dcomplex": "add_zscalar_type",
+        "fcomplex": "add_cscalar_type",
+        "mxArray":  "add_mxarray_type",
+    }
+
+    def _add_typedef(self, space, name):
+        if space in self.TYPESPACES:
+            getattr(self.ctx, self.TYPESPACES[space])(name)
         else:
             print(f"Unrecognized typespace: {space}", file=sys.stderr)
             self.type_errs += 1
@@ -236,6 +280,9 @@ class Parser:
         self._expect_punct(':')
         parents = self._inheritslist()
         self._expect_punct(';')
+        self._add_class(child, parents)
+
+    def _add_class(self, child, parents):
         add_inherits(self.ctx, child, parents)
 
     def _inheritslist(self):
@@ -370,10 +417,10 @@ class Parser:
         """quals ::= '*' | '&' | aqual"""
         if self._at_punct('*'):
             self._advance()
-            return TypeQual('*')
+            return _POINTER
         if self._at_punct('&'):
             self._advance()
-            return TypeQual('&')
+            return _REFERENCE
         return self._aqual()
 
     def _aqual(self):
@@ -433,21 +480,28 @@ class Parser:
     # Post-parse: typecheck, MATLAB stub, add to func list
     # ------------------------------------------------------------------
 
-    def _finish_func(self, func):
+    def _finish_func(self, func, line=None):
         """Typecheck, emit MATLAB stub, add to function list."""
+        if line is None:
+            line = self._line()
+        self.type_errs += typecheck(self.ctx, func, line)
+        self._emit_func(func)
+
+    def _emit_func(self, func, ids=None):
+        """Number a typechecked func, emit its MATLAB stub and add it."""
         self.func_id += 1
         func.id = self.func_id
 
-        self.type_errs += typecheck(self.ctx, func, self._line())
-
         if self.lexer.outfp:
             print_matlab_call(self.lexer.outfp, func, self.mexfunc)
 
-        self._add_func(func)
+        self._add_func(func, ids)
 
-    def _add_func(self, func):
+    def _add_func(self, func, ids=None):
         """Add func to list; deduplicate via id_string."""
-        ids = id_string(self.ctx, func)
+        note_int_uses(self.ctx, func)
+        if ids is None:
+            ids = id_string(self.ctx, func)
 
         first = self.func_lookup.get(ids)
         if first:
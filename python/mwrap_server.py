@@ -0,0 +1,232 @@
+"""
+mwrap_server.py — Serve mwrap runs from a long-lived process (-server).
+
+Copyright (c) 2007-2008  David Bindel
+See the file COPYING for copying permissions
+
+Starting Python and importing the generator costs more than generating
+a typical interface.  `mwrap -server SOCKET` pays that once and then
+answers requests on the Unix socket SOCKET.  When the environment
+variable MWRAP_SERVER names the socket, `mwrap` sends its command line
+and working directory there and prints the reply; if no server answers
+it runs locally as usual.
+
+Requests are handled one at a time.  Each runs in the client's working
+directory with stdout and stderr captured and sent back with the exit
+status.  The server keeps the parse of every input file (recorded as in
+mwrap_parallel) and replays it while neither the file nor anything it
+@includes has changed.  It exits as soon as an mwrap source file
+changes, so a modified tool is never served stale.
+
+Protocol: the client sends its working directory and arguments, each
+followed by a NUL byte, and shuts down its side of the connection.  The
+server replies with a line "rc len(stdout) len(stderr)" followed by the
+UTF-8 text of both streams, or closes the connection without a reply if
+the client should run locally.  The client imports nothing beyond
+socket, so that forwarding stays cheap; modules only the server needs
+are imported where they are used.
+"""
+
+import os
+import socket
+import sys
+
+
+def _recv_all(conn):
+    chunks = []
+    while True:
+        chunk = conn.recv(1 << 16)
+        if not chunk:
+            return b"".join(chunks)
+        chunks.append(chunk)
+
+
+def _stamp(name):
+    try:
+        st = os.stat(name)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _tool_stamps():
+    tool_dir = os.path.dirname(os.path.abspath(__file__))
+    return {name: _stamp(os.path.join(tool_dir, name))
+            for name in os.listdir(tool_dir) if name.startswith("mwrap")}
+
+
+# ---------------------------------------------------------------------------
+# Client
+# ---------------------------------------------------------------------------
+
+def forward(path, argv):
+    """Run mwrap with *argv* on the server at *path*.  Return its exit
+    status, or None if no server answered."""
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    request = "".join(arg + "\0" for arg in [os.getcwd()] + argv)
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+            s.connect(path)
+            s.sendall(request.encode("utf-8", "surrogateescape"))
+            s.shutdown(socket.SHUT_WR)
+            reply = _recv_all(s)
+        header, _, body = reply.partition(b"\n")
+        rc, nout, nerr = map(int, header.split())
+    except (OSError, ValueError):
+        return None
+    if len(body) != nout + nerr:
+        return None
+    sys.stdout.write(body[:nout].decode("utf-8", "surrogateescape"))
+    sys.stderr.write(body[nout:].decode("utf-8", "surrogateescape"))
+    return rc
+
+
+# ---------------------------------------------------------------------------
+# Server
+# ---------------------------------------------------------------------------
+
+class ParseCache:
+    """Recorded parses of input files, keyed by working directory, file
+    name and options, and kept while the file and its @includes are
+    unchanged."""
+
+    def __init__(self):
+        self._entries = {}
+
+    def parse_files(self, input_files, options, ctx, mbatching, listing,
+                    has_m, has_c):
+        """Return one thunk per file that yields its recorded parse, in
+        the form mwrap_parallel.replay expects."""
+        import pickle
+
+        # Workers start from the context as it is before any typedefs
+        start = pickle.dumps(ctx)
+        key = (os.getcwd(), repr(sorted(options.items())), has_m, has_c)
+        return [lambda name=name: self._parse(name, key, start, mbatching,
+                                              listing, has_m, has_c)
+                for name in input_files]
+
+    def _parse(self, infile, key, start, mbatching, listing, has_m, has_c):
+        import pickle
+        from mwrap_parallel import parse_file
+
+        entry = self._entries.get((key, infile))
+        if entry and all(_stamp(name) == stamp
+                         for name, stamp in entry[1].items()):
+            return pickle.loads(entry[0])
+
+        result = parse_file(infile, pickle.loads(start), mbatching, listing,
+                            has_m, has_c)
+        # Errors may depend on files that do not exist yet; parse again
+        clean = not result.err_flag and not any(
+            e[0] in ("err", "exit") for e in result.events)
+        if clean:
+            stamps = {name: _stamp(name) for name in [infile] + result.sources}
+            self._entries[key, infile] = (pickle.dumps(result), stamps)
+        else:
+            self._entries.pop((key, infile), None)
+        return result
+
+
+def _run_request(request, run, cache):
+    """Run one request in its working directory; return the reply."""
+    import io
+
+    fields = request.decode("utf-8", "surrogateescape").split("\0")[:-1]
+    if not fields:
+        return b""
+    cwd, *argv = fields
+    out, err = io.StringIO(), io.StringIO()
+    stdout, stderr = sys.stdout, sys.stderr
+    home = os.getcwd()
+    sys.stdout, sys.stderr = out, err
+    try:
+        os.chdir(cwd)
+        rc = run(argv, cache)
+    except SystemExit as e:
+        rc = e.code
+    except Exception:
+        import traceback
+        traceback.print_exc()
+        rc = 1
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+        os.chdir(home)
+
+    # Exit statuses as sys.exit would report them
+    if rc is None:
+        rc = 0
+    elif not isinstance(rc, int):
+        err.write(f"{rc}\n")
+        rc = 1
+    out = out.getvalue().encode("utf-8", "surrogateescape")
+    err = err.getvalue().encode("utf-8", "surrogateescape")
+    return b"%d %d %d\n" % (rc, len(out), len(err)) + out + err
+
+
+def _remove_socket(path):
+    """Remove *path* if it is a Unix socket; return True if it was."""
+    import stat
+
+    try:
+        if not stat.S_ISSOCK(os.lstat(path).st_mode):
+            return False
+        os.unlink(path)
+    except OSError:
+        return False
+    return True
+
+
+def serve(path, run):
+    """Answer requests on the Unix socket *path* with run(argv, cache)
+    until interrupted or until the mwrap sources change."""
+    import signal
+
+    if not hasattr(socket, "AF_UNIX"):
+        sys.stderr.write("Error: -server needs Unix domain sockets\n")
+        return 1
+
+    path = os.path.abspath(path)
+    stamps = _tool_stamps()
+    cache = ParseCache()
+
+    # A socket left by an earlier server is replaced; anything else is kept
+    if not _remove_socket(path) and os.path.lexists(path):
+        sys.stderr.write(f"Error: Could not listen on {path}: not a socket\n")
+        return 1
+    srv = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Only the owner may connect: requests write files as this user
+    umask = os.umask(0o077)
+    try:
+        srv.bind(path)
+    except OSError as e:
+        sys.stderr.write(f"Error: Could not listen on {path}: {e}\n")
+        return 1
+    finally:
+        os.umask(umask)
+    srv.listen(64)
+    # Remove the socket on kill as well as on Ctrl-C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    try:
+        while True:
+            conn, _ = srv.accept()
+            with conn:
+                try:
+                    request = _recv_all(conn)
+                except OSError:
+                    continue
+                if _tool_stamps() != stamps:
+                    break
+                reply = _run_request(request, run, cache)
+                try:
+                    conn.sendall(reply)
+                except OSError:
+                    pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.close()
+        _remove_socket(path)
+    return 0
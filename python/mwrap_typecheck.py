@@ -62,8 +62,9 @@ def label_args(f):
 # Type-info assignment
 # ---------------------------------------------------------------------------
 
-def _assign_scalar_tinfo(v, line, tags, tagp, tagr, taga, tagar):
-    """Assign tinfo for a scalar/complex type. Returns error count."""
+def _assign_scalar_tinfo(v, line, tags, tagp, tagr, taga, tagar, nd=False):
+    """Assign tinfo for a scalar/complex type. Returns error count.
+    With nd, arrays may have any number of dimensions."""
     if not v.qual:
         v.tinfo = tags
     elif v.qual.qual == '*':
@@ -73,7 +74,7 @@ def _assign_scalar_tinfo(v, line, tags, tagp, tagr, taga, tagar):
     elif v.qual.qual == 'a':
         v.tinfo = taga
         # check max 2D
-        if len(v.qual.args) > 2:
+        if len(v.qual.args) > 2 and not nd:
             print(f"Error ({line}): Array {v.name} should be 1D or 2D",
                   file=sys.stderr)
             return 1
@@ -83,7 +84,7 @@ def _assign_scalar_tinfo(v, line, tags, tagp, tagr, taga, tagar):
             print(f"Error ({line}): Array ref {v.name} must be to a real array",
                   file=sys.stderr)
             return 1
-        if len(v.qual.args) > 2:
+        if len(v.qual.args) > 2 and not nd:
             print(f"Error ({line}): Array {v.name} should be 1D or 2D",
                   file=sys.stderr)
             return 1
@@ -95,19 +96,21 @@ def _assign_scalar_tinfo(v, line, tags, tagp, tagr, taga, tagar):
 def assign_tinfo(ctx, v, line):
     """Assign VT_* tinfo to a single Var. Returns error count."""
     bt = v.basetype
+    # gpuArray outputs are created with at most two dimensions
+    nd = ctx.mw_nd_arrays and v.devicespec != 'g'
 
     if ctx.is_scalar_type(bt):
         return _assign_scalar_tinfo(v, line,
                                     VT.scalar, VT.p_scalar, VT.r_scalar,
-                                    VT.array, VT.rarray)
+                                    VT.array, VT.rarray, nd)
     elif ctx.is_cscalar_type(bt):
         return _assign_scalar_tinfo(v, line,
                                     VT.cscalar, VT.p_cscalar, VT.r_cscalar,
-                                    VT.carray, VT.unk)
+                                    VT.carray, VT.unk, nd)
     elif ctx.is_zscalar_type(bt):
         return _assign_scalar_tinfo(v, line,
                                     VT.zscalar, VT.p_zscalar, VT.r_zscalar,
-                                    VT.zarray, VT.unk)
+                                    VT.zarray, VT.unk, nd)
     elif bt == "const":
         if v.qual:
             print(f"Error ({line}): Constant {v.name} cannot have modifiers",
@@ -136,6 +139,17 @@ def assign_tinfo(ctx, v, line):
             return 1
         v.tinfo = VT.mx
 
+    elif bt == "sparse":
+        if v.devicespec == 'g':
+            print(f"Error ({line}): Sparse matrix {v.name} cannot be a gpuArray",
+                  file=sys.stderr)
+            return 1
+        if v.qual and not (v.qual.qual == 'a' and len(v.qual.args) == 3):
+            print(f"Error ({line}): Sparse matrix {v.name} takes dims [m,n,nzmax] only",
+                  file=sys.stderr)
+            return 1
+        v.tinfo = VT.sparse
+
     else:
         # Object type
         if not v.qual:
@@ -180,6 +194,10 @@ def _typecheck_return(ctx, ret, line):
         print(f"Error ({line}): Return string {v.name} cannot have dims",
               file=sys.stderr)
         err += 1
+    elif v.tinfo == VT.sparse:
+        print(f"Error ({line}): Cannot return sparse matrix {v.name}; use an output argument",
+              file=sys.stderr)
+        err += 1
     return err
 
 
@@ -192,6 +210,11 @@ def _typecheck_args(ctx, args, line):
     for v in args:
         err += assign_tinfo(ctx, v, line)
 
+        if v.tinfo == VT.sparse and v.iospec == 'i' and v.qual:
+            print(f"Error ({line}): Sparse input {v.name} cannot have dims",
+                  file=sys.stderr)
+            err += 1
+
         if iospec_is_inonly(v.iospec):
             continue
 
@@ -232,6 +255,14 @@ def _typecheck_args(ctx, args, line):
             print(f"Error ({line}): mxArray {v.name} cannot be used for inout",
                   file=sys.stderr)
             err += 1
+        elif v.tinfo == VT.sparse and v.iospec == 'b':
+            print(f"Error ({line}): Sparse matrix {v.name} cannot be used for inout",
+                  file=sys.stderr)
+            err += 1
+        elif v.tinfo == VT.sparse and not v.qual:
+            print(f"Error ({line}): Output sparse matrix {v.name} must have dims [m,n,nzmax]",
+                  file=sys.stderr)
+            err += 1
 
     return err
 
@@ -252,6 +283,10 @@ def _fortranize_args_var(args, line):
             print(f"Error ({line}): Cannot pass pointer ref {v.name} to FORTRAN",
                   file=sys.stderr)
             err += 1
+        elif v.tinfo == VT.sparse:
+            print(f"Error ({line}): Cannot pass sparse matrix {v.name} to FORTRAN",
+                  file=sys.stderr)
+            err += 1
         elif v.tinfo == VT.string:
             print(f"Warning ({line}): Danger passing C string {v.name} to FORTRAN",
                   file=sys.stderr)
@@ -286,13 +321,44 @@ def _fortranize_args(f, line):
     return err
 
 
+# ---------------------------------------------------------------------------
+# Vectorized calls
+# ---------------------------------------------------------------------------
+
+def _typecheck_vectorize(f, line):
+    """A batched stub loops over real scalars only. Returns error count."""
+    if not f.vectorize:
+        return 0
+    err = 0
+    if f.thisv or f.funcv == "new":
+        print(f"Error ({line}): Cannot vectorize method or constructor {f.funcv}",
+              file=sys.stderr)
+        err += 1
+    if f.ret and f.ret[0].tinfo != VT.scalar:
+        print(f"Error ({line}): Vectorized return {f.ret[0].name} must be a real scalar",
+              file=sys.stderr)
+        err += 1
+    for v in f.args:
+        if v.tinfo == VT.const:
+            continue
+        if v.devicespec == 'g' or not (
+                (v.tinfo == VT.scalar and v.iospec == 'i') or
+                v.tinfo in (VT.p_scalar, VT.r_scalar)):
+            print(f"Error ({line}): Vectorized argument {v.name} must be a real scalar",
+                  file=sys.stderr)
+            err += 1
+    return err
+
+
 # ---------------------------------------------------------------------------
 # Top-level typecheck
 # ---------------------------------------------------------------------------
 
 def typecheck(ctx, f, line):
     """Run full semantic analysis on a Func. Returns error count."""
+    f.sig = None        # the signature depends on the const args found
     label_args(f)
     return (_typecheck_return(ctx, f.ret, line) +
             _typecheck_args(ctx, f.args, line) +
-            _fortranize_args(f, line))
+            _fortranize_args(f, line) +
+            _typecheck_vectorize(f, line))
@@ -482,14 +482,17 @@ void mex_casting_getter(FILE* fp, const char* cname,
             "        return NULL;\n"
             "    if (!mxIsChar(a)) {\n"
             "#ifdef R2008OO\n"
-            "        mxArray* ap = mxGetProperty(a, 0, \"mwptr\");\n"
-            "        if (ap)\n"
-            "            return mxWrapGetP_%s(ap, e);\n"
+            "        mxArray* ap = mxWrapGetPtrProp(a);\n"
+            "        if (ap) {\n"
+            "            %s* p = mxWrapGetP_%s(ap, e);\n"
+            "            mxWrapFreePtrProp(ap);\n"
+            "            return p;\n"
+            "        }\n"
             "#endif\n"
             "        *e = \"Invalid pointer\";\n"
             "        return NULL;\n"
             "    }\n"
-            "    mxGetString(a, pbuf, sizeof(pbuf));\n\n", cname);
+            "    mxGetString(a, pbuf, sizeof(pbuf));\n\n", cname, cname);
 
     mex_casting_getter_type(fp, cname);
     for (InheritsDecl* i = inherits; i; i = i->next)
@@ -0,0 +1,471 @@
+/*
+ * bench_copiers.c - throughput of the mwrap_support.c array copiers.
+ *
+ * Times the copiers that mwrap generates for array arguments and return
+ * values against the loops they replaced (kept below with a _ref suffix),
+ * for several MATLAB-class/C-type pairs, and checks that both produce the
+ * same data.  Build and run from MATLAB or Octave as
+ *
+ *   mex -O -I../python bench_copiers.c         (or mkoctfile --mex ...)
+ *   bench_copiers                              % 1e6 elements, 20 repeats
+ *   r = bench_copiers(n, reps);                % r(k,:) = [ref new] in MB/s
+ *
+ * Add -DMX_HAS_INTERLEAVED_COMPLEX=0 (or -R2017b) to time the separate
+ * real/imaginary copiers instead.
+ */
+
+#include <string.h>
+#include <time.h>
+#include <complex.h>
+#include "mwrap_support.c"
+
+typedef _Complex double dcomplex;
+#define real_dcomplex(z) creal(z)
+#define imag_dcomplex(z) cimag(z)
+#define setz_dcomplex(z,r,i)  *z = r + i*_Complex_I
+typedef unsigned char uchar;
+
+
+/* ---- Copiers as they were before the indexed kernels ---- */
+
+#if MX_HAS_INTERLEAVED_COMPLEX
+
+#define mxWrapGetArrayDef_ref(func, T) \
+T* func(const mxArray* a, const char** e)     \
+{ \
+    T* array; \
+    mwSize arraylen; \
+    mwIndex i; \
+    T* p; \
+    double* q; \
+    mxComplexDouble* z; \
+    if (!a || mxGetClassID(a) != mxDOUBLE_CLASS) { \
+        *e = "Invalid array argument, mxDOUBLE_CLASS expected"; \
+        return 0; \
+    } \
+    arraylen = mxGetM(a)*mxGetN(a); \
+    array = (T*) mxWrapTempAlloc(mxGetM(a)*mxGetN(a) * sizeof(T)); \
+    p = array; \
+    if( mxIsComplex(a) ) \
+      { \
+	z = mxGetComplexDoubles(a);	   \
+	for (i = 0; i < arraylen; ++i)		\
+	  *p++ = (T) (*z++).real;			\
+      } \
+    else \
+      {				   \
+	q = mxGetDoubles(a);	   \
+	for (i = 0; i < arraylen; ++i)		\
+	  *p++ = (T) (*q++);			\
+      } \
+    return array; \
+}
+
+
+#define mxWrapReturnDef_ref(func, T) \
+mxArray* func(const T* q, mwSize m, mwSize n) \
+{ \
+    mwIndex i; \
+    double* p; \
+    if (!q) { \
+        return mxCreateDoubleMatrix(0,0, mxREAL); \
+    } else { \
+        mxArray* a = mxCreateDoubleMatrix(m,n, mxREAL); \
+        p = mxGetDoubles(a); \
+        for (i = 0; i < m*n; ++i) \
+	  *p++ = (double) *q++;	  \
+        return a; \
+    } \
+}
+
+
+#define mxWrapGetArrayZDef_ref(func, T, ZT, setz)      \
+T* func(const mxArray* a, const char** e)     \
+{ \
+    T* array; \
+    mwSize arraylen; \
+    mwIndex i; \
+    T* p; \
+    double* q; \
+    mxComplexDouble* z; \
+    if (!a || mxGetClassID(a) != mxDOUBLE_CLASS) { \
+        *e = "Invalid array argument, mxDOUBLE_CLASS expected"; \
+        return 0; \
+    } \
+    arraylen = mxGetM(a)*mxGetN(a); \
+    array = (T*) mxWrapTempAlloc(mxGetM(a)*mxGetN(a) * sizeof(T)); \
+    p = array; \
+    if( mxIsComplex(a) ) \
+      { \
+	z = mxGetComplexDoubles(a);	   \
+	for (i = 0; i < arraylen; ++i) {	\
+	  setz(p, (ZT) (*z).real, (ZT) (*z).imag);	\
+  	  ++p; ++z; }					\
+      } \
+    else \
+      {				   \
+	q = mxGetDoubles(a);	   \
+	for (i = 0; i < arraylen; ++i)	{	\
+	  setz(p, (ZT) (*q), (ZT) 0 );		\
+          ++p; ++q; }			\
+      }						\
+    return array; \
+}
+
+
+#define mxWrapReturnZDef_ref(func, T, freal, fimag)	      \
+mxArray* func(const T* q, mwSize m, mwSize n) \
+{ \
+    mwIndex i; \
+    mxComplexDouble* p; \
+    if (!q) { \
+        return mxCreateDoubleMatrix(0,0, mxCOMPLEX); \
+    } else { \
+        mxArray* a = mxCreateDoubleMatrix(m,n, mxCOMPLEX); \
+        p = mxGetComplexDoubles(a); \
+        for (i = 0; i < m*n; ++i) {	  \
+          (*p).real = freal(*q);			\
+	  (*p).imag = fimag(*q);			\
+	  ++p; ++q; 	}			\
+        return a; \
+    } \
+}
+
+
+#define mxWrapGetArrayDef_single_ref(func, T) \
+T* func(const mxArray* a, const char** e)     \
+{ \
+    T* array; \
+    mwSize arraylen; \
+    mwIndex i; \
+    T* p; \
+    float* q; \
+    mxComplexSingle* z; \
+    if (!a || mxGetClassID(a) != mxSINGLE_CLASS) { \
+        *e = "Invalid array argument, mxSINGLE_CLASS expected"; \
+        return 0; \
+    } \
+    arraylen = mxGetM(a)*mxGetN(a); \
+    array = (T*) mxWrapTempAlloc(mxGetM(a)*mxGetN(a) * sizeof(T)); \
+    p = array; \
+    if( mxIsComplex(a) ) \
+      { \
+	z = mxGetComplexSingles(a);	   \
+	for (i = 0; i < arraylen; ++i)		\
+	  *p++ = (T) (*z++).real;			\
+      } \
+    else \
+      {				   \
+	q = mxGetSingles(a);	   \
+	for (i = 0; i < arraylen; ++i)		\
+	  *p++ = (T) (*q++);			\
+      } \
+    return array; \
+}
+
+#else
+
+#define mxWrapGetArrayDef_ref(func, T) \
+T* func(const mxArray* a, const char** e)     \
+{ \
+    T* array; \
+    mwSize arraylen; \
+    mwIndex i; \
+    T* p; \
+    double* q; \
+    if (!a || mxGetClassID(a) != mxDOUBLE_CLASS) { \
+        *e = "Invalid array argument, mxDOUBLE_CLASS expected"; \
+        return 0; \
+    } \
+    arraylen = mxGetM(a)*mxGetN(a); \
+    array = (T*) mxWrapTempAlloc(mxGetM(a)*mxGetN(a) * sizeof(T)); \
+    p = array; \
+    q = mxGetPr(a); \
+    for (i = 0; i < arraylen; ++i) \
+        *p++ = (T) (*q++); \
+    return array; \
+}
+
+
+#define mxWrapReturnDef_ref(func, T) \
+mxArray* func(const T* q, mwSize m, mwSize n) \
+{ \
+    mwIndex i; \
+    double* p; \
+    if (!q) { \
+        return mxCreateDoubleMatrix(0,0, mxREAL); \
+    } else { \
+        mxArray* a = mxCreateDoubleMatrix(m,n, mxREAL); \
+        p = mxGetPr(a); \
+        for (i = 0; i < m*n; ++i) \
+            *p++ = *q++; \
+        return a; \
+    } \
+}
+
+
+#define mxWrapGetArrayZDef_ref(func, T, ZT, setz) \
+T* func(const mxArray* a, const char** e) \
+{ \
+    T* array; \
+    mwSize arraylen; \
+    mwIndex i; \
+    T* p; \
+    double* qr; \
+    double* qi; \
+    if (!a || mxGetClassID(a) != mxDOUBLE_CLASS) { \
+        *e = "Invalid array argument, mxDOUBLE_CLASS expected"; \
+        return 0; \
+    } \
+    arraylen = mxGetM(a)*mxGetN(a); \
+    array = (T*) mxWrapTempAlloc(mxGetM(a)*mxGetN(a) * sizeof(T)); \
+    p = array; \
+    qr = mxGetPr(a); \
+    qi = mxGetPi(a); \
+    for (i = 0; i < arraylen; ++i) { \
+        ZT val_qr = *qr++; \
+        ZT val_qi = (qi ? (ZT) *qi++ : (ZT) 0); \
+        setz(p, val_qr, val_qi); \
+        ++p; \
+    } \
+    return array; \
+}
+
+
+#define mxWrapReturnZDef_ref(func, T, real, imag) \
+mxArray* func(const T* q, mwSize m, mwSize n) \
+{ \
+    mwIndex i; \
+    double* pr; \
+    double* pi; \
+    if (!q) { \
+        return mxCreateDoubleMatrix(0,0, mxCOMPLEX); \
+    } else { \
+        mxArray* a = mxCreateDoubleMatrix(m,n, mxCOMPLEX); \
+        pr = mxGetPr(a); \
+        pi = mxGetPi(a); \
+        for (i = 0; i < m*n; ++i) { \
+            *pr++ = real(*q); \
+            *pi++ = imag(*q); \
+            ++q; \
+        } \
+        return a; \
+    } \
+}
+
+
+#define mxWrapGetArrayDef_single_ref(func, T) \
+T* func(const mxArray* a, const char** e)     \
+{ \
+    T* array; \
+    mwSize arraylen; \
+    mwIndex i; \
+    T* p; \
+    float* q; \
+    if (!a || mxGetClassID(a) != mxSINGLE_CLASS) { \
+        *e = "Invalid array argument, mxSINGLE_CLASS expected"; \
+        return 0; \
+    } \
+    arraylen = mxGetM(a)*mxGetN(a); \
+    array = (T*) mxWrapTempAlloc(mxGetM(a)*mxGetN(a) * sizeof(T)); \
+    p = array; \
+    q = (float*) mxGetData(a);	   \
+    for (i = 0; i < arraylen; ++i) \
+        *p++ = (T) (*q++); \
+    return array; \
+}
+
+#endif
+
+
+/* ---- Instances ---- */
+
+#define BENCH_REAL(T) \
+mxWrapGetArrayDef(get_##T, T) \
+mxWrapGetArrayDef_ref(get_##T##_ref, T) \
+mxWrapReturnDef(ret_##T, T) \
+mxWrapReturnDef_ref(ret_##T##_ref, T)
+
+BENCH_REAL(double)
+BENCH_REAL(float)
+BENCH_REAL(int)
+BENCH_REAL(uchar)
+mxWrapGetArrayDef_single(get_single_float, float)
+mxWrapGetArrayDef_single_ref(get_single_float_ref, float)
+mxWrapGetArrayZDef(get_dcomplex, dcomplex, double, setz_dcomplex)
+mxWrapGetArrayZDef_ref(get_dcomplex_ref, dcomplex, double, setz_dcomplex)
+mxWrapReturnZDef(ret_dcomplex, dcomplex, real_dcomplex, imag_dcomplex)
+mxWrapReturnZDef_ref(ret_dcomplex_ref, dcomplex, real_dcomplex, imag_dcomplex)
+
+
+/* ---- Benchmark ---- */
+
+typedef struct {
+    const char* name;   /* MATLAB class -> C type, or back */
+    int in;             /* 1 = time get, 0 = time ret on get's output */
+    mxClassID cls;      /* class of the MATLAB side */
+    mxComplexity cplx;  /* complexity of the MATLAB side */
+    size_t csize;       /* bytes per element on the C side */
+    void* (*get[2])(const mxArray*, const char**);
+    mxArray* (*ret[2])(const void*, mwSize, mwSize);
+} bench_t;
+
+#define GET(f) {(void* (*)(const mxArray*, const char**)) f##_ref, \
+                 (void* (*)(const mxArray*, const char**)) f}
+#define RET(f) {(mxArray* (*)(const void*, mwSize, mwSize)) f##_ref, \
+                 (mxArray* (*)(const void*, mwSize, mwSize)) f}
+
+static bench_t benches[] = {
+    {"double  -> double",   1, mxDOUBLE_CLASS, mxREAL,    sizeof(double),
+     GET(get_double), {0, 0}},
+    {"double  -> float",    1, mxDOUBLE_CLASS, mxREAL,    sizeof(float),
+     GET(get_float), {0, 0}},
+    {"double  -> int",      1, mxDOUBLE_CLASS, mxREAL,    sizeof(int),
+     GET(get_int), {0, 0}},
+    {"double  -> uchar",    1, mxDOUBLE_CLASS, mxREAL,    sizeof(uchar),
+     GET(get_uchar), {0, 0}},
+    {"single  -> float",    1, mxSINGLE_CLASS, mxREAL,    sizeof(float),
+     GET(get_single_float), {0, 0}},
+    {"complex -> dcomplex", 1, mxDOUBLE_CLASS, mxCOMPLEX, sizeof(dcomplex),
+     GET(get_dcomplex), {0, 0}},
+    {"double  <- double",   0, mxDOUBLE_CLASS, mxREAL,    sizeof(double),
+     GET(get_double), RET(ret_double)},
+    {"double  <- float",    0, mxDOUBLE_CLASS, mxREAL,    sizeof(float),
+     GET(get_float), RET(ret_float)},
+    {"double  <- int",      0, mxDOUBLE_CLASS, mxREAL,    sizeof(int),
+     GET(get_int), RET(ret_int)},
+    {"complex <- dcomplex", 0, mxDOUBLE_CLASS, mxCOMPLEX, sizeof(dcomplex),
+     GET(get_dcomplex), RET(ret_dcomplex)}
+};
+
+#define NBENCH (sizeof(benches) / sizeof(benches[0]))
+
+
+/* Fill the MATLAB side with small integers every C type can hold */
+static mxArray* bench_input(bench_t* b, mwSize n)
+{
+    mxArray* a = mxCreateNumericMatrix(n, 1, b->cls, b->cplx);
+    size_t i, nr = n;
+#if MX_HAS_INTERLEAVED_COMPLEX
+    if (b->cplx == mxCOMPLEX)
+        nr = 2*n;
+#else
+    if (b->cplx == mxCOMPLEX) {
+        double* pi = mxGetPi(a);
+        for (i = 0; i < n; ++i)
+            pi[i] = (double) (i % 89);
+    }
+#endif
+    for (i = 0; i < nr; ++i) {
+        if (b->cls == mxSINGLE_CLASS)
+            ((float*) mxGetData(a))[i] = (float) (i % 97);
+        else
+            ((double*) mxGetData(a))[i] = (double) (i % 97);
+    }
+    return a;
+}
+
+
+/* Compare the data of two outputs of a return copier */
+static int bench_same_array(const mxArray* a, const mxArray* b, mwSize n)
+{
+    size_t bytes = n * (mxGetClassID(a) == mxSINGLE_CLASS ? 4 : 8);
+#if MX_HAS_INTERLEAVED_COMPLEX
+    if (mxIsComplex(a))
+        bytes *= 2;
+#else
+    if (mxIsComplex(a) &&
+        memcmp(mxGetImagData(a), mxGetImagData(b), bytes) != 0)
+        return 0;
+#endif
+    return memcmp(mxGetData(a), mxGetData(b), bytes) == 0;
+}
+
+
+/* Time one call of copier k of b, in seconds */
+static double bench_once(bench_t* b, int k, const mxArray* a,
+                         const void* c, mwSize n)
+{
+    const char* e = NULL;
+    clock_t t0 = clock();
+    if (b->in)
+        mxFree(b->get[k](a, &e));
+    else
+        mxDestroyArray(b->ret[k](c, n, 1));
+    return (double) (clock() - t0) / CLOCKS_PER_SEC;
+}
+
+
+/*
+ * Time reps calls of each copier of b and store MB/s of C-side data in
+ * rate.  The two copiers alternate after one untimed call each, so that
+ * neither gains from the allocator or the caches warmed by the other.
+ */
+static void bench_run(bench_t* b, const mxArray* a, const void* c,
+                      mwSize n, int reps, double rate[2])
+{
+    double secs[2] = {0, 0};
+    int r, k;
+
+    for (k = 0; k < 2; ++k)
+        bench_once(b, k, a, c, n);
+    for (r = 0; r < reps; ++r)
+        for (k = 0; k < 2; ++k)
+            secs[k] += bench_once(b, k, a, c, n);
+    for (k = 0; k < 2; ++k) {
+        if (secs[k] <= 0)
+            secs[k] = 1.0 / CLOCKS_PER_SEC;
+        rate[k] = (double) n * b->csize * reps / secs[k] / 1e6;
+    }
+}
+
+
+void mexFunction(int nlhs, mxArray* plhs[],
+                 int nrhs, const mxArray* prhs[])
+{
+    mwSize n = 1000000;
+    int reps = 20;
+    double* result = NULL;
+    size_t k;
+
+    if (nrhs > 0) n = (mwSize) mxGetScalar(prhs[0]);
+    if (nrhs > 1) reps = (int) mxGetScalar(prhs[1]);
+    if (nlhs > 0) {
+        plhs[0] = mxCreateDoubleMatrix(NBENCH, 2, mxREAL);
+        result = mxGetPr(plhs[0]);
+    }
+
+    mexPrintf("%-20s %10s %10s %8s\n", "pair", "ref MB/s", "new MB/s", "speedup");
+    for (k = 0; k < NBENCH; ++k) {
+        bench_t* b = &benches[k];
+        mxArray* a = bench_input(b, n);
+        const char* e = NULL;
+        void* c = b->in ? NULL : b->get[1](a, &e);
+        double rate[2];
+        int same;
+
+        if (b->in) {
+            void* p0 = b->get[0](a, &e);
+            void* p1 = b->get[1](a, &e);
+            same = memcmp(p0, p1, n * b->csize) == 0;
+            mxFree(p0);
+            mxFree(p1);
+        } else {
+            mxArray* a0 = b->ret[0](c, n, 1);
+            mxArray* a1 = b->ret[1](c, n, 1);
+            same = bench_same_array(a0, a1, n);
+            mxDestroyArray(a0);
+            mxDestroyArray(a1);
+        }
+
+        bench_run(b, a, c, n, reps, rate);
+        mexPrintf("%-20s %10.0f %10.0f %7.2fx%s\n", b->name, rate[0], rate[1],
+                  rate[1] / rate[0], same ? "" : "  MISMATCH");
+        if (result) {
+            result[k] = rate[0];
+            result[k + NBENCH] = rate[1];
+        }
+        mxFree(c);
+        mxDestroyArray(a);
+    }
+}
@@ -8,3 +8,25 @@ test_redirect;
 test_include;
 test_single;
 test_char;
+if exist('test_split.m'), test_split; end
+if exist('test_vectorize.m'), test_vectorize; end
+% Python mwrap only: test_transfers.mw again under other options, each
+% built in its own directory
+% -inplace must give the same results as the copying build
+if exist('inplace/test_inplace.m')
+  test_inplace;
+  cd inplace; test_transfers; test_inplace; cd ..
+end
+if exist('zerocopy/test_zerocopy.m')
+  cd zerocopy; test_transfers; test_zerocopy; cd ..
+end
+if exist('arena/test_hot.m'), cd arena; test_transfers; test_hot; cd ..; end
+if exist('threads/test_threads.m')
+  setenv('MWRAP_THREADS', '4');
+  cd threads;
+  test_transfers;
+  test_transfers_threadsmex('*threads*', 3, 1);
+  test_transfers;
+  test_threads;
+  cd ..
+end
@@ -47,6 +47,123 @@
  */
 int* mexprofrecord_= NULL;
 
+#ifdef R2008OO
+/*
+ * classdef objects hold their handle in the property mwptr.
+ * mxGetProperty returns a copy, which must be freed; with
+ * MWRAP_PROPERTY_SHARED the (undocumented) mxGetPropertyShared
+ * reads the property in place instead.
+ */
+#ifdef MWRAP_PROPERTY_SHARED
+#ifdef __cplusplus
+extern "C"
+#endif
+mxArray* mxGetPropertyShared(const mxArray* a, mwIndex i, const char* name);
+#define mxWrapGetPtrProp(a)   mxGetPropertyShared(a, 0, "mwptr")
+#define mxWrapFreePtrProp(ap) ((void) 0)
+#else
+#define mxWrapGetPtrProp(a)   mxGetProperty(a, 0, "mwptr")
+#define mxWrapFreePtrProp(ap) mxDestroyArray(ap)
+#endif
+#endif
+
+/*
+ * Buffers for converted arguments come from mxWrapTempAlloc.  The
+ * generated code may route it to a per-call arena (mwrap -arena).
+ */
+#ifndef mxWrapTempAlloc
+#define mxWrapTempAlloc(n) mxMalloc(n)
+#endif
+
+/*
+ * The array copiers are indexed loops over restrict-qualified pointers,
+ * so that compilers can vectorize them, and use memcpy when the C type
+ * has the layout of the MATLAB data.
+ */
+#if defined(__cplusplus) || !defined(__STDC_VERSION__) || __STDC_VERSION__ < 199901L
+#if defined(__GNUC__) || defined(_MSC_VER)
+#define mxWrapRestrict __restrict
+#else
+#define mxWrapRestrict
+#endif
+#else
+#define mxWrapRestrict restrict
+#endif
+
+/* Is the real type T the floating type F? */
+#define mxWrapIsFloat_(T, F) (sizeof(T) == sizeof(F) && (T) 0.5 != 0)
+
+/* Does t, set to 1+2i by setz, hold the (real, imag) pair {1, 2}? */
+#define mxWrapIsPairSet_(t, ZT, setz, pair) \
+    (sizeof(t) == sizeof(pair) && \
+     (setz((&(t)), (ZT) 1, (ZT) 2), memcmp(&(t), pair, sizeof(pair)) == 0))
+
+/* Does t, copied from the (real, imag) pair {1, 2}, read back as 1+2i? */
+#define mxWrapIsPairGet_(t, real, imag, pair) \
+    (sizeof(t) == sizeof(pair) && \
+     (memcpy((void*) &(t), pair, sizeof(pair)), real(t) == 1 && imag(t) == 2))
+
+/*
+ * Each copy loop is a kernel k(c, lo, hi) over the elements [lo, hi) of
+ * the copy job c, run over all n elements by mxWrapParallel(k, c, n).
+ * The generated code may split large jobs over a thread pool (mwrap
+ * -threads), so kernels must not call the MEX API.
+ */
+typedef struct mxWrapCopyJob_t {
+    void* p;                    /* destination, or its real parts */
+    void* pi;                   /* imaginary parts of a split destination */
+    const void* q;              /* source, or its real parts */
+    const void* qi;             /* imaginary parts of a split source */
+    size_t size;                /* element size for mxWrapCopyBytes */
+} mxWrapCopyJob_t;
+
+typedef void (*mxWrapKernel_t)(const mxWrapCopyJob_t* c, mwSize lo, mwSize hi);
+
+#ifndef mxWrapParallel
+#define mxWrapParallel(k, c, n) k(c, 0, n)
+#endif
+
+/* Kernel name: body for each i, with TP* p and const TQ* q from the job */
+#define mxWrapKernelDef_(name, TP, TQ, body) \
+static void name(const mxWrapCopyJob_t* c, mwSize lo, mwSize hi) \
+{ \
+    TP* mxWrapRestrict p = (TP*) c->p; \
+    const TQ* mxWrapRestrict q = (const TQ*) c->q; \
+    mwIndex i; \
+    for (i = lo; i < hi; ++i) \
+        body; \
+}
+
+/* As mxWrapKernelDef_, also with the imaginary parts pi of p */
+#define mxWrapKernelPiDef_(name, TP, TQ, body) \
+static void name(const mxWrapCopyJob_t* c, mwSize lo, mwSize hi) \
+{ \
+    TP* mxWrapRestrict p = (TP*) c->p; \
+    TP* mxWrapRestrict pi = (TP*) c->pi; \
+    const TQ* mxWrapRestrict q = (const TQ*) c->q; \
+    mwIndex i; \
+    for (i = lo; i < hi; ++i) \
+        body; \
+}
+
+/* As mxWrapKernelDef_, also with the imaginary parts qi of q */
+#define mxWrapKernelQiDef_(name, TP, TQ, body) \
+static void name(const mxWrapCopyJob_t* c, mwSize lo, mwSize hi) \
+{ \
+    TP* mxWrapRestrict p = (TP*) c->p; \
+    const TQ* mxWrapRestrict q = (const TQ*) c->q; \
+    const TQ* mxWrapRestrict qi = (const TQ*) c->qi; \
+    mwIndex i; \
+    for (i = lo; i < hi; ++i) \
+        body; \
+}
+
+void mxWrapCopyBytes(const mxWrapCopyJob_t* c, mwSize lo, mwSize hi)
+{
+    memcpy((char*) c->p + lo * c->size, (const char*) c->q + lo * c->size,
+           (hi - lo) * c->size);
+}
+
 double mxWrapGetScalar_char(const mxArray* a, const char** e)
 {
     if (!a || mxGetClassID(a) != mxCHAR_CLASS || mxGetM(a)*mxGetN(a) != 1) {
@@ -56,6 +173,48 @@ double mxWrapGetScalar_char(const mxArray* a, const char** e)
     return (char) (*mxGetChars(a));
 }
 
+/*
+ * Real double sparse matrices in compressed sparse column form.  The
+ * fields point into the mxArray itself: column j holds the entries
+ * jc[j] to jc[j+1]-1, with 0-based row indices ir[k] and values pr[k].
+ */
+#ifndef MXWRAP_SPARSE_T
+#define MXWRAP_SPARSE_T
+typedef struct mxWrapSparse_t {
+    mwSize   m, n, nzmax;
+    mwIndex* jc;
+    mwIndex* ir;
+    double*  pr;
+} mxWrapSparse_t;
+#endif
+
+void mxWrapGetSparse(mxWrapSparse_t* s, const mxArray* a, const char** e)
+{
+    if (!a || !mxIsSparse(a) || mxGetClassID(a) != mxDOUBLE_CLASS ||
+        mxIsComplex(a)) {
+        *e = "Invalid sparse argument, real double sparse matrix expected";
+        return;
+    }
+    s->m     = mxGetM(a);
+    s->n     = mxGetN(a);
+    s->nzmax = mxGetNzmax(a);
+    s->jc    = mxGetJc(a);
+    s->ir    = mxGetIr(a);
+#if MX_HAS_INTERLEAVED_COMPLEX
+    s->pr    = mxGetDoubles(a);
+#else
+    s->pr    = mxGetPr(a);
+#endif
+}
+
+mxArray* mxWrapCreateSparse(mxWrapSparse_t* s, mwSize m, mwSize n, mwSize nzmax)
+{
+    const char* e = NULL;
+    mxArray* a = mxCreateSparse(m, n, nzmax, mxREAL);
+    mxWrapGetSparse(s, a, &e);
+    return a;
+}
+
 /*
  * Support routines for copying data into and out of the MEX stubs, R2018a
  */
@@ -84,8 +243,10 @@ void* mxWrapGetP(const mxArray* a, const char* fmt, const char** e)
         sscanf(pbuf, fmt, &p);
     } 
 #ifdef R2008OO
-    else if (ap = mxGetProperty(a, 0, "mwptr")) {
-        return mxWrapGetP(ap, fmt, e);
+    else if ((ap = mxWrapGetPtrProp(a)) != NULL) {
+        p = mxWrapGetP(ap, fmt, e);
+        mxWrapFreePtrProp(ap);
+        return p;
     }
 #endif
     if (p == 0)
@@ -126,7 +287,7 @@ char* mxWrapGetString(const mxArray* a, const char** e)
         return NULL;
     }
     slen = mxGetM(a)*mxGetN(a) + 1;
-    s = (char*) mxMalloc(slen);
+    s = (char*) mxWrapTempAlloc(slen);
     if (mxGetM(a)*mxGetN(a) == 0)
         *s = 0;
     else
@@ -148,71 +309,71 @@ double mxWrapGetScalar(const mxArray* a, const char** e)
 }
 
 #define mxWrapGetArrayDef(func, T) \
+mxWrapKernelDef_(func##_z_, T, mxComplexDouble, p[i] = (T) q[i].real) \
+mxWrapKernelDef_(func##_k_, T, double, p[i] = (T) q[i]) \
 T* func(const mxArray* a, const char** e)     \
 { \
-    T* array; \
+    mxWrapCopyJob_t c; \
     mwSize arraylen; \
-    mwIndex i; \
-    T* p; \
-    double* q; \
-    mxComplexDouble* z; \
     if (!a || mxGetClassID(a) != mxDOUBLE_CLASS) { \
         *e = "Invalid array argument, mxDOUBLE_CLASS expected"; \
         return 0; \
     } \
     arraylen = mxGetM(a)*mxGetN(a); \
-    array = (T*) mxMalloc(mxGetM(a)*mxGetN(a) * sizeof(T)); \
-    p = array; \
-    if( mxIsComplex(a) ) \
-      { \
-	z = mxGetComplexDoubles(a);	   \
-	for (i = 0; i < arraylen; ++i)		\
-	  *p++ = (T) (*z++).real;			\
-      } \
-    else \
-      {				   \
-	q = mxGetDoubles(a);	   \
-	for (i = 0; i < arraylen; ++i)		\
-	  *p++ = (T) (*q++);			\
-      } \
-    return array; \
+    c.p = mxWrapTempAlloc(arraylen * sizeof(T)); \
+    c.size = sizeof(T); \
+    if (mxIsComplex(a)) { \
+        c.q = mxGetComplexDoubles(a); \
+        mxWrapParallel(func##_z_, &c, arraylen); \
+    } else { \
+        c.q = mxGetDoubles(a); \
+        if (mxWrapIsFloat_(T, double)) \
+            mxWrapParallel(mxWrapCopyBytes, &c, arraylen); \
+        else \
+            mxWrapParallel(func##_k_, &c, arraylen); \
+    } \
+    return (T*) c.p; \
 }
 
 
 #define mxWrapCopyDef(func, T) \
+mxWrapKernelDef_(func##_z_, mxComplexDouble, T, \
+                 { p[i].real = (double) q[i]; p[i].imag = 0; }) \
+mxWrapKernelDef_(func##_k_, double, T, p[i] = (double) q[i]) \
 void func(mxArray* a, const T* q, mwSize n) \
 { \
-    mwIndex i; \
-    double* p;	\
-    mxComplexDouble* z; \
-    if( mxIsComplex(a) ) \
-      { \
-	z = mxGetComplexDoubles(a);	   \
-	for (i = 0; i < n; ++i)		\
-	  (*z++).real = (double) *q++;	\
-	  (*z++).imag = 0;	\
-      } \
-    else \
-      {				   \
-	p = mxGetDoubles(a);	   \
-	for (i = 0; i < n; ++i)		\
-	  *p++ = (double) *q++;		\
-      } \
+    mxWrapCopyJob_t c; \
+    c.q = q; \
+    c.size = sizeof(T); \
+    if (mxIsComplex(a)) { \
+        c.p = mxGetComplexDoubles(a); \
+        mxWrapParallel(func##_z_, &c, n); \
+    } else { \
+        c.p = mxGetDoubles(a); \
+        if (mxWrapIsFloat_(T, double)) \
+            mxWrapParallel(mxWrapCopyBytes, &c, n); \
+        else \
+            mxWrapParallel(func##_k_, &c, n); \
+    } \
 }
 
 
 #define mxWrapReturnDef(func, T) \
+mxWrapKernelDef_(func##_k_, double, T, p[i] = (double) q[i]) \
 mxArray* func(const T* q, mwSize m, mwSize n) \
 { \
-    mwIndex i; \
-    double* p; \
+    mxWrapCopyJob_t c; \
     if (!q) { \
         return mxCreateDoubleMatrix(0,0, mxREAL); \
     } else { \
         mxArray* a = mxCreateDoubleMatrix(m,n, mxREAL); \
-        p = mxGetDoubles(a); \
-        for (i = 0; i < m*n; ++i) \
-	  *p++ = (double) *q++;	  \
+        c.p = mxGetDoubles(a); \
+        c.q = q; \
+        c.size = sizeof(T); \
+        if (mxWrapIsFloat_(T, double)) \
+            mxWrapParallel(mxWrapCopyBytes, &c, m*n); \
+        else \
+            mxWrapParallel(func##_k_, &c, m*n); \
         return a; \
     } \
 }
@@ -232,77 +393,80 @@ void func(T* z, const mxArray* a) \
 }
 
 
-#define mxWrapGetArrayZDef(func, T, ZT, setz)      \
+#define mxWrapGetArrayZDef(func, T, ZT, setz) \
+mxWrapKernelDef_(func##_z_, T, mxComplexDouble, \
+                 setz((p+i), (ZT) q[i].real, (ZT) q[i].imag)) \
+mxWrapKernelDef_(func##_k_, T, double, setz((p+i), (ZT) q[i], (ZT) 0)) \
 T* func(const mxArray* a, const char** e)     \
 { \
-    T* array; \
+    static const double pair_[2] = {1, 2}; \
+    T t_; \
+    mxWrapCopyJob_t c; \
     mwSize arraylen; \
-    mwIndex i; \
-    T* p; \
-    double* q; \
-    mxComplexDouble* z; \
     if (!a || mxGetClassID(a) != mxDOUBLE_CLASS) { \
         *e = "Invalid array argument, mxDOUBLE_CLASS expected"; \
         return 0; \
     } \
     arraylen = mxGetM(a)*mxGetN(a); \
-    array = (T*) mxMalloc(mxGetM(a)*mxGetN(a) * sizeof(T)); \
-    p = array; \
-    if( mxIsComplex(a) ) \
-      { \
-	z = mxGetComplexDoubles(a);	   \
-	for (i = 0; i < arraylen; ++i) {	\
-	  setz(p, (ZT) (*z).real, (ZT) (*z).imag);	\
-  	  ++p; ++z; }					\
-      } \
-    else \
-      {				   \
-	q = mxGetDoubles(a);	   \
-	for (i = 0; i < arraylen; ++i)	{	\
-	  setz(p, (ZT) (*q), (ZT) 0 );		\
-          ++p; ++q; }			\
-      }						\
-    return array; \
+    c.p = mxWrapTempAlloc(arraylen * sizeof(T)); \
+    c.size = sizeof(T); \
+    if (mxIsComplex(a)) { \
+        c.q = mxGetComplexDoubles(a); \
+        if (mxWrapIsPairSet_(t_, ZT, setz, pair_)) \
+            mxWrapParallel(mxWrapCopyBytes, &c, arraylen); \
+        else \
+            mxWrapParallel(func##_z_, &c, arraylen); \
+    } else { \
+        c.q = mxGetDoubles(a); \
+        mxWrapParallel(func##_k_, &c, arraylen); \
+    } \
+    return (T*) c.p; \
 }
 
 
-#define mxWrapCopyZDef(func, T, freal, fimag)	    \
+#define mxWrapCopyZDef(func, T, freal, fimag) \
+mxWrapKernelDef_(func##_z_, mxComplexDouble, T, \
+                 { p[i].real = freal(q[i]); p[i].imag = fimag(q[i]); }) \
+mxWrapKernelDef_(func##_k_, double, T, p[i] = freal(q[i])) \
 void func(mxArray* a, const T* q, mwSize n) \
 { \
-    mwIndex i; \
-    double* p;	\
-    mxComplexDouble* z; \
-    if( mxIsComplex(a) ) \
-      { \
-	z = mxGetComplexDoubles(a);	   \
-	for (i = 0; i < n; ++i)	{		\
-          (*z).real = freal(*q);			\
-	  (*z).imag = fimag(*q);			\
-	  ++z; ++q; 	}			\
-      } \
-    else \
-      {				   \
-	p = mxGetDoubles(a);	   \
-	for (i = 0; i < n; ++i)		\
-	  *p++ = freal(*q++);		\
-      } \
+    static const double pair_[2] = {1, 2}; \
+    T t_; \
+    mxWrapCopyJob_t c; \
+    c.q = q; \
+    c.size = sizeof(T); \
+    if (mxIsComplex(a)) { \
+        c.p = mxGetComplexDoubles(a); \
+        if (mxWrapIsPairGet_(t_, freal, fimag, pair_)) \
+            mxWrapParallel(mxWrapCopyBytes, &c, n); \
+        else \
+            mxWrapParallel(func##_z_, &c, n); \
+    } else { \
+        c.p = mxGetDoubles(a); \
+        mxWrapParallel(func##_k_, &c, n); \
+    } \
 }
 
 
-#define mxWrapReturnZDef(func, T, freal, fimag)	      \
+#define mxWrapReturnZDef(func, T, freal, fimag) \
+mxWrapKernelDef_(func##_z_, mxComplexDouble, T, \
+                 { p[i].real = freal(q[i]); p[i].imag = fimag(q[i]); }) \
 mxArray* func(const T* q, mwSize m, mwSize n) \
 { \
-    mwIndex i; \
-    mxComplexDouble* p; \
+    static const double pair_[2] = {1, 2}; \
+    T t_; \
+    mxWrapCopyJob_t c; \
     if (!q) { \
         return mxCreateDoubleMatrix(0,0, mxCOMPLEX); \
     } else { \
         mxArray* a = mxCreateDoubleMatrix(m,n, mxCOMPLEX); \
-        p = mxGetComplexDoubles(a); \
-        for (i = 0; i < m*n; ++i) {	  \
-          (*p).real = freal(*q);			\
-	  (*p).imag = fimag(*q);			\
-	  ++p; ++q; 	}			\
+        c.p = mxGetComplexDoubles(a); \
+        c.q = q; \
+        c.size = sizeof(T); \
+        if (mxWrapIsPairGet_(t_, freal, fimag, pair_)) \
+            mxWrapParallel(mxWrapCopyBytes, &c, m*n); \
+        else \
+            mxWrapParallel(func##_z_, &c, m*n); \
         return a; \
     } \
 }
@@ -334,8 +498,10 @@ void* mxWrapGetP_single(const mxArray* a, const char* fmt, const char** e)
         sscanf(pbuf, fmt, &p);
     } 
 #ifdef R2008OO
-    else if (ap = mxGetProperty(a, 0, "mwptr")) {
-        return mxWrapGetP(ap, fmt, e);
+    else if ((ap = mxWrapGetPtrProp(a)) != NULL) {
+        p = mxWrapGetP(ap, fmt, e);
+        mxWrapFreePtrProp(ap);
+        return p;
     }
 #endif
     if (p == 0)
@@ -389,7 +555,7 @@ char* mxWrapGetString_single(const mxArray* a, const char** e)
         return NULL;
     }
     slen = mxGetM(a)*mxGetN(a) + 1;
-    s = (char*) mxMalloc(slen);
+    s = (char*) mxWrapTempAlloc(slen);
     if (mxGetM(a)*mxGetN(a) == 0)
         *s = 0;
     else
@@ -398,71 +564,71 @@ char* mxWrapGetString_single(const mxArray* a, const char** e)
 }
 
 #define mxWrapGetArrayDef_single(func, T) \
+mxWrapKernelDef_(func##_z_, T, mxComplexSingle, p[i] = (T) q[i].real) \
+mxWrapKernelDef_(func##_k_, T, float, p[i] = (T) q[i]) \
 T* func(const mxArray* a, const char** e)     \
 { \
-    T* array; \
+    mxWrapCopyJob_t c; \
     mwSize arraylen; \
-    mwIndex i; \
-    T* p; \
-    float* q; \
-    mxComplexSingle* z; \
     if (!a || mxGetClassID(a) != mxSINGLE_CLASS) { \
         *e = "Invalid array argument, mxSINGLE_CLASS expected"; \
         return 0; \
     } \
     arraylen = mxGetM(a)*mxGetN(a); \
-    array = (T*) mxMalloc(mxGetM(a)*mxGetN(a) * sizeof(T)); \
-    p = array; \
-    if( mxIsComplex(a) ) \
-      { \
-	z = mxGetComplexSingles(a);	   \
-	for (i = 0; i < arraylen; ++i)		\
-	  *p++ = (T) (*z++).real;			\
-      } \
-    else \
-      {				   \
-	q = mxGetSingles(a);	   \
-	for (i = 0; i < arraylen; ++i)		\
-	  *p++ = (T) (*q++);			\
-      } \
-    return array; \
+    c.p = mxWrapTempAlloc(arraylen * sizeof(T)); \
+    c.size = sizeof(T); \
+    if (mxIsComplex(a)) { \
+        c.q = mxGetComplexSingles(a); \
+        mxWrapParallel(func##_z_, &c, arraylen); \
+    } else { \
+        c.q = mxGetSingles(a); \
+        if (mxWrapIsFloat_(T, float)) \
+            mxWrapParallel(mxWrapCopyBytes, &c, arraylen); \
+        else \
+            mxWrapParallel(func##_k_, &c, arraylen); \
+    } \
+    return (T*) c.p; \
 }
 
 
 #define mxWrapCopyDef_single(func, T) \
+mxWrapKernelDef_(func##_z_, mxComplexSingle, T, \
+                 { p[i].real = (float) q[i]; p[i].imag = 0; }) \
+mxWrapKernelDef_(func##_k_, float, T, p[i] = (float) q[i]) \
 void func(mxArray* a, const T* q, mwSize n) \
 { \
-    mwIndex i; \
-    float* p;	\
-    mxComplexSingle* z; \
-    if( mxIsComplex(a) ) \
-      { \
-	z = mxGetComplexSingles(a);	   \
-	for (i = 0; i < n; ++i)		\
-	  (*z++).real = (float) *q++;	\
-	  (*z++).imag = 0;	\
-      } \
-    else \
-      {				   \
-	p = mxGetSingles(a);	   \
-	for (i = 0; i < n; ++i)		\
-	  *p++ = (float) *q++;		\
-      } \
+    mxWrapCopyJob_t c; \
+    c.q = q; \
+    c.size = sizeof(T); \
+    if (mxIsComplex(a)) { \
+        c.p = mxGetComplexSingles(a); \
+        mxWrapParallel(func##_z_, &c, n); \
+    } else { \
+        c.p = mxGetSingles(a); \
+        if (mxWrapIsFloat_(T, float)) \
+            mxWrapParallel(mxWrapCopyBytes, &c, n); \
+        else \
+            mxWrapParallel(func##_k_, &c, n); \
+    } \
 }
 
 
 #define mxWrapReturnDef_single(func, T) \
+mxWrapKernelDef_(func##_k_, float, T, p[i] = (float) q[i]) \
 mxArray* func(const T* q, mwSize m, mwSize n) \
 { \
-    mwIndex i; \
-    float* p; \
+    mxWrapCopyJob_t c; \
     if (!q) { \
         return mxCreateNumericMatrix(0,0, mxSINGLE_CLASS, mxREAL); \
     } else { \
         mxArray* a = mxCreateNumericMatrix(m,n, mxSINGLE_CLASS, mxREAL); \
-        p = mxGetSingles(a); \
-        for (i = 0; i < m*n; ++i) \
-	  *p++ = (float) *q++;	  \
+        c.p = mxGetSingles(a); \
+        c.q = q; \
+        c.size = sizeof(T); \
+        if (mxWrapIsFloat_(T, float)) \
+            mxWrapParallel(mxWrapCopyBytes, &c, m*n); \
+        else \
+            mxWrapParallel(func##_k_, &c, m*n); \
         return a; \
     } \
 }
@@ -482,77 +648,80 @@ void func(T* z, const mxArray* a) \
 }
 
 
-#define mxWrapGetArrayZDef_single(func, T, ZT, setz)      \
+#define mxWrapGetArrayZDef_single(func, T, ZT, setz) \
+mxWrapKernelDef_(func##_z_, T, mxComplexSingle, \
+                 setz((p+i), (ZT) q[i].real, (ZT) q[i].imag)) \
+mxWrapKernelDef_(func##_k_, T, float, setz((p+i), (ZT) q[i], (ZT) 0)) \
 T* func(const mxArray* a, const char** e)     \
 { \
-    T* array; \
+    static const float pair_[2] = {1, 2}; \
+    T t_; \
+    mxWrapCopyJob_t c; \
     mwSize arraylen; \
-    mwIndex i; \
-    T* p; \
-    float* q; \
-    mxComplexSingle* z; \
     if (!a || mxGetClassID(a) != mxSINGLE_CLASS) { \
         *e = "Invalid array argument, mxSINGLE_CLASS expected"; \
         return 0; \
     } \
     arraylen = mxGetM(a)*mxGetN(a); \
-    array = (T*) mxMalloc(mxGetM(a)*mxGetN(a) * sizeof(T)); \
-    p = array; \
-    if( mxIsComplex(a) ) \
-      { \
-	z = mxGetComplexSingles(a);	   \
-	for (i = 0; i < arraylen; ++i) {	\
-	  setz(p, (ZT) (*z).real, (ZT) (*z).imag);	\
-  	  ++p; ++z; }					\
-      } \
-    else \
-      {				   \
-	q = mxGetSingles(a);	   \
-	for (i = 0; i < arraylen; ++i)	{	\
-	  setz(p, (ZT) (*q), (ZT) 0 );		\
-          ++p; ++q; }			\
-      }						\
-    return array; \
+    c.p = mxWrapTempAlloc(arraylen * sizeof(T)); \
+    c.size = sizeof(T); \
+    if (mxIsComplex(a)) { \
+        c.q = mxGetComplexSingles(a); \
+        if (mxWrapIsPairSet_(t_, ZT, setz, pair_)) \
+            mxWrapParallel(mxWrapCopyBytes, &c, arraylen); \
+        else \
+            mxWrapParallel(func##_z_, &c, arraylen); \
+    } else { \
+        c.q = mxGetSingles(a); \
+        mxWrapParallel(func##_k_, &c, arraylen); \
+    } \
+    return (T*) c.p; \
 }
 
 
-#define mxWrapCopyZDef_single(func, T, freal, fimag)	    \
+#define mxWrapCopyZDef_single(func, T, freal, fimag) \
+mxWrapKernelDef_(func##_z_, mxComplexSingle, T, \
+                 { p[i].real = freal(q[i]); p[i].imag = fimag(q[i]); }) \
+mxWrapKernelDef_(func##_k_, float, T, p[i] = freal(q[i])) \
 void func(mxArray* a, const T* q, mwSize n) \
 { \
-    mwIndex i; \
-    float* p;	\
-    mxComplexSingle* z; \
-    if( mxIsComplex(a) ) \
-      { \
-	z = mxGetComplexSingles(a);	   \
-	for (i = 0; i < n; ++i)	{		\
-          (*z).real = freal(*q);			\
-	  (*z).imag = fimag(*q);			\
-	  ++z; ++q; 	}			\
-      } \
-    else \
-      {				   \
-	p = mxGetSingles(a);	   \
-	for (i = 0; i < n; ++i)		\
-	  *p++ = freal(*q++);		\
-      } \
+    static const float pair_[2] = {1, 2}; \
+    T t_; \
+    mxWrapCopyJob_t c; \
+    c.q = q; \
+    c.size = sizeof(T); \
+    if (mxIsComplex(a)) { \
+        c.p = mxGetComplexSingles(a); \
+        if (mxWrapIsPairGet_(t_, freal, fimag, pair_)) \
+            mxWrapParallel(mxWrapCopyBytes, &c, n); \
+        else \
+            mxWrapParallel(func##_z_, &c, n); \
+    } else { \
+        c.p = mxGetSingles(a); \
+        mxWrapParallel(func##_k_, &c, n); \
+    } \
 }
 
 
-#define mxWrapReturnZDef_single(func, T, freal, fimag)	      \
+#define mxWrapReturnZDef_single(func, T, freal, fimag) \
+mxWrapKernelDef_(func##_z_, mxComplexSingle, T, \
+                 { p[i].real = freal(q[i]); p[i].imag = fimag(q[i]); }) \
 mxArray* func(const T* q, mwSize m, mwSize n) \
 { \
-    mwIndex i; \
-    mxComplexSingle* p; \
+    static const float pair_[2] = {1, 2}; \
+    T t_; \
+    mxWrapCopyJob_t c; \
     if (!q) { \
         return mxCreateNumericMatrix(0,0, mxSINGLE_CLASS, mxCOMPLEX); \
     } else { \
         mxArray* a = mxCreateNumericMatrix(m,n, mxSINGLE_CLASS, mxCOMPLEX); \
-        p = mxGetComplexSingles(a); \
-        for (i = 0; i < m*n; ++i) {	  \
-          (*p).real = freal(*q);			\
-	  (*p).imag = fimag(*q);			\
-	  ++p; ++q; 	}			\
+        c.p = mxGetComplexSingles(a); \
+        c.q = q; \
+        c.size = sizeof(T); \
+        if (mxWrapIsPairGet_(t_, freal, fimag, pair_)) \
+            mxWrapParallel(mxWrapCopyBytes, &c, m*n); \
+        else \
+            mxWrapParallel(func##_z_, &c, m*n); \
         return a; \
     } \
 }
@@ -580,8 +749,10 @@ void* mxWrapGetP(const mxArray* a, const char* fmt, const char** e)
         sscanf(pbuf, fmt, &p);
     } 
 #ifdef R2008OO
-    else if (ap = mxGetProperty(a, 0, "mwptr")) {
-        return mxWrapGetP(ap, fmt, e);
+    else if ((ap = mxWrapGetPtrProp(a)) != NULL) {
+        p = mxWrapGetP(ap, fmt, e);
+        mxWrapFreePtrProp(ap);
+        return p;
     }
 #endif
     if (p == 0)
@@ -631,7 +802,7 @@ char* mxWrapGetString(const mxArray* a, const char** e)
         return NULL;
     }
     slen = mxGetM(a)*mxGetN(a) + 1;
-    s = (char*) mxMalloc(slen);
+    s = (char*) mxWrapTempAlloc(slen);
     if (mxGetM(a)*mxGetN(a) == 0)
         *s = 0;
     else
@@ -641,49 +812,58 @@ char* mxWrapGetString(const mxArray* a, const char** e)
 
 
 #define mxWrapGetArrayDef(func, T) \
+mxWrapKernelDef_(func##_k_, T, double, p[i] = (T) q[i]) \
 T* func(const mxArray* a, const char** e)     \
 { \
-    T* array; \
+    mxWrapCopyJob_t c; \
     mwSize arraylen; \
-    mwIndex i; \
-    T* p; \
-    double* q; \
     if (!a || mxGetClassID(a) != mxDOUBLE_CLASS) { \
         *e = "Invalid array argument, mxDOUBLE_CLASS expected"; \
         return 0; \
     } \
     arraylen = mxGetM(a)*mxGetN(a); \
-    array = (T*) mxMalloc(mxGetM(a)*mxGetN(a) * sizeof(T)); \
-    p = array; \
-    q = mxGetPr(a); \
-    for (i = 0; i < arraylen; ++i) \
-        *p++ = (T) (*q++); \
-    return array; \
+    c.p = mxWrapTempAlloc(arraylen * sizeof(T)); \
+    c.q = mxGetPr(a); \
+    c.size = sizeof(T); \
+    if (mxWrapIsFloat_(T, double)) \
+        mxWrapParallel(mxWrapCopyBytes, &c, arraylen); \
+    else \
+        mxWrapParallel(func##_k_, &c, arraylen); \
+    return (T*) c.p; \
 }
 
 
 #define mxWrapCopyDef(func, T) \
+mxWrapKernelDef_(func##_k_, double, T, p[i] = (double) q[i]) \
 void func(mxArray* a, const T* q, mwSize n) \
 { \
-    mwIndex i; \
-    double* p = mxGetPr(a); \
-    for (i = 0; i < n; ++i) \
-        *p++ = *q++; \
+    mxWrapCopyJob_t c; \
+    c.p = mxGetPr(a); \
+    c.q = q; \
+    c.size = sizeof(T); \
+    if (mxWrapIsFloat_(T, double)) \
+        mxWrapParallel(mxWrapCopyBytes, &c, n); \
+    else \
+        mxWrapParallel(func##_k_, &c, n); \
 }
 
 
 #define mxWrapReturnDef(func, T) \
+mxWrapKernelDef_(func##_k_, double, T, p[i] = (double) q[i]) \
 mxArray* func(const T* q, mwSize m, mwSize n) \
 { \
-    mwIndex i; \
-    double* p; \
+    mxWrapCopyJob_t c; \
     if (!q) { \
         return mxCreateDoubleMatrix(0,0, mxREAL); \
     } else { \
         mxArray* a = mxCreateDoubleMatrix(m,n, mxREAL); \
-        p = mxGetPr(a); \
-        for (i = 0; i < m*n; ++i) \
-            *p++ = *q++; \
+        c.p = mxGetPr(a); \
+        c.q = q; \
+        c.size = sizeof(T); \
+        if (mxWrapIsFloat_(T, double)) \
+            mxWrapParallel(mxWrapCopyBytes, &c, m*n); \
+        else \
+            mxWrapParallel(func##_k_, &c, m*n); \
         return a; \
     } \
 }
@@ -699,64 +879,55 @@ void func(T* z, const mxArray* a) \
 
 
 #define mxWrapGetArrayZDef(func, T, ZT, setz) \
+mxWrapKernelQiDef_(func##_z_, T, double, setz((p+i), (ZT) q[i], (ZT) qi[i])) \
+mxWrapKernelDef_(func##_k_, T, double, setz((p+i), (ZT) q[i], (ZT) 0)) \
 T* func(const mxArray* a, const char** e) \
 { \
-    T* array; \
+    mxWrapCopyJob_t c; \
     mwSize arraylen; \
-    mwIndex i; \
-    T* p; \
-    double* qr; \
-    double* qi; \
     if (!a || mxGetClassID(a) != mxDOUBLE_CLASS) { \
         *e = "Invalid array argument, mxDOUBLE_CLASS expected"; \
         return 0; \
     } \
     arraylen = mxGetM(a)*mxGetN(a); \
-    array = (T*) mxMalloc(mxGetM(a)*mxGetN(a) * sizeof(T)); \
-    p = array; \
-    qr = mxGetPr(a); \
-    qi = mxGetPi(a); \
-    for (i = 0; i < arraylen; ++i) { \
-        ZT val_qr = *qr++; \
-        ZT val_qi = (qi ? (ZT) *qi++ : (ZT) 0); \
-        setz(p, val_qr, val_qi); \
-        ++p; \
-    } \
-    return array; \
+    c.p = mxWrapTempAlloc(arraylen * sizeof(T)); \
+    c.q = mxGetPr(a); \
+    c.qi = mxGetPi(a); \
+    if (c.qi) \
+        mxWrapParallel(func##_z_, &c, arraylen); \
+    else \
+        mxWrapParallel(func##_k_, &c, arraylen); \
+    return (T*) c.p; \
 }
 
 
 #define mxWrapCopyZDef(func, T, real, imag) \
+mxWrapKernelPiDef_(func##_z_, double, T, \
+                   { p[i] = real(q[i]); pi[i] = imag(q[i]); }) \
 void func(mxArray* a, const T* q, mwSize n) \
 { \
-    mwIndex i; \
-    double* pr = mxGetPr(a); \
-    double* pi = mxGetPi(a); \
-    for (i = 0; i < n; ++i) { \
-        *pr++ = real(*q); \
-        *pi++ = imag(*q); \
-        ++q; \
-    } \
+    mxWrapCopyJob_t c; \
+    c.p = mxGetPr(a); \
+    c.pi = mxGetPi(a); \
+    c.q = q; \
+    mxWrapParallel(func##_z_, &c, n); \
 }
 
 
 #define mxWrapReturnZDef(func, T, real, imag) \
+mxWrapKernelPiDef_(func##_z_, double, T, \
+                   { p[i] = real(q[i]); pi[i] = imag(q[i]); }) \
 mxArray* func(const T* q, mwSize m, mwSize n) \
 { \
-    mwIndex i; \
-    double* pr; \
-    double* pi; \
+    mxWrapCopyJob_t c; \
     if (!q) { \
         return mxCreateDoubleMatrix(0,0, mxCOMPLEX); \
     } else { \
         mxArray* a = mxCreateDoubleMatrix(m,n, mxCOMPLEX); \
-        pr = mxGetPr(a); \
-        pi = mxGetPi(a); \
-        for (i = 0; i < m*n; ++i) { \
-            *pr++ = real(*q); \
-            *pi++ = imag(*q); \
-            ++q; \
-        } \
+        c.p = mxGetPr(a); \
+        c.pi = mxGetPi(a); \
+        c.q = q; \
+        mxWrapParallel(func##_z_, &c, m*n); \
         return a; \
     } \
 }
@@ -781,8 +952,10 @@ void* mxWrapGetP_single(const mxArray* a, const char* fmt, const char** e)
         sscanf(pbuf, fmt, &p);
     } 
 #ifdef R2008OO
-    else if (ap = mxGetProperty(a, 0, "mwptr")) {
-        return mxWrapGetP(ap, fmt, e);
+    else if ((ap = mxWrapGetPtrProp(a)) != NULL) {
+        p = mxWrapGetP(ap, fmt, e);
+        mxWrapFreePtrProp(ap);
+        return p;
     }
 #endif
     if (p == 0)
@@ -831,7 +1004,7 @@ char* mxWrapGetString_single(const mxArray* a, const char** e)
         return NULL;
     }
     slen = mxGetM(a)*mxGetN(a) + 1;
-    s = (char*) mxMalloc(slen);
+    s = (char*) mxWrapTempAlloc(slen);
     if (mxGetM(a)*mxGetN(a) == 0)
         *s = 0;
     else
@@ -841,49 +1014,58 @@ char* mxWrapGetString_single(const mxArray* a, const char** e)
 
 
 #define mxWrapGetArrayDef_single(func, T) \
+mxWrapKernelDef_(func##_k_, T, float, p[i] = (T) q[i]) \
 T* func(const mxArray* a, const char** e)     \
 { \
-    T* array; \
+    mxWrapCopyJob_t c; \
     mwSize arraylen; \
-    mwIndex i; \
-    T* p; \
-    float* q; \
     if (!a || mxGetClassID(a) != mxSINGLE_CLASS) { \
         *e = "Invalid array argument, mxSINGLE_CLASS expected"; \
         return 0; \
     } \
     arraylen = mxGetM(a)*mxGetN(a); \
-    array = (T*) mxMalloc(mxGetM(a)*mxGetN(a) * sizeof(T)); \
-    p = array; \
-    q = (float*) mxGetData(a);	   \
-    for (i = 0; i < arraylen; ++i) \
-        *p++ = (T) (*q++); \
-    return array; \
+    c.p = mxWrapTempAlloc(arraylen * sizeof(T)); \
+    c.q = mxGetData(a); \
+    c.size = sizeof(T); \
+    if (mxWrapIsFloat_(T, float)) \
+        mxWrapParallel(mxWrapCopyBytes, &c, arraylen); \
+    else \
+        mxWrapParallel(func##_k_, &c, arraylen); \
+    return (T*) c.p; \
 }
 
 
 #define mxWrapCopyDef_single(func, T) \
+mxWrapKernelDef_(func##_k_, float, T, p[i] = (float) q[i]) \
 void func(mxArray* a, const T* q, mwSize n) \
 { \
-    mwIndex i; \
-    float* p = (float*) mxGetData(a);		\
-    for (i = 0; i < n; ++i) \
-        *p++ = *q++; \
+    mxWrapCopyJob_t c; \
+    c.p = mxGetData(a); \
+    c.q = q; \
+    c.size = sizeof(T); \
+    if (mxWrapIsFloat_(T, float)) \
+        mxWrapParallel(mxWrapCopyBytes, &c, n); \
+    else \
+        mxWrapParallel(func##_k_, &c, n); \
 }
 
 
 #define mxWrapReturnDef_single(func, T) \
+mxWrapKernelDef_(func##_k_, float, T, p[i] = (float) q[i]) \
 mxArray* func(const T* q, mwSize m, mwSize n) \
 { \
-    mwIndex i; \
-    float* p; \
+    mxWrapCopyJob_t c; \
     if (!q) { \
-      return mxCreateNumericMatrix(0,0, mxSINGLE_CLASS, mxREAL); \
+        return mxCreateNumericMatrix(0,0, mxSINGLE_CLASS, mxREAL); \
     } else { \
-        mxArray* a = mxCreateNumericMatrix(m,n, mxSINGLE_CLASS, mxREAL);\
-        p = (float*) mxGetData(a);				\
-        for (i = 0; i < m*n; ++i) \
-            *p++ = *q++; \
+        mxArray* a = mxCreateNumericMatrix(m,n, mxSINGLE_CLASS, mxREAL); \
+        c.p = mxGetData(a); \
+        c.q = q; \
+        c.size = sizeof(T); \
+        if (mxWrapIsFloat_(T, float)) \
+            mxWrapParallel(mxWrapCopyBytes, &c, m*n); \
+        else \
+            mxWrapParallel(func##_k_, &c, m*n); \
         return a; \
     } \
 }
@@ -899,64 +1081,55 @@ void func(T* z, const mxArray* a) \
 
 
 #define mxWrapGetArrayZDef_single(func, T, ZT, setz) \
+mxWrapKernelQiDef_(func##_z_, T, float, setz((p+i), (ZT) q[i], (ZT) qi[i])) \
+mxWrapKernelDef_(func##_k_, T, float, setz((p+i), (ZT) q[i], (ZT) 0)) \
 T* func(const mxArray* a, const char** e) \
 { \
-    T* array; \
+    mxWrapCopyJob_t c; \
     mwSize arraylen; \
-    mwIndex i; \
-    T* p; \
-    float* qr; \
-    float* qi; \
     if (!a || mxGetClassID(a) != mxSINGLE_CLASS) { \
         *e = "Invalid array argument, mxSINGLE_CLASS expected"; \
         return 0; \
     } \
     arraylen = mxGetM(a)*mxGetN(a); \
-    array = (T*) mxMalloc(mxGetM(a)*mxGetN(a) * sizeof(T)); \
-    p = array; \
-    qr = (float*) mxGetData(a);			\
-    qi = (float*) mxGetImagData(a);			\
-    for (i = 0; i < arraylen; ++i) { \
-        ZT val_qr = *qr++; \
-        ZT val_qi = (qi ? (ZT) *qi++ : (ZT) 0); \
-        setz(p, val_qr, val_qi); \
-        ++p; \
-    } \
-    return array; \
+    c.p = mxWrapTempAlloc(arraylen * sizeof(T)); \
+    c.q = mxGetData(a); \
+    c.qi = mxGetImagData(a); \
+    if (c.qi) \
+        mxWrapParallel(func##_z_, &c, arraylen); \
+    else \
+        mxWrapParallel(func##_k_, &c, arraylen); \
+    return (T*) c.p; \
 }
 
 
 #define mxWrapCopyZDef_single(func, T, real, imag) \
+mxWrapKernelPiDef_(func##_z_, float, T, \
+                   { p[i] = real(q[i]); pi[i] = imag(q[i]); }) \
 void func(mxArray* a, const T* q, mwSize n) \
 { \
-    mwIndex i; \
-    float* pr = (float*) mxGetData(a);		\
-    float* pi = (float*) mxGetImagData(a);		\
-    for (i = 0; i < n; ++i) { \
-        *pr++ = real(*q); \
-        *pi++ = imag(*q); \
-        ++q; \
-    } \
+    mxWrapCopyJob_t c; \
+    c.p = mxGetData(a); \
+    c.pi = mxGetImagData(a); \
+    c.q = q; \
+    mxWrapParallel(func##_z_, &c, n); \
 }
 
 
 #define mxWrapReturnZDef_single(func, T, real, imag) \
+mxWrapKernelPiDef_(func##_z_, float, T, \
+                   { p[i] = real(q[i]); pi[i] = imag(q[i]); }) \
 mxArray* func(const T* q, mwSize m, mwSize n) \
 { \
-    mwIndex i; \
-    float* pr; \
-    float* pi; \
+    mxWrapCopyJob_t c; \
     if (!q) { \
-      return mxCreateNumericMatrix(0,0, mxSINGLE_CLASS, mxCOMPLEX); \
+        return mxCreateNumericMatrix(0,0, mxSINGLE_CLASS, mxCOMPLEX); \
     } else { \
-        mxArray* a = mxCreateNumericMatrix(m,n, mxSINGLE_CLASS, mxCOMPLEX);\
-        pr = (float*) mxGetData(a);					\
-        pi = (float*) mxGetImagData(a);					\
-        for (i = 0; i < m*n; ++i) { \
-            *pr++ = real(*q); \
-            *pi++ = imag(*q); \
-            ++q; \
-        } \
+        mxArray* a = mxCreateNumericMatrix(m,n, mxSINGLE_CLASS, mxCOMPLEX); \
+        c.p = mxGetData(a); \
+        c.pi = mxGetImagData(a); \
+        c.q = q; \
+        mxWrapParallel(func##_z_, &c, m*n); \
         return a; \
     } \
 }
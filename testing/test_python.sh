@@ -192,6 +192,487 @@ run_equiv_test test_char \
     "$SCRIPT_DIR/test_char.mw" .cc no \
     -cppcomplex
 
+# ----------------------------------------------------------------
+# Group C: Python-only code generation options
+# The C++ mwrap has no equivalent, so check that generation succeeds,
+# that the expected runtime code is present, and that the MATLAB
+# stubs match the ones generated without the option.
+# ----------------------------------------------------------------
+echo ""
+echo "=== Group C: Python-only option tests ==="
+
+run_option_test() {
+    local name="$1"
+    local mw_file="$2"
+    local cc_ext="$3"
+    local pattern="$4"      # grep pattern expected in the C output
+    local option="$5"       # option under test
+    shift 5
+    local flags=()
+    if [ $# -gt 0 ]; then
+        flags=("$@")
+    fi
+
+    local ref_dir="$TMPDIR_BASE/ref_${name}"
+    local opt_dir="$TMPDIR_BASE/opt_${name}"
+    mkdir -p "$ref_dir" "$opt_dir"
+    cp "$SCRIPT_DIR/test_include2.mw" "$ref_dir/"
+    cp "$SCRIPT_DIR/test_include2.mw" "$opt_dir/"
+
+    local mex_name="${name}mex"
+    local cc_file="${mex_name}${cc_ext}"
+    local args=(-mex "$mex_name" -c "$cc_file" -m "${name}.m")
+    if [ ${#flags[@]} -gt 0 ]; then
+        args+=("${flags[@]}")
+    fi
+
+    if ! (cd "$ref_dir" && "$MWRAP_PY" "${args[@]}" "$mw_file" 2>/dev/null); then
+        fail "$name (Python mwrap failed)"
+        return
+    fi
+    if ! (cd "$opt_dir" && "$MWRAP_PY" "${args[@]}" "$option" "$mw_file" 2>/dev/null); then
+        fail "$name (Python mwrap $option failed)"
+        return
+    fi
+
+    if grep -q "$pattern" "$opt_dir/$cc_file"; then
+        pass "$name ($cc_file)"
+    else
+        fail "$name ($cc_file lacks '$pattern')"
+    fi
+
+    if diff -u "$ref_dir/${name}.m" "$opt_dir/${name}.m" >/dev/null 2>&1; then
+        pass "$name (${name}.m)"
+    else
+        fail "$name (${name}.m differs)"
+        diff -u "$ref_dir/${name}.m" "$opt_dir/${name}.m" | head -40 || true
+    fi
+}
+
+run_option_test hashdispatch \
+    "$SCRIPT_DIR/test_transfers.mw" .cc "mwStubDispatch_(id" \
+    -hashdispatch
+
+run_option_test zerocopy \
+    "$SCRIPT_DIR/test_cpp_complex.mw" .cc "(dcomplex\\*) mxGetComplexDoubles" \
+    -zerocopy -cppcomplex
+
+run_option_test inplace \
+    "$SCRIPT_DIR/test_transfers.mw" .cc "mxDuplicateArray(prhs" \
+    -inplace
+
+# -inplace: integer inout arrays still come back as double, so they are
+# copied out instead of returned in their input class
+inplace_dir="$TMPDIR_BASE/inplace_int"
+mkdir -p "$inplace_dir"
+printf '# scale(inout int32_t[] x, int n);\n# shift(inout double[] y, int n);\n' \
+    > "$inplace_dir/inplace_int.mw"
+if (cd "$inplace_dir" && "$MWRAP_PY" -mex inplacemex -c inplacemex.cc -inplace \
+        inplace_int.mw 2>/dev/null); then
+    if [ "$(grep -c "mxDuplicateArray(prhs" "$inplace_dir/inplacemex.cc")" = 1 ]; then
+        pass "inplace (double only, not int32_t)"
+    else
+        fail "inplace (int32_t inout returned in its input class)"
+    fi
+else
+    fail "inplace (Python mwrap -inplace failed)"
+fi
+
+run_option_test timing \
+    "$SCRIPT_DIR/test_transfers.mw" .cc "mwProfRecord_(mwProfStats_" \
+    -timing
+if grep -q "Stub times from %s.*MWRAP_PROF_CLOCK" "$TMPDIR_BASE/opt_timing/timingmex.cc"; then
+    pass "timing (clock named in the report)"
+else
+    fail "timing (report does not name the clock)"
+fi
+
+run_option_test split \
+    "$SCRIPT_DIR/test_transfers.mw" .cc "#include \"splitmex_mwrap.h\"" \
+    "-split=4"
+
+# -split: $[header code goes in the shared header and other code only in
+# the dispatch file; without $[header code every stub stays in the
+# dispatch file.  With mkoctfile, the split files must link.
+split_dir="$TMPDIR_BASE/split_link"
+mkdir -p "$split_dir/fallback"
+if (cd "$split_dir" && "$MWRAP_PY" -mex test_splitmex -c test_splitmex.cc -split 2 \
+        -m test_split.m "$SCRIPT_DIR/test_split.mw" 2>/dev/null &&
+        cd fallback && "$MWRAP_PY" -mex fbmex -c fbmex.cc -split 2 \
+        "$SCRIPT_DIR/test_transfers.mw" 2>fallback.err); then
+    if grep -q "^Counter\* counter_new();" "$split_dir/test_splitmex_mwrap.h" &&
+            [ "$(grep -l "^Counter\* counter_new()$" "$split_dir"/test_splitmex*)" = \
+              "$split_dir/test_splitmex.cc" ] &&
+            grep -q "^void mexStub1(" "$split_dir/test_splitmex_1.cc" &&
+            grep -q "no \$\[header code" "$split_dir/fallback/fallback.err" &&
+            grep -q "^void mexStub1(" "$split_dir/fallback/fbmex.cc" &&
+            ! grep -q "mwrap_h\|mexStub" "$split_dir/fallback/fbmex_1.cc"; then
+        pass "split (pass-through placement)"
+    else
+        fail "split (pass-through in the wrong files)"
+    fi
+else
+    fail "split (Python mwrap -split failed)"
+fi
+if (cd "$split_dir" && ! "$MWRAP_PY" -split 2 "$SCRIPT_DIR/test_split.mw" 2>/dev/null); then
+    pass "split (needs -c)"
+else
+    fail "split (accepted without -c)"
+fi
+if command -v mkoctfile >/dev/null 2>&1; then
+    if (cd "$split_dir" && mkoctfile --mex test_splitmex.cc test_splitmex_1.cc \
+            test_splitmex_2.cc >/dev/null 2>&1 &&
+            cd fallback && mkoctfile --mex fbmex.cc fbmex_1.cc fbmex_2.cc >/dev/null 2>&1); then
+        pass "split (link)"
+    else
+        fail "split (split files do not link)"
+    fi
+else
+    echo "  SKIP: split (link; no mkoctfile)"
+fi
+
+run_option_test binhandles \
+    "$SCRIPT_DIR/test_transfers.mw" .cc "mxWrapCreateH(out0_, 0x" \
+    -binhandles
+
+run_option_test registry \
+    "$SCRIPT_DIR/test_transfers.mw" .cc "mxWrapRetireH(prhs" \
+    -registry
+
+run_option_test intdims \
+    "$SCRIPT_DIR/test_transfers.mw" .cc "dim[0-9]*_ = mxWrapGetDim_(prhs" \
+    -intdims
+
+# vectorize: batched stubs are generated and the MATLAB stubs call
+# them through negative IDs; 'vectorize' stays usable as a name.
+vec_dir="$TMPDIR_BASE/vectorize_test"
+mkdir -p "$vec_dir"
+if (cd "$vec_dir" && "$MWRAP_PY" -mex vecmex -c vecmex.cc -m test_vectorize.m \
+        "$SCRIPT_DIR/test_vectorize.mw" 2>/dev/null); then
+    if grep -q "mwStubsB_\[-stub_id\]" "$vec_dir/vecmex.cc" &&
+            grep -q "^mex_id_ = -2;" "$vec_dir/test_vectorize.m" &&
+            grep -q "out0_ = vectorize(in0_)" "$vec_dir/vecmex.cc"; then
+        pass "vectorize (vecmex.cc)"
+    else
+        fail "vectorize (missing batched stubs)"
+    fi
+else
+    fail "vectorize (Python mwrap failed)"
+fi
+
+# -nd: 3-D arrays are rejected by default; with -nd, inputs are checked
+# in every dimension and outputs are created in their full shape.
+nd_dir="$TMPDIR_BASE/nd_test"
+mkdir -p "$nd_dir"
+cat > "$nd_dir/nd.mw" <<'EOF'
+# scale(output double[m,n,p] y, double[m,n,p] x, int m, int n, int p);
+# double[m,n,p] z = block(int m, int n, int p);
+EOF
+if (cd "$nd_dir" && ! "$MWRAP_PY" -mex ndmex -c ndmex.c nd.mw 2>/dev/null &&
+        "$MWRAP_PY" -nd -mex ndmex -c ndmex.c nd.mw 2>/dev/null); then
+    if grep -q "mxWrapDimN_(prhs\[0\], 2) != dim" "$nd_dir/ndmex.c" &&
+            grep -q "mxCreateNumericArray(3, shape_, mxDOUBLE_CLASS" "$nd_dir/ndmex.c" &&
+            grep -q "mxSetDimensions(plhs\[0\], shape_, 3)" "$nd_dir/ndmex.c"; then
+        pass "nd (ndmex.c)"
+    else
+        fail "nd (missing N-d checks or outputs)"
+    fi
+else
+    fail "nd (3-D arrays accepted without -nd or rejected with it)"
+fi
+
+run_option_test arena \
+    "$SCRIPT_DIR/test_transfers.mw" .cc "mwArenaRelease_(&mw_arena_)" \
+    -arena
+
+# hot: only the stubs of calls marked 'hot' keep their arena blocks;
+# 'hot' stays usable as a name.
+hot_dir="$TMPDIR_BASE/hot_test"
+mkdir -p "$hot_dir"
+cat > "$hot_dir/hot.mw" <<'EOF'
+# hot double s = total(int n, double[n] x);
+# hot vectorize double y = hot(double x);
+# double s = other(int n, int[n] x);
+EOF
+if (cd "$hot_dir" && "$MWRAP_PY" -arena -mex hotmex -c hotmex.c hot.mw 2>/dev/null); then
+    if [ "$(grep -c "mwArenaEnter_(&mw_arena_, 1)" "$hot_dir/hotmex.c")" = 2 ] &&
+            grep -q "mwArenaEnter_(&mw_arena_, 0)" "$hot_dir/hotmex.c" &&
+            grep -q "out0_ = hot(in0_)" "$hot_dir/hotmex.c" &&
+            ! grep -q "mxFree(in" "$hot_dir/hotmex.c"; then
+        pass "hot (hotmex.c)"
+    else
+        fail "hot (wrong arena modes)"
+    fi
+else
+    fail "hot (Python mwrap failed)"
+fi
+
+run_option_test threads \
+    "$SCRIPT_DIR/test_transfers.mw" .cc "mwThreadsCommand_(nlhs, plhs, nrhs, prhs)" \
+    -threads
+
+# threads with -split: the copiers and the pool live in the dispatch file,
+# which sees the mxWrapParallel hook through the shared header.
+threads_dir="$TMPDIR_BASE/threads_split"
+mkdir -p "$threads_dir"
+if (cd "$threads_dir" && "$MWRAP_PY" -threads -split 2 -mex tsmex -c tsmex.c \
+        "$SCRIPT_DIR/test_transfers.mw" 2>/dev/null); then
+    if grep -q "define mxWrapParallel(k, c, n) mwParallel_" "$threads_dir/tsmex_mwrap.h" &&
+            grep -q "^void mwParallel_(mxWrapKernel_t k" "$threads_dir/tsmex.c" &&
+            ! grep -q "mwParallel_" "$threads_dir/tsmex_1.c" "$threads_dir/tsmex_2.c"; then
+        pass "threads (split output)"
+    else
+        fail "threads (pool not in the dispatch file)"
+    fi
+else
+    fail "threads (Python mwrap -split failed)"
+fi
+
+# sparse: inputs point at the CSC arrays of prhs, outputs are created
+# with mxCreateSparse before the call; misdeclared sparse is rejected.
+sparse_dir="$TMPDIR_BASE/sparse_test"
+mkdir -p "$sparse_dir"
+cat > "$sparse_dir/sparse.mw" <<'EOF'
+# spmv(sparse A, double[] x, output double[m] y, int m);
+# laplace(int n, output sparse[n, n, nz] K);
+EOF
+cat > "$sparse_dir/sparse_bad.mw" <<'EOF'
+# sparse K = f1(int n);
+# f2(sparse[m,n,nz] A);
+# f3(inout sparse A);
+# f4(output sparse K);
+EOF
+if (cd "$sparse_dir" && "$MWRAP_PY" -mex spmex -c spmex.c sparse.mw 2>/dev/null); then
+    if grep -q "mxWrapGetSparse(&in0_, prhs\[0\], &mw_err_txt_)" "$sparse_dir/spmex.c" &&
+            grep -q "plhs\[0\] = mxWrapCreateSparse(&out0_, dim1_, dim2_, dim3_)" "$sparse_dir/spmex.c" &&
+            grep -q "laplace(in0_, &out0_)" "$sparse_dir/spmex.c" &&
+            [ "$(cd "$sparse_dir" && "$MWRAP_PY" -c bad.c sparse_bad.mw 2>&1 |
+                 grep -c "^Error")" = 4 ]; then
+        pass "sparse (spmex.c)"
+    else
+        fail "sparse (wrong sparse stubs or checks)"
+    fi
+else
+    fail "sparse (Python mwrap failed)"
+fi
+
+# -cache: a second run must replay identical output without
+# rewriting the unchanged files.
+cache_dir="$TMPDIR_BASE/cache_test"
+mkdir -p "$cache_dir"
+cp "$SCRIPT_DIR/test_include2.mw" "$cache_dir/"
+cache_args=(-cache "$cache_dir/cache" -mex cachemex -c cachemex.cc -m cache.m
+            "$SCRIPT_DIR/test_include.mw")
+if (cd "$cache_dir" && "$MWRAP_PY" "${cache_args[@]}" 2>/dev/null &&
+        cp cachemex.cc first.cc && touch -t 200001010000 cachemex.cc &&
+        "$MWRAP_PY" "${cache_args[@]}" 2>/dev/null); then
+    if diff -u "$cache_dir/first.cc" "$cache_dir/cachemex.cc" >/dev/null 2>&1 &&
+            [ -z "$(find "$cache_dir/cachemex.cc" -newer "$cache_dir/first.cc")" ]; then
+        pass "cache (cachemex.cc)"
+    else
+        fail "cache (cachemex.cc differs or was rewritten)"
+    fi
+else
+    fail "cache (Python mwrap failed)"
+fi
+# A run that stops on an error still writes what it generated, as a
+# run without -cache does, and leaves no cache entry behind.  main() is
+# called in-process, as by a server, so nothing is flushed at exit.
+printf 'function a\n# double y = f(double x);\n@include no_such_file.mw\n' \
+    > "$cache_dir/broken.mw"
+(cd "$cache_dir" && "$MWRAP_PY" -m plain.m broken.mw 2>/dev/null) || true
+if (cd "$cache_dir" && python3 - "$MWRAP_PY" <<'PYEOF'
+import importlib.machinery
+import importlib.util
+import sys
+
+loader = importlib.machinery.SourceFileLoader("mwrap", sys.argv[1])
+mwrap = importlib.util.module_from_spec(
+    importlib.util.spec_from_loader("mwrap", loader))
+loader.exec_module(mwrap)
+stdout, stderr = sys.stdout, sys.stderr
+for _ in range(2):
+    try:
+        mwrap.main(["-cache", "broken_cache", "-m", "broken.m", "broken.mw"])
+    except SystemExit as e:
+        assert e.code == 1
+    else:
+        raise AssertionError("run did not fail")
+    assert sys.stdout is stdout and sys.stderr is stderr
+with open("plain.m") as f, open("broken.m") as g:
+    assert f.read() == g.read() != ""
+PYEOF
+) 2>/dev/null; then
+    pass "cache (error run)"
+else
+    fail "cache (error run lost its output or was cached)"
+fi
+
+# -j: parsing the inputs in a process pool must not change any output.
+jobs_dir="$TMPDIR_BASE/jobs_test"
+mkdir -p "$jobs_dir/serial" "$jobs_dir/pool"
+cp "$SCRIPT_DIR/test_include2.mw" "$jobs_dir/serial/"
+cp "$SCRIPT_DIR/test_include2.mw" "$jobs_dir/pool/"
+jobs_args=(-cppcomplex -mex jobsmex -c jobsmex.cc -m jobs.m "$SCRIPT_DIR/test_transfers.mw"
+           "$SCRIPT_DIR/test_include.mw" "$SCRIPT_DIR/test_single.mw")
+if (cd "$jobs_dir/serial" && "$MWRAP_PY" "${jobs_args[@]}" 2>/dev/null) &&
+        (cd "$jobs_dir/pool" && "$MWRAP_PY" -j 2 "${jobs_args[@]}" 2>/dev/null); then
+    if diff -u "$jobs_dir/serial/jobsmex.cc" "$jobs_dir/pool/jobsmex.cc" >/dev/null 2>&1 &&
+            diff -u "$jobs_dir/serial/jobs.m" "$jobs_dir/pool/jobs.m" >/dev/null 2>&1; then
+        pass "jobs (jobsmex.cc, jobs.m)"
+    else
+        fail "jobs (-j 2 output differs from serial)"
+    fi
+else
+    fail "jobs (Python mwrap failed)"
+fi
+# An unreadable input is skipped without disturbing the pool
+(cd "$jobs_dir/pool" && "$MWRAP_PY" -j 2 -cppcomplex -mex jobsmex -c jobsmex.cc \
+    "$SCRIPT_DIR/test_transfers.mw" no_such_file.mw "$SCRIPT_DIR/test_include.mw" \
+    2>"$jobs_dir/unreadable.err")
+if [ "$(cat "$jobs_dir/unreadable.err")" = "Could not read no_such_file.mw" ]; then
+    pass "jobs (unreadable input)"
+else
+    fail "jobs (unreadable input: $(head -1 "$jobs_dir/unreadable.err"))"
+fi
+
+# -server: runs forwarded through MWRAP_SERVER, the second from the
+# server's parse cache, must match a local run.  The forwarding client
+# has no generator modules, so it fails unless the server answers.
+server_dir="$TMPDIR_BASE/server_test"
+server_sock="$server_dir/mwrap.sock"
+mkdir -p "$server_dir/local" "$server_dir/remote" "$server_dir/client"
+cp "$MWRAP_PY" "$server_dir/client/mwrap"
+cp "$(dirname "$MWRAP_PY")/mwrap_server.py" "$server_dir/client/"
+cp "$SCRIPT_DIR/test_include2.mw" "$server_dir/local/"
+cp "$SCRIPT_DIR/test_include2.mw" "$server_dir/remote/"
+server_args=(-cppcomplex -mex servermex -c servermex.cc -m server.m
+             "$SCRIPT_DIR/test_transfers.mw" "$SCRIPT_DIR/test_include.mw")
+"$MWRAP_PY" -server "$server_sock" 2>/dev/null &
+server_pid=$!
+for _ in $(seq 50); do
+    [ -S "$server_sock" ] && break
+    sleep 0.1
+done
+if [ -S "$server_sock" ] &&
+        (cd "$server_dir/local" && "$MWRAP_PY" "${server_args[@]}" 2>/dev/null) &&
+        (cd "$server_dir/remote" &&
+         MWRAP_SERVER="$server_sock" "$server_dir/client/mwrap" "${server_args[@]}" 2>/dev/null &&
+         rm servermex.cc server.m &&
+         MWRAP_SERVER="$server_sock" "$server_dir/client/mwrap" "${server_args[@]}" 2>/dev/null); then
+    if diff -r "$server_dir/local" "$server_dir/remote" >/dev/null 2>&1; then
+        pass "server (servermex.cc, server.m)"
+    else
+        fail "server (forwarded output differs from local)"
+    fi
+else
+    fail "server (Python mwrap failed)"
+fi
+kill "$server_pid" 2>/dev/null
+wait "$server_pid" 2>/dev/null || true
+
+# -server must not remove a path that is not a socket
+echo keep > "$server_dir/keep.mw"
+if ! "$MWRAP_PY" -server "$server_dir/keep.mw" 2>"$server_dir/keep.err" &&
+        grep -q "Could not listen" "$server_dir/keep.err" &&
+        [ "$(cat "$server_dir/keep.mw")" = keep ]; then
+    pass "server (keeps a regular file)"
+else
+    fail "server (replaced a regular file)"
+fi
+
+# Large $[ ... $] blocks are copied in chunks: the C output must hold the
+# block verbatim, and line numbers after it must still be right.
+block_dir="$TMPDIR_BASE/block_test"
+mkdir -p "$block_dir"
+python3 - "$block_dir/block.mw" <<'PYEOF'
+import sys
+body = "".join(f"static int block_{i}(int x) {{ return x + {i}; }}\n"
+               for i in range(20000))
+with open(sys.argv[1], "w") as f:
+    f.write("$[\n" + body + "$]\n# double y = ok(double x);\n# broken(\n\n")
+with open(sys.argv[1] + ".body", "w") as f:
+    f.write(body)
+PYEOF
+(cd "$block_dir" && "$MWRAP_PY" -mex blockmex -c blockmex.c block.mw \
+     >/dev/null 2>block.err) || true
+if python3 -c 'import sys
+body = open(sys.argv[1] + ".body").read()
+out = open(sys.argv[2]).read()
+assert body in out' "$block_dir/block.mw" "$block_dir/blockmex.c" 2>/dev/null &&
+        grep -q "block.mw:20005)" "$block_dir/block.err"; then
+    pass "block (blockmex.c)"
+else
+    fail "block (block text or line numbers wrong)"
+fi
+
+# Lexer.lex_bytes on a memory map must give the same tokens and output
+# text as lex_file.
+if (cd "$SCRIPT_DIR" && python3 - "$(dirname "$MWRAP_PY")" *.mw <<'PYEOF'
+import io, mmap, sys
+sys.path.insert(0, sys.argv[1])
+from mwrap_lexer import Lexer
+
+def lex(name, use_map):
+    m, c = io.StringIO(), io.StringIO()
+    lexer = Lexer(outfp=m, outcfp=c)
+    if not use_map:
+        return list(lexer.lex_file(name)), m.getvalue(), c.getvalue()
+    with open(name, "rb") as f, \
+         mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return list(lexer.lex_bytes(data, name)), m.getvalue(), c.getvalue()
+
+for name in sys.argv[2:]:
+    assert lex(name, False) == lex(name, True), name
+PYEOF
+); then
+    pass "lex_bytes (same tokens as lex_file)"
+else
+    fail "lex_bytes (tokens differ from lex_file)"
+fi
+
+# -list start-up budget: configure steps run -list on every build, so it
+# must not load the C generator or the cache, and the whole process
+# (interpreter start-up included, best of three) must stay under budget.
+list_budget_ms="${MWRAP_LIST_BUDGET_MS:-250}"
+list_imports=$(cd "$SCRIPT_DIR" &&
+               python3 -X importtime "$MWRAP_PY" -list test_include.mw 2>&1 >/dev/null |
+               grep -o 'mwrap_[a-z]*' | sort -u | tr '\n' ' ')
+list_best=$(cd "$SCRIPT_DIR" && python3 -c '
+import subprocess, sys, time
+best = None
+for _ in range(3):
+    start = time.perf_counter()
+    subprocess.run(sys.argv[1:], stdout=subprocess.DEVNULL, check=True)
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min(best, elapsed)
+print(f"{best * 1e3:.1f}")' "$MWRAP_PY" -list test_include.mw 2>/dev/null)
+case " $list_imports" in
+    *" mwrap_cgen "*|*" mwrap_cache "*|*" mwrap_parallel "*|*" mwrap_server "*)
+        fail "list startup (imports: $list_imports)" ;;
+    *)
+        if [ -n "$list_best" ] &&
+                awk -v t="$list_best" -v b="$list_budget_ms" 'BEGIN { exit !(t < b) }'; then
+            pass "list startup (${list_best} ms < ${list_budget_ms} ms)"
+        else
+            fail "list startup (${list_best:-no timing} ms, budget ${list_budget_ms} ms)"
+        fi ;;
+esac
+
+# Generator benchmark: a small synthetic run must typecheck cleanly
+# and report every stage.
+bench_json="$TMPDIR_BASE/bench.json"
+if python3 "$(dirname "$MWRAP_PY")/mwrap_bench.py" -funcs 50 -classes 5 \
+        -typedefs 5 -block 5 -includes 2 -repeat 1 -o "$bench_json" 2>/dev/null &&
+        python3 -c 'import json, sys
+r = json.load(open(sys.argv[1]))["result"]
+assert set(r["stages"]) == {"lex", "parse", "typecheck", "cgen"}
+assert r["funcs"] > 0' "$bench_json"; then
+    pass "bench (bench.json)"
+else
+    fail "bench (mwrap_bench.py failed)"
+fi
+
 # ----------------------------------------------------------------
 # Summary
 # ----------------------------------------------------------------